@@ -1,15 +1,9 @@
 import streamlit as st #pip install streamlit
-import requests
-import os
-import queue
-import io
-import time
 #from PIL import Image
 #import PIL.Image
-from streamlit.runtime.scriptrunner import get_script_run_ctx #for multi-threading in streamlit
-from streamlit.runtime.scriptrunner import add_script_run_ctx #for multi-threading in streamlit
-from google import genai
-import threading
+from backend.clients import pool_stats
+from backend.cache import edit_image_cache, generate_content_cache, generate_images_cache
+from backend import drafts, gemini, ingest, jobs, metrics, previews, ratelimit, singleflight, ui, uploads, vto, warmup
 
 #keyload()
 
@@ -25,3 +19,45 @@ with st.container(border=False):
                 #### 3) A full implementation can use grounding and custom trained models.""")
     #current_folder = os.path.basename(os.getcwd())
     st.markdown(f"Last update: 08.08.2025")
+
+# Shared backend state (one per process, shared by every session)
+ui.page_setup("home")
+
+with st.expander("Backend status"):
+    if metrics.endpoint():
+        st.markdown(f"**Prometheus metrics:** `{metrics.endpoint()}`")
+    elif metrics.server_error:
+        st.caption(f"Metrics endpoint not started: {metrics.server_error}")
+    if warmup.last_report:
+        st.markdown("**Pre-warm (before serving)**")
+        st.json(warmup.last_report)
+    st.markdown("**Client pool**")
+    st.json(pool_stats())
+    st.markdown("**Rate limits (per model)**")
+    st.json(ratelimit.stats())
+    st.markdown("**Coalesced in-flight calls**")
+    st.json(singleflight.stats())
+    st.markdown("**generate_images cache**")
+    st.json(generate_images_cache.stats())
+    st.markdown("**edit_image cache**")
+    st.json(edit_image_cache.stats())
+    st.markdown("**generate_content cache (Gemini)**")
+    st.json(generate_content_cache.stats())
+    st.markdown("**Gemini streaming (time to first token / total)**")
+    st.json(gemini.stream_stats())
+    st.markdown("**Virtual try-on tiers (preview / refine latency)**")
+    st.json(vto.tier_stats())
+    st.markdown("**Virtual try-on matrix (packed calls, short responses re-sent per pair)**")
+    st.json(vto.matrix_stats())
+    st.markdown("**Draft / final tiers (latency, estimated spend)**")
+    st.json(drafts.stats())
+    st.markdown("**Background jobs**")
+    st.json(jobs.stats())
+    st.markdown("**Upload ingestion**")
+    st.json(ingest.stats())
+    st.markdown("**Upload registry**")
+    st.json(uploads.stats())
+    st.markdown("**Display previews**")
+    st.json(previews.stats())
+
+ui.page_end()
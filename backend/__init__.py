@@ -0,0 +1,6 @@
+"""Shared backend for the Media Studio pages.
+
+Streamlit re-executes every page script on each widget interaction, but the
+modules a page imports are only loaded once per process. Anything that should
+outlive a single rerun (clients, caches, pools) lives in this package.
+"""
@@ -0,0 +1,41 @@
+"""Background replacement request, shared by the Background Editor page and the batch CLI."""
+import os
+
+from backend.sdk import types
+
+EDIT_MODEL = "imagen-3.0-capability-001"
+
+# Drafts (see backend.drafts): fewer diffusion steps on a downsized source, returned as JPEG.
+# There is no cheaper bgswap model, so drafts mostly save time; the final re-render is per-image priced as usual.
+DRAFT_MODEL = os.environ.get("MEDIA_STUDIO_BG_DRAFT_MODEL", EDIT_MODEL)
+DRAFT_STEPS = int(os.environ.get("MEDIA_STUDIO_BG_DRAFT_STEPS", "16"))
+DRAFT_MAX_EDGE = int(os.environ.get("MEDIA_STUDIO_BG_DRAFT_MAX_EDGE", "512"))
+
+
+def bgswap_reference_images(image_bytes):
+    """Raw image + automatic background mask, as expected by EDIT_MODE_BGSWAP."""
+    raw_ref_image = types.RawReferenceImage(
+        reference_image=types.Image(image_bytes=image_bytes),
+        reference_id=0
+    )
+    mask_ref_image = types.MaskReferenceImage(
+        reference_id=1,
+        reference_image=None, # No explicit mask needed for MASK_MODE_BACKGROUND
+        config=types.MaskReferenceConfig(mask_mode="MASK_MODE_BACKGROUND"),
+    )
+    return [raw_ref_image, mask_ref_image]
+
+
+def bgswap_config(number_of_images=4, seed=42, base_steps=None, output_mime_type=None):
+    # base_steps / output_mime_type are only set for drafts; left as None they're
+    # dropped from cache keys, so existing entries stay valid.
+    return types.EditImageConfig(
+        edit_mode="EDIT_MODE_BGSWAP",
+        number_of_images=number_of_images,
+        # aspect_ratio="1:1", # Optional: "16:9", "ORIGINAL"
+        seed=seed, # Optional: for reproducibility, or None for variety
+        safety_filter_level=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+        person_generation="ALLOW_ADULT",
+        base_steps=base_steps,
+        output_mime_type=output_mime_type,
+    )
@@ -0,0 +1,199 @@
+"""Headless batch background replacement.
+
+Runs the Background Editor request (RawReferenceImage + MaskReferenceImage,
+MASK_MODE_BACKGROUND, EDIT_MODE_BGSWAP) over a whole directory or manifest of
+SKU images with bounded concurrency.
+
+    python -m backend.batch_background --input shots/ --prompt "A white studio backdrop" --out out/
+    python -m backend.batch_background --input manifest.csv --out out/ --concurrency 16
+    python -m backend.batch_background --input manifest.jsonl --out out/ --fake
+
+A manifest (CSV with a header row, or JSONL) has one row per image with an
+``image`` path (relative to the manifest), an optional ``prompt`` (falls back
+to ``--prompt``) and an optional ``id``. Every finished row is appended to
+``<out>/results.jsonl``; re-running the same command skips rows that already
+succeeded, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import contextvars
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from backend import background, imagen, metrics
+from backend.ingest import ingest_upload
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+RESULTS_FILE = "results.jsonl"
+
+
+# --- Input ---
+def read_rows(input_path, default_prompt):
+    """Returns [{"id", "image", "prompt"}, ...] from a directory, CSV or JSONL manifest."""
+    if os.path.isdir(input_path):
+        rows = []
+        for dirpath, _, filenames in os.walk(input_path):
+            for name in sorted(filenames):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(dirpath, name)
+                    rows.append({"id": os.path.relpath(path, input_path), "image": path, "prompt": default_prompt})
+        return sorted(rows, key=lambda r: r["id"])
+
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    with open(input_path, newline="") as f:
+        if input_path.lower().endswith(".jsonl"):
+            raw_rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            raw_rows = list(csv.DictReader(f))
+
+    rows = []
+    for n, raw in enumerate(raw_rows, start=1):
+        if not raw.get("image"):
+            raise ValueError(f"{input_path}: row {n} has no 'image' column")
+        rows.append({
+            "id": raw.get("id") or raw["image"],
+            "image": os.path.join(base_dir, raw["image"]),
+            "prompt": raw.get("prompt") or default_prompt,
+        })
+    return rows
+
+
+def load_finished_ids(out_dir):
+    """Ids that already succeeded in a previous run (for resume)."""
+    finished = set()
+    path = os.path.join(out_dir, RESULTS_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from an interrupted run
+                if result.get("status") == "ok":
+                    finished.add(result["id"])
+    return finished
+
+
+# --- Work ---
+def output_stem(row_id):
+    """File name stem for ``row_id``'s outputs.
+
+    The readable part keeps the extension (``shoe.jpg`` and ``shoe.png`` differ)
+    and a short hash of the full id tells apart ids that only differ in
+    characters mapped to ``_`` (``a/b.png`` and ``a_b.png``).
+    """
+    readable = "".join(c if c.isalnum() or c in "-_." else "_" for c in row_id)
+    return f"{readable}-{hashlib.sha256(row_id.encode('utf-8')).hexdigest()[:8]}"
+
+
+def check_output_stems(rows):
+    """Raises ValueError if two rows would write (and resume) to the same outputs."""
+    seen = {}
+    for row in rows:
+        stem = output_stem(row["id"])
+        if stem in seen:
+            raise ValueError(f"rows {seen[stem]!r} and {row['id']!r} map to the same output name {stem!r}; "
+                             "give them distinct ids")
+        seen[stem] = row["id"]
+
+
+def process_row(client, row, out_dir, number_of_images, seed):
+    started = time.perf_counter()
+    result = {"id": row["id"], "image": row["image"], "prompt": row["prompt"]}
+    try:
+        if not row["prompt"]:
+            raise ValueError("no background prompt for this row (set one in the manifest or pass --prompt)")
+        with open(row["image"], "rb") as f:
+            image_bytes = ingest_upload(f.read(), background.EDIT_MODEL).data
+        response, from_cache = imagen.edit_image(
+            client,
+            model=background.EDIT_MODEL,
+            prompt=row["prompt"],
+            reference_images=background.bgswap_reference_images(image_bytes),
+            config=background.bgswap_config(number_of_images=number_of_images, seed=seed),
+        )
+        outputs = []
+        for i, generated in enumerate(response.generated_images or []):
+            if generated.image is None or not generated.image.image_bytes:
+                continue  # filtered by safety settings
+            out_path = os.path.join(out_dir, f"{output_stem(row['id'])}_{i+1}.png")
+            with open(out_path, "wb") as f:
+                f.write(generated.image.image_bytes)
+            outputs.append(os.path.relpath(out_path, out_dir))
+        if not outputs:
+            raise ValueError("the API did not return any generated images")
+        result.update(status="ok", outputs=outputs, from_cache=from_cache)
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run(client, rows, out_dir, concurrency=8, number_of_images=1, seed=42, log=sys.stderr):
+    """Processes ``rows`` and appends one result line per row. Returns a summary dict."""
+    check_output_stems(rows)
+    os.makedirs(out_dir, exist_ok=True)
+    finished = load_finished_ids(out_dir)
+    todo = [row for row in rows if row["id"] not in finished]
+    summary = {"total": len(rows), "skipped": len(rows) - len(todo), "ok": 0, "error": 0}
+    print(f"{len(rows)} rows, {summary['skipped']} already done, {len(todo)} to process", file=log)
+
+    write_lock = threading.Lock()
+    started = time.perf_counter()
+    with open(os.path.join(out_dir, RESULTS_FILE), "a") as results_file, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, process_row, client, row, out_dir, number_of_images, seed)
+            for row in todo
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            with write_lock:
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+            summary[result["status"]] += 1
+            if result["status"] == "error":
+                print(f"  {result['id']}: {result['error']}", file=log)
+            if done % 50 == 0 or done == len(todo):
+                rate = done / (time.perf_counter() - started)
+                print(f"{done}/{len(todo)} done ({summary['error']} errors, {rate:.1f} img/s)", file=log)
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--input", required=True, help="Directory of images, or a .csv / .jsonl manifest")
+    parser.add_argument("--out", required=True, help="Output directory (also holds results.jsonl)")
+    parser.add_argument("--prompt", default="", help="Background prompt for rows that don't set one")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--number-of-images", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42, help="Fixed seed keeps results reproducible and cacheable")
+    parser.add_argument("--project", default=os.environ.get("GOOGLE_CLOUD_PROJECT"))
+    parser.add_argument("--location", default=os.environ.get("GOOGLE_CLOUD_REGION", "us-central1"))
+    parser.add_argument("--fake", action="store_true", help="Use the local fake client (no network)")
+    args = parser.parse_args(argv)
+
+    if args.fake:
+        from backend.fakes import FakeGenAIClient
+        client = FakeGenAIClient()
+    else:
+        if not args.project:
+            parser.error("--project (or GOOGLE_CLOUD_PROJECT) is required unless --fake is set")
+        from backend.clients import get_genai_client
+        client = get_genai_client(args.project, args.location, family="imagen")
+
+    metrics.set_page("batch_background")
+    rows = read_rows(args.input, args.prompt)
+    summary = run(client, rows, args.out, args.concurrency, args.number_of_images, args.seed)
+    print(json.dumps(summary))
+    return 0 if summary["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""Offline benchmark of the pages' request pipelines.
+
+Drives what each page does per click (fan-out model calls, decoding, preview
+rendering, keeping results in the blob store) from N concurrent simulated
+sessions against the fake backend, and reports throughput, p50/p95/p99
+latency and memory per pipeline.
+
+    python -m backend.bench
+    python -m backend.bench --sessions 16 --requests 5 --pipelines logo,product,vto
+    python -m backend.bench --profile realistic --time-scale 0.05 --json bench.json
+    python -m backend.bench --replay fixtures/       # recorded responses (see backend.fakes)
+
+Every session sends its own prompts, so nothing is served from the cache or
+coalesced; ``--shared-inputs`` makes all sessions send the same requests to
+measure exactly that. The cache and blob store live in a temporary directory,
+the metrics endpoint is off and rate limits are lifted (unless
+``MEDIA_STUDIO_RATE_LIMITS`` is set), so only the pipeline itself is measured.
+"""
+import os
+import tempfile
+
+GENERATE_MODEL = "imagen-4.0-generate-preview-06-06"
+EDIT_MODEL = "imagen-3.0-capability-001"
+LANG_MODEL = "gemini-2.0-flash"
+VTO_MODEL = "virtual-try-on-exp-05-31"
+
+# Read by the backend modules at import time, so set before importing them.
+os.environ.setdefault("MEDIA_STUDIO_CACHE_DIR", tempfile.mkdtemp(prefix="media_studio_bench_"))
+os.environ.setdefault("MEDIA_STUDIO_METRICS_PORT", "0")
+os.environ.setdefault("MEDIA_STUDIO_RATE_LIMIT_DEFAULT", "1000000")
+os.environ.setdefault("MEDIA_STUDIO_RATE_LIMITS", ",".join(
+    f"{model}=1000000" for model in (GENERATE_MODEL, EDIT_MODEL, LANG_MODEL, VTO_MODEL)
+))
+
+import argparse
+import io
+import json
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import replace
+
+from google.genai import types
+
+from backend import background, fakes, fanout, gemini, imagen, metrics, previews, uploads, vto
+from backend.ingest import ingest_upload
+
+VARIATIONS = 4
+
+
+def percentile(values, q):
+    """``q``-th percentile (0-100) of ``values`` with linear interpolation; None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(seconds):
+    return {
+        "p50": _round(percentile(seconds, 50)),
+        "p95": _round(percentile(seconds, 95)),
+        "p99": _round(percentile(seconds, 99)),
+        "max": _round(max(seconds)) if seconds else None,
+    }
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+def _upload_jpeg(size=(2000, 1500)):
+    """Synthetic camera-sized JPEG, like what associates upload."""
+    from PIL import Image as PILImage
+    img = PILImage.frombytes("RGB", (size[0] // 4, size[1] // 4), os.urandom(size[0] * size[1] * 3 // 16))
+    buf = io.BytesIO()
+    img.resize(size).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+# --- Pipelines (one page click each) ---
+class Session:
+    """Clients and inputs shared by one simulated session."""
+
+    def __init__(self, index, genai_client, prediction_client, upload, shared_inputs):
+        self.index = index
+        self.id = f"bench-{index}"
+        self.genai_client = genai_client
+        self.prediction_client = prediction_client
+        self.upload = upload
+        self.shared_inputs = shared_inputs
+
+    def tag(self, request):
+        return "shared" if self.shared_inputs else f"session {self.index} request {request}"
+
+
+def _keep_outputs(session, slot, call_variation, count):
+    """Fans out like ``ui.show_variations_progressively``: decode, preview and keep each image."""
+    images, errors, handles = 0, 0, []
+    for i, result, error in fanout.iter_variations(call_variation, count):
+        if error is not None:
+            errors += 1
+            continue
+        response, _ = result
+        data = imagen.image_bytes_of(response.generated_images[0]) if response.generated_images else None
+        if not data:
+            errors += 1
+            continue
+        previews.preview_bytes(data)
+        handles.append(uploads.register(session.id, f"{slot}/{i}", data, mime_type="image/png"))
+        images += 1
+    for handle in handles:
+        uploads.release(handle)
+    return images, errors
+
+
+def _keep_upload(session, slot, model, **ingest_options):
+    ingested = ingest_upload(session.upload, model, **ingest_options)
+    return uploads.register(session.id, slot, ingested.data, original_bytes=len(session.upload), mime_type=ingested.mime_type)
+
+
+def _generate_pipeline(prompt):
+    def run(session, request):
+        text = prompt.format(tag=session.tag(request))
+        config = types.GenerateImagesConfig(number_of_images=VARIATIONS)
+
+        def call_variation(i):
+            return imagen.generate_images(session.genai_client, GENERATE_MODEL, text,
+                                          imagen.variation_config(config, i), variation=i)
+
+        return _keep_outputs(session, "result", call_variation, VARIATIONS)
+
+    return run
+
+
+def _bg_edit(session, request):
+    handle = _keep_upload(session, "bg_edit_image", background.EDIT_MODEL)
+    references = background.bgswap_reference_images(uploads.get_bytes(handle))
+    config = background.bgswap_config(number_of_images=VARIATIONS)
+    prompt = f"A white studio backdrop ({session.tag(request)})"
+
+    def call_variation(i):
+        return imagen.edit_image(session.genai_client, background.EDIT_MODEL, prompt, references,
+                                 imagen.variation_config(config, i))
+
+    try:
+        return _keep_outputs(session, "result", call_variation, VARIATIONS)
+    finally:
+        uploads.release(handle)
+
+
+def _transpose(session, request):
+    subject = _keep_upload(session, "subject_img", EDIT_MODEL)
+    design = _keep_upload(session, "cannyedge_img", EDIT_MODEL, image_format="PNG")
+    subject_image = types.Image(image_bytes=uploads.get_bytes(subject))
+    design_image = types.Image(image_bytes=uploads.get_bytes(design))
+    references = [
+        types.SubjectReferenceImage(reference_id=1, reference_image=subject_image, config=types.SubjectReferenceConfig(
+            subject_description="a t-shirt", subject_type="SUBJECT_TYPE_PRODUCT")),
+        types.ControlReferenceImage(reference_id=2, reference_image=subject_image,
+                                    config=types.ControlReferenceConfig(control_type="CONTROL_TYPE_CANNY")),
+        types.ControlReferenceImage(reference_id=4, reference_image=design_image,
+                                    config=types.ControlReferenceConfig(control_type="CONTROL_TYPE_CANNY")),
+    ]
+    config = types.EditImageConfig(edit_mode="EDIT_MODE_DEFAULT", number_of_images=VARIATIONS, seed=1,
+                                   safety_filter_level="BLOCK_MEDIUM_AND_ABOVE")
+    prompt = f"The design printed on [1] ({session.tag(request)})"
+
+    def call_variation(i):
+        return imagen.edit_image(session.genai_client, EDIT_MODEL, prompt, references, imagen.variation_config(config, i))
+
+    try:
+        return _keep_outputs(session, "result", call_variation, VARIATIONS)
+    finally:
+        uploads.release(subject)
+        uploads.release(design)
+
+
+def _product(session, request):
+    handle = _keep_upload(session, "subject_ref_0", EDIT_MODEL)
+    data = uploads.get_bytes(handle)
+    prompt, _ = gemini.generate_text(
+        session.genai_client, LANG_MODEL,
+        [types.Part(text=f"A lifestyle shot of [1] on a marble countertop ({session.tag(request)})"),
+         types.Part.from_bytes(data=data, mime_type=handle.mime_type)],
+        config=types.GenerateContentConfig(system_instruction="Write an Imagen prompt that uses [1] for the product."),
+    )
+    references = [types.SubjectReferenceImage(
+        reference_id=1, reference_image=types.Image(image_bytes=data),
+        config=types.SubjectReferenceConfig(subject_description="the uploaded product", subject_type="SUBJECT_TYPE_PRODUCT"),
+    )]
+    config = types.EditImageConfig(edit_mode="EDIT_MODE_DEFAULT", number_of_images=VARIATIONS)
+
+    def call_variation(i):
+        return imagen.edit_image(session.genai_client, EDIT_MODEL, prompt, references,
+                                 imagen.variation_config(config, i), variation=i)
+
+    try:
+        return _keep_outputs(session, "result", call_variation, VARIATIONS)
+    finally:
+        uploads.release(handle)
+
+
+def _vto(session, request):
+    person = _keep_upload(session, "vto_model", VTO_MODEL)
+    product = _keep_upload(session, "vto_prod", VTO_MODEL)
+    try:
+        parameters = vto.build_parameters(sample_count=1, base_steps=25)
+        instances = [vto.build_instance(vto.encode_image(uploads.get_view(person)), vto.encode_image(uploads.get_view(product)))]
+        response = vto.predict(session.prediction_client, vto.model_endpoint("bench", "us-central1"), instances, parameters)
+        images = failed = 0
+        for n, decoded, error in vto.decode_predictions(response.predictions, preview_edge=previews.PREVIEW_MAX_EDGE):
+            if error is not None:
+                failed += 1
+                continue
+            uploads.release(uploads.register(session.id, f"result/{n}", decoded.data, mime_type=decoded.mime_type))
+            images += 1
+        return images, failed
+    finally:
+        uploads.release(person)
+        uploads.release(product)
+
+
+PIPELINES = {
+    "logo": _generate_pipeline("A minimalist logo for a coffee shop ({tag})"),
+    "card": _generate_pipeline("A birthday greeting card with balloons ({tag})"),
+    "moodboard": _generate_pipeline("A fall fashion moodboard ({tag})"),
+    "bg_edit": _bg_edit,
+    "transpose": _transpose,
+    "product": _product,
+    "vto": _vto,
+}
+
+
+# --- Running ---
+def run(pipelines, sessions, requests, genai_client, prediction_client, shared_inputs=False, trace_memory=False):
+    """Runs every pipeline in turn with ``sessions`` concurrent sessions sending ``requests`` each.
+
+    Returns the report dict (also what ``--json`` writes).
+    """
+    # Sessions upload their own photo unless they all send the same requests.
+    shared_upload = _upload_jpeg()
+    session_uploads = [shared_upload if shared_inputs else _upload_jpeg() for _ in range(sessions)]
+    report = {"sessions": sessions, "requests_per_session": requests, "shared_inputs": shared_inputs, "pipelines": {}}
+    if trace_memory:
+        tracemalloc.start()
+    for name in pipelines:
+        pipeline = PIPELINES[name]
+        samples, lock = [], threading.Lock()  # (seconds, images, errors, failed)
+
+        def session_loop(index):
+            session = Session(index, genai_client, prediction_client, session_uploads[index], shared_inputs)
+            with metrics.page_scope(name):
+                for request in range(requests):
+                    started = time.perf_counter()
+                    try:
+                        images, errors = pipeline(session, request)
+                        failed = images == 0
+                    except Exception:
+                        images, errors, failed = 0, 1, True
+                    with lock:
+                        samples.append((time.perf_counter() - started, images, errors, failed))
+
+        if trace_memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        threads = [threading.Thread(target=session_loop, args=(i,), name=f"bench-session-{i}") for i in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        seconds = [s for s, _, _, failed in samples if not failed]
+        result = {
+            "requests": len(samples),
+            "failed_requests": sum(1 for *_, failed in samples if failed),
+            "failed_calls": sum(errors for _, _, errors, _ in samples),
+            "images": sum(images for _, images, _, _ in samples),
+            "wall_seconds": _round(wall),
+            "requests_per_second": _round(len(samples) / wall if wall else None),
+            "images_per_second": _round(sum(images for _, images, _, _ in samples) / wall if wall else None),
+            "latency_seconds": latency_summary(seconds),
+        }
+        if trace_memory:
+            result["python_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        report["pipelines"][name] = result
+    if trace_memory:
+        tracemalloc.stop()
+    # ru_maxrss is in KiB on Linux (bytes on macOS).
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report["max_rss_mb"] = round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    report["uploads"] = uploads.stats()
+    return report
+
+
+def print_report(report, out=sys.stdout):
+    print(f"{report['sessions']} sessions x {report['requests_per_session']} requests"
+          + (" (shared inputs)" if report["shared_inputs"] else ""), file=out)
+    print(f"{'pipeline':<10} {'req/s':>7} {'img/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'failed':>7}", file=out)
+    for name, result in report["pipelines"].items():
+        latency = result["latency_seconds"]
+        cells = [f"{latency[q]:.3f}" if latency[q] is not None else "-" for q in ("p50", "p95", "p99")]
+        print(f"{name:<10} {result['requests_per_second']:>7.2f} {result['images_per_second']:>7.2f} "
+              f"{cells[0]:>7} {cells[1]:>7} {cells[2]:>7} {result['failed_requests']:>7}", file=out)
+    print(f"max RSS {report['max_rss_mb']} MB", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pipelines", default=",".join(PIPELINES), help=f"Comma-separated, from {', '.join(PIPELINES)}")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent simulated sessions")
+    parser.add_argument("--requests", type=int, default=3, help="Requests (clicks) per session and pipeline")
+    parser.add_argument("--profile", default="realistic", choices=sorted(fakes.PROFILES))
+    parser.add_argument("--time-scale", type=float, default=0.05, help="Multiplies the profile's latencies")
+    parser.add_argument("--error-rate", type=float, help="Overrides the profile's error rate")
+    parser.add_argument("--replay", metavar="DIR", help="Serve recorded fixtures (simulated responses for the rest)")
+    parser.add_argument("--shared-inputs", action="store_true", help="All sessions send identical requests")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report the Python heap peak (slower)")
+    parser.add_argument("--json", metavar="PATH", help="Write the report as JSON ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.pipelines.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PIPELINES]
+    if unknown:
+        parser.error(f"unknown pipelines: {', '.join(unknown)}")
+
+    profile = replace(fakes.PROFILES[args.profile], time_scale=args.time_scale)
+    if args.error_rate is not None:
+        profile = replace(profile, error_rate=args.error_rate)
+    genai_client = fakes.FakeGenAIClient(profile=profile)
+    prediction_client = fakes.FakePredictionClient(profile=profile)
+    if args.replay:
+        genai_client = fakes.ReplayGenAIClient(args.replay, fallback=genai_client)
+        prediction_client = fakes.ReplayPredictionClient(args.replay, fallback=prediction_client)
+
+    report = run(names, args.sessions, args.requests, genai_client, prediction_client,
+                 shared_inputs=args.shared_inputs, trace_memory=args.trace_memory)
+    report["profile"] = {"name": args.profile, "time_scale": args.time_scale, "error_rate": profile.error_rate,
+                         "replay": args.replay}
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Disk-backed, content-addressed store for large per-session blobs.
+
+Uploaded images used to sit in ``st.session_state`` until the session expired,
+so idle sessions kept multi-MB buffers in RAM. Pages now keep a small
+``BlobHandle`` in session state; the bytes live in files under ``BLOB_DIR``
+(one per distinct content, shared by all sessions) and are read back through
+``mmap`` when needed, so an idle session costs no heap memory.
+
+Every session has a byte quota, and sessions that have not touched their
+blobs for ``BLOB_IDLE_MINUTES`` are released; files no longer referenced by
+any session are deleted.
+"""
+import mmap
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from backend.cache import CACHE_DIR, digest_bytes
+
+BLOB_DIR = os.environ.get("MEDIA_STUDIO_BLOB_DIR", os.path.join(CACHE_DIR, "blobs"))
+SESSION_QUOTA_MB = int(os.environ.get("MEDIA_STUDIO_SESSION_QUOTA_MB", "200"))
+BLOB_IDLE_MINUTES = float(os.environ.get("MEDIA_STUDIO_BLOB_IDLE_MINUTES", "30"))
+
+
+class QuotaExceeded(ValueError):
+    """Raised when storing a blob would push a session over its byte quota."""
+
+
+@dataclass(frozen=True)
+class BlobHandle:
+    """What pages keep in ``st.session_state`` instead of the bytes."""
+    session_id: str
+    slot: str
+    digest: str
+    size: int
+    mime_type: str = None
+
+
+_lock = threading.Lock()
+_sessions = {}  # session_id -> {"slots": {slot: digest}, "sizes": {digest: size}, "last_seen": float}
+counters = {"puts": 0, "reads": 0, "bytes_read": 0, "idle_sessions_evicted": 0, "files_deleted": 0}
+
+
+def _path(digest):
+    return os.path.join(BLOB_DIR, digest[:2], digest)
+
+
+def _referenced(digest):
+    return any(digest in s["slots"].values() for s in _sessions.values())
+
+
+_on_delete = []  # callbacks(digest) for blobs no session references any more
+
+
+def on_delete(callback):
+    """Registers ``callback(digest)``, called (under the store's lock) whenever a blob is dropped."""
+    _on_delete.append(callback)
+
+
+def _delete_if_unreferenced(digest):
+    if not _referenced(digest):
+        try:
+            os.remove(_path(digest))
+            counters["files_deleted"] += 1
+        except FileNotFoundError:
+            pass
+        for callback in _on_delete:
+            callback(digest)
+
+
+def _session(session_id):
+    session = _sessions.setdefault(session_id, {"slots": {}, "sizes": {}, "last_seen": time.time()})
+    session["last_seen"] = time.time()
+    return session
+
+
+def _session_bytes(session):
+    return sum(session["sizes"][d] for d in set(session["slots"].values()))
+
+
+def evict_idle_sessions():
+    """Releases every session idle for longer than ``BLOB_IDLE_MINUTES``."""
+    cutoff = time.time() - BLOB_IDLE_MINUTES * 60
+    with _lock:
+        idle = [sid for sid, s in _sessions.items() if s["last_seen"] < cutoff]
+        for session_id in idle:
+            _release_locked(session_id)
+            counters["idle_sessions_evicted"] += 1
+
+
+def _release_locked(session_id):
+    session = _sessions.pop(session_id, None)
+    if session:
+        for digest in set(session["slots"].values()):
+            _delete_if_unreferenced(digest)
+
+
+def put(session_id, slot, data, mime_type=None):
+    """Stores ``data`` in ``slot`` of the session and returns its ``BlobHandle``.
+
+    Whatever the slot held before is released. Raises ``QuotaExceeded`` if the
+    session would hold more than ``SESSION_QUOTA_MB``.
+    """
+    evict_idle_sessions()
+    digest = digest_bytes(data)
+    with _lock:
+        session = _session(session_id)
+        previous = session["slots"].get(slot)
+        slots_after = {**session["slots"], slot: digest}
+        sizes_after = {**session["sizes"], digest: len(data)}
+        new_total = sum(sizes_after[d] for d in set(slots_after.values()))
+        if new_total > SESSION_QUOTA_MB * 1024 * 1024:
+            raise QuotaExceeded(
+                f"this session would hold {new_total / 1e6:.0f} MB of images (limit {SESSION_QUOTA_MB} MB); "
+                "remove some uploads first"
+            )
+        path = _path(digest)
+        if not os.path.exists(path):
+            # Temp file + rename, so concurrent readers never map a partial file.
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        session["slots"][slot] = digest
+        session["sizes"][digest] = len(data)
+        if previous and previous != digest:
+            if previous not in session["slots"].values():
+                session["sizes"].pop(previous, None)
+            _delete_if_unreferenced(previous)
+        counters["puts"] += 1
+    return BlobHandle(session_id, slot, digest, len(data), mime_type)
+
+
+def get_view(handle):
+    """Zero-copy ``memoryview`` over the blob's mmap, or None if it is gone.
+
+    The mapping stays valid for as long as the view (or anything sliced from it)
+    is alive, even if the blob is deleted in the meantime.
+    """
+    if handle is None:
+        return None
+    with _lock:
+        session = _sessions.get(handle.session_id)
+        if session is not None:
+            session["last_seen"] = time.time()
+        counters["reads"] += 1
+        counters["bytes_read"] += handle.size
+    if handle.size == 0:
+        return memoryview(b"")
+    try:
+        with open(_path(handle.digest), "rb") as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except FileNotFoundError:
+        return None
+
+
+def get_bytes(handle):
+    """The blob as ``bytes`` for APIs that need them (st.image, SDK types); a transient copy."""
+    view = get_view(handle)
+    return bytes(view) if view is not None else None
+
+
+def release_slot(session_id, slot):
+    with _lock:
+        session = _sessions.get(session_id)
+        if session and slot in session["slots"]:
+            digest = session["slots"].pop(slot)
+            if digest not in session["slots"].values():
+                session["sizes"].pop(digest, None)
+            _delete_if_unreferenced(digest)
+
+
+def release_session(session_id):
+    with _lock:
+        _release_locked(session_id)
+
+
+def session_bytes(session_id):
+    with _lock:
+        session = _sessions.get(session_id)
+        return _session_bytes(session) if session else 0
+
+
+def session_digests(session_id):
+    with _lock:
+        session = _sessions.get(session_id)
+        return set(session["slots"].values()) if session else set()
+
+
+def memory_report():
+    """Per-session bytes held on disk, idle time and the process totals."""
+    now = time.time()
+    with _lock:
+        sessions = {
+            sid: {
+                "blobs": len(set(s["slots"].values())),
+                "bytes": _session_bytes(s),
+                "idle_seconds": round(now - s["last_seen"], 1),
+            }
+            for sid, s in _sessions.items()
+        }
+        blob_sizes = {d: size for s in _sessions.values() for d, size in s["sizes"].items()}
+    return {
+        "sessions": sessions,
+        "total_sessions": len(sessions),
+        "distinct_blobs": len(blob_sizes),
+        "disk_bytes": sum(blob_sizes.values()),
+        "quota_bytes_per_session": SESSION_QUOTA_MB * 1024 * 1024,
+        **counters,
+    }
@@ -0,0 +1,239 @@
+"""Content-addressed on-disk cache for model results.
+
+Entries are keyed by a SHA-256 fingerprint of everything that determines the
+output (model, prompt, config, ...) and stored under ``CACHE_DIR``. Each cache
+is bounded in bytes and evicts least-recently-used entries first; entries older
+than the TTL are treated as misses and removed.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+CACHE_DIR = os.environ.get("MEDIA_STUDIO_CACHE_DIR", ".media_studio_cache")
+CACHE_MAX_MB = int(os.environ.get("MEDIA_STUDIO_CACHE_MAX_MB", "1024"))
+CACHE_TTL_HOURS = float(os.environ.get("MEDIA_STUDIO_CACHE_TTL_HOURS", "168"))
+# Gemini text answers are tiny but go stale faster (prompt wording gets tweaked).
+GEMINI_CACHE_MAX_MB = int(os.environ.get("MEDIA_STUDIO_GEMINI_CACHE_MAX_MB", "16"))
+GEMINI_CACHE_TTL_HOURS = float(os.environ.get("MEDIA_STUDIO_GEMINI_CACHE_TTL_HOURS", "24"))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _canonical(value):
+    """Turns SDK config objects (pydantic models) into plain JSON-able values."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    return value
+
+
+def digest_bytes(data):
+    """SHA-256 hex digest of a bytes-like object.
+
+    The buffer is fed to the hash in slices of a memoryview, so multi-MB
+    uploads are never copied just to be hashed.
+    """
+    h = hashlib.sha256()
+    view = memoryview(data).cast("B")
+    for start in range(0, len(view), HASH_CHUNK_SIZE):
+        h.update(view[start:start + HASH_CHUNK_SIZE])
+    return h.hexdigest()
+
+
+def describe_reference_image(reference):
+    """Cache-key description of an SDK reference image (Raw/Mask/Subject/Control).
+
+    Every field is kept as-is except the image itself, which is replaced by the
+    digest of its bytes (or its GCS URI) instead of being serialized.
+    """
+    described = {"class": type(reference).__name__}
+    for name in type(reference).model_fields:
+        value = getattr(reference, name)
+        if name == "reference_image":
+            if value is None:
+                described[name] = None
+            elif value.image_bytes is not None:
+                described[name] = {"sha256": digest_bytes(value.image_bytes), "mime_type": value.mime_type}
+            else:
+                described[name] = {"gcs_uri": value.gcs_uri, "mime_type": value.mime_type}
+        else:
+            described[name] = _canonical(value)
+    return described
+
+
+def describe_part(part):
+    """Cache-key description of a Gemini content part; inline image data becomes its digest."""
+    inline_data = getattr(part, "inline_data", None)
+    if inline_data is not None and inline_data.data is not None:
+        return {"inline_data": {"sha256": digest_bytes(inline_data.data), "mime_type": inline_data.mime_type}}
+    return _canonical(part)
+
+
+def fingerprint(*parts):
+    """Stable SHA-256 hex digest of the given request parts."""
+    payload = json.dumps(_canonical(list(parts)), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Size-bounded LRU/TTL cache of lists of (bytes, mime_type) blobs.
+
+    Every entry is a directory holding one file per blob plus ``meta.json``.
+    The meta file's mtime is the last access time used for LRU ordering, so the
+    order survives restarts. The in-memory index is rebuilt lazily from disk.
+    """
+
+    def __init__(self, root, max_bytes, ttl_seconds):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._index = None  # key -> {"size", "created_at", "last_access"}
+        self.counters = {"hits": 0, "misses": 0, "bypassed": 0, "writes": 0, "evictions": 0, "expired": 0}
+
+    # --- Paths and index ---
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        if not os.path.isdir(self.root):
+            return
+        for shard in os.listdir(self.root):
+            shard_dir = os.path.join(self.root, shard)
+            if shard.startswith(".") or not os.path.isdir(shard_dir):
+                continue
+            for key in os.listdir(shard_dir):
+                meta_path = os.path.join(shard_dir, key, "meta.json")
+                try:
+                    with open(meta_path) as f:
+                        meta = json.load(f)
+                    self._index[key] = {
+                        "size": meta["size"],
+                        "created_at": meta["created_at"],
+                        "last_access": os.path.getmtime(meta_path),
+                    }
+                except (OSError, ValueError, KeyError):
+                    # Half-written or corrupt entry, drop it.
+                    shutil.rmtree(os.path.join(shard_dir, key), ignore_errors=True)
+
+    def _remove(self, key):
+        self._index.pop(key, None)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _evict(self):
+        total = sum(e["size"] for e in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self._index, key=lambda k: self._index[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            total -= self._index[key]["size"]
+            self._remove(key)
+            self.counters["evictions"] += 1
+
+    # --- Public API ---
+    def get(self, key):
+        """Returns the cached [(bytes, mime_type), ...] or None on a miss."""
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            if self.ttl_seconds and time.time() - entry["created_at"] > self.ttl_seconds:
+                self._remove(key)
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+            entry_dir = self._entry_dir(key)
+            try:
+                with open(os.path.join(entry_dir, "meta.json")) as f:
+                    meta = json.load(f)
+                blobs = []
+                for i, mime_type in enumerate(meta["mime_types"]):
+                    with open(os.path.join(entry_dir, f"{i}.bin"), "rb") as f:
+                        blobs.append((f.read(), mime_type))
+                now = time.time()
+                os.utime(os.path.join(entry_dir, "meta.json"), (now, now))
+            except (OSError, ValueError, KeyError):
+                self._remove(key)
+                self.counters["misses"] += 1
+                return None
+            entry["last_access"] = now
+            self.counters["hits"] += 1
+            return blobs
+
+    def put(self, key, blobs):
+        """Stores [(bytes, mime_type), ...] under ``key``, replacing any old entry."""
+        if not blobs:
+            return
+        size = sum(len(data) for data, _ in blobs)
+        if size > self.max_bytes:
+            return
+        # Write into a temp dir next to the target and rename it into place so
+        # readers never see a partial entry.
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        now = time.time()
+        for i, (data, _) in enumerate(blobs):
+            with open(os.path.join(tmp_dir, f"{i}.bin"), "wb") as f:
+                f.write(data)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({"size": size, "created_at": now, "mime_types": [m for _, m in blobs]}, f)
+        with self._lock:
+            self._load_index()
+            self._remove(key)
+            entry_dir = self._entry_dir(key)
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            os.replace(tmp_dir, entry_dir)
+            self._index[key] = {"size": size, "created_at": now, "last_access": now}
+            self.counters["writes"] += 1
+            self._evict()
+
+    def note_bypass(self):
+        with self._lock:
+            self.counters["bypassed"] += 1
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._index = {}
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else None,
+                "entries": len(self._index),
+                "bytes": sum(e["size"] for e in self._index.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+
+# --- Process-wide caches ---
+generate_images_cache = DiskCache(
+    os.path.join(CACHE_DIR, "generate_images"),
+    max_bytes=CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=CACHE_TTL_HOURS * 3600,
+)
+edit_image_cache = DiskCache(
+    os.path.join(CACHE_DIR, "edit_image"),
+    max_bytes=CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=CACHE_TTL_HOURS * 3600,
+)
+generate_content_cache = DiskCache(
+    os.path.join(CACHE_DIR, "generate_content"),
+    max_bytes=GEMINI_CACHE_MAX_MB * 1024 * 1024,
+    ttl_seconds=GEMINI_CACHE_TTL_HOURS * 3600,
+)
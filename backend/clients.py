@@ -0,0 +1,222 @@
+"""Process-wide pool of Vertex AI clients.
+
+Pages used to build ``genai.Client(...)`` (and the VTO ``PredictionServiceClient``)
+at module top level, which Streamlit re-runs on every interaction. Here every
+client is built once per (kind, project, location, family) key and reused by all
+sessions, so TLS connections stay open and credentials are only loaded and
+refreshed in one place.
+
+Pages ask for ``lazy=True`` clients: a stand-in that builds (or fetches) the
+pooled client on first use, so a cold replica draws the page without first
+loading credentials, importing the SDK or running ``aiplatform.init``.
+``backend.warmup`` builds them ahead of traffic instead.
+
+``MEDIA_STUDIO_BACKEND`` swaps the real clients for the ones in
+``backend.fakes``: ``fake`` (simulated, see ``MEDIA_STUDIO_FAKE_PROFILE``),
+``record:<dir>`` (real calls, responses saved as fixtures) or
+``replay:<dir>`` (recorded responses, simulated for anything not recorded).
+"""
+import os
+import threading
+import time
+
+from backend import metrics
+from backend.singleflight import SingleFlight
+
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+BACKEND = os.environ.get("MEDIA_STUDIO_BACKEND", "vertex")
+
+# --- Shared credentials ---
+_credentials_lock = threading.Lock()
+_credentials = None
+_credentials_refreshes = 0
+
+# --- Client pool ---
+_pool_lock = threading.Lock()
+_pool = {}        # key -> client
+_pool_info = {}   # key -> {"created_at", "last_used", "hits", "build_seconds"}
+_initialized_aiplatform = set()
+_build_flights = SingleFlight("client_build")  # one build per cold key at a time
+
+
+def get_credentials():
+    """Returns the shared ADC credentials, refreshing them if they have expired."""
+    global _credentials, _credentials_refreshes
+    with _credentials_lock:
+        if _credentials is None:
+            import google.auth
+            _credentials, _ = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+        if not _credentials.valid:
+            import google.auth.transport.requests
+            _credentials.refresh(google.auth.transport.requests.Request())
+            _credentials_refreshes += 1
+        return _credentials
+
+
+def _pooled(key):
+    """The pooled client for ``key`` (counted as a hit), or None. Call with ``_pool_lock`` held."""
+    client = _pool.get(key)
+    if client is not None:
+        info = _pool_info[key]
+        info["hits"] += 1
+        info["last_used"] = time.time()
+    return client
+
+
+def _get_or_build(key, build):
+    with _pool_lock:
+        client = _pooled(key)
+    if client is not None:
+        return client
+
+    def build_and_pool():
+        with _pool_lock:
+            client = _pool.get(key)  # built by a flight that just ended
+        if client is not None:
+            return client
+        started = time.perf_counter()
+        with metrics.stage("client_build", model=key[3]):
+            client = build()
+        now = time.time()
+        with _pool_lock:
+            _pool[key] = client
+            _pool_info[key] = {
+                "created_at": now,
+                "last_used": now,
+                "hits": 0,
+                "build_seconds": time.perf_counter() - started,
+            }
+        return client
+
+    # Two sessions racing on a cold key share one build, and a slow build (credentials,
+    # aiplatform.init) doesn't hold up lookups of the keys that are already pooled.
+    client, shared = _build_flights.do(key, build_and_pool)
+    if shared:
+        with _pool_lock:
+            _pooled(key)
+    return client
+
+
+class _Deferred:
+    """Stands in for a pooled client until an attribute is first read."""
+
+    def __init__(self, get):
+        self.__get = get
+        self.__client = None
+
+    def __getattr__(self, name):
+        if self.__client is None:
+            self.__client = self.__get()
+        return getattr(self.__client, name)
+
+
+def _offline(build_real, fake, recording, replay):
+    """Wraps a client builder according to ``BACKEND``."""
+    mode, _, fixture_dir = BACKEND.partition(":")
+    if mode == "vertex":
+        return build_real
+
+    def build():
+        from backend import fakes
+        if mode == "fake":
+            return fake(fakes)
+        if mode == "record":
+            return recording(fakes, build_real(), fixture_dir)
+        if mode == "replay":
+            return replay(fakes, fixture_dir, fake(fakes))
+        raise ValueError(f"unknown MEDIA_STUDIO_BACKEND {BACKEND!r} (vertex, fake, record:<dir> or replay:<dir>)")
+
+    return build
+
+
+def get_genai_client(project, location, family="default", lazy=False):
+    """Returns the pooled ``genai.Client`` for a project/location/model family.
+
+    ``family`` (e.g. "imagen", "gemini") only separates connection pools so a
+    slow Imagen request doesn't hold up Gemini traffic on the same connections.
+    With ``lazy``, build errors surface on the first call instead of here.
+    """
+    if lazy:
+        return _Deferred(lambda: get_genai_client(project, location, family))
+
+    def build():
+        from google import genai
+        return genai.Client(
+            vertexai=True,
+            project=project,
+            location=location,
+            credentials=get_credentials(),
+        )
+
+    build = _offline(
+        build,
+        fake=lambda fakes: fakes.FakeGenAIClient(profile=fakes.profile_from_env()),
+        recording=lambda fakes, client, root: fakes.RecordingGenAIClient(client, root),
+        replay=lambda fakes, root, fallback: fakes.ReplayGenAIClient(root, fallback=fallback),
+    )
+    return _get_or_build(("genai", project, location, family), build)
+
+
+def get_prediction_client(project, location, lazy=False):
+    """Returns the pooled ``PredictionServiceClient`` for the regional endpoint."""
+    if lazy:
+        return _Deferred(lambda: get_prediction_client(project, location))
+
+    def build():
+        from google.cloud import aiplatform
+        if (project, location) not in _initialized_aiplatform:
+            aiplatform.init(project=project, location=location, credentials=get_credentials())
+            _initialized_aiplatform.add((project, location))
+        client_options = {"api_endpoint": f"{location}-aiplatform.googleapis.com"}
+        client = aiplatform.gapic.PredictionServiceClient(
+            client_options=client_options, credentials=get_credentials()
+        )
+        print(f"Prediction client initiated on project {project} in {location}.")
+        return client
+
+    build = _offline(
+        build,
+        fake=lambda fakes: fakes.FakePredictionClient(profile=fakes.profile_from_env()),
+        recording=lambda fakes, client, root: fakes.RecordingPredictionClient(client, root),
+        replay=lambda fakes, root, fallback: fakes.ReplayPredictionClient(root, fallback=fallback),
+    )
+    return _get_or_build(("prediction", project, location, "vto"), build)
+
+
+def pool_stats():
+    """Snapshot of the pool for the status panel."""
+    with _pool_lock:
+        clients = [
+            {
+                "kind": key[0],
+                "project": key[1],
+                "location": key[2],
+                "family": key[3],
+                **info,
+            }
+            for key, info in _pool_info.items()
+        ]
+    expiry = getattr(_credentials, "expiry", None)
+    return {
+        "backend": BACKEND,
+        "clients": clients,
+        "total_clients": len(clients),
+        "total_hits": sum(c["hits"] for c in clients),
+        "credential_refreshes": _credentials_refreshes,
+        "credentials_expiry": expiry.isoformat() if expiry else None,
+    }
+
+
+def close_all():
+    """Closes and drops every pooled client (used on shutdown and in tools)."""
+    with _pool_lock:
+        clients = list(_pool.values())
+        _pool.clear()
+        _pool_info.clear()
+    for client in clients:
+        close = getattr(client, "close", None) or getattr(getattr(client, "transport", None), "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
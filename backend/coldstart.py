@@ -0,0 +1,175 @@
+"""Cold-start benchmark: what the first run of each page costs in a fresh process.
+
+Each page runs in its own new interpreter (``python -X importtime``), the way
+it would on a freshly started replica, against the fake backend. The report
+breaks the first run down into module imports (grouped by package) and the
+rest (client setup, backend initialization, drawing the page), next to a
+second, warm run of the same page.
+
+    python -m backend.coldstart
+    python -m backend.coldstart --pages Home,Virtual_Try_On --prewarm --json coldstart.json
+
+``--prewarm`` runs ``backend.warmup.prewarm`` before the first run, to show
+what is left for the first visitor once a replica is warmed before serving.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import time is grouped under the first of these prefixes that matches; anything else is "other".
+PACKAGE_GROUPS = (
+    "google.genai", "google.cloud.aiplatform", "google.cloud.storage", "google.auth", "google.protobuf",
+    "google.api_core", "proto", "grpc", "google.cloud", "google", "matplotlib", "numpy", "pandas", "PIL", "pyarrow",
+    "streamlit", "backend",
+)
+FIRST_RUN_MARKER = "@@coldstart first run"
+SECOND_RUN_MARKER = "@@coldstart second run"
+
+
+def _group(module):
+    for prefix in PACKAGE_GROUPS:
+        if module == prefix or module.startswith(prefix + "."):
+            return prefix
+    return "other"
+
+
+def import_seconds(importtime_lines):
+    """Self import time per package group from ``-X importtime`` output lines."""
+    groups = {}
+    for line in importtime_lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = [field.strip() for field in line[len("import time:"):].split("|")]
+        if not fields[0].isdigit():
+            continue  # the header line
+        group = _group(fields[2])
+        groups[group] = groups.get(group, 0) + int(fields[0]) / 1e6
+    return dict(sorted(((g, round(s, 4)) for g, s in groups.items()), key=lambda item: -item[1]))
+
+
+def _child(path, prewarm):
+    """Runs in the fresh interpreter: times the first and second run of one script."""
+    from streamlit.testing.v1 import AppTest
+
+    result = {}
+    if prewarm:
+        from backend import warmup
+        started = time.perf_counter()
+        warmup.prewarm()
+        result["prewarm_seconds"] = time.perf_counter() - started
+    at = AppTest.from_file(path, default_timeout=300)
+    for key, marker in (("first_run_seconds", FIRST_RUN_MARKER), ("second_run_seconds", SECOND_RUN_MARKER)):
+        print(marker, file=sys.stderr, flush=True)
+        started = time.perf_counter()
+        at.run()
+        result[key] = time.perf_counter() - started
+    from backend import clients
+    result["clients_built"] = clients.pool_stats()["total_clients"]
+    result["exceptions"] = [str(e.value) for e in at.exception]
+    print(json.dumps(result))
+
+
+def measure(page, path, prewarm=False, timeout=600):
+    """Runs one page cold in a new interpreter and returns its breakdown."""
+    env = dict(os.environ)
+    env.setdefault("MEDIA_STUDIO_BACKEND", "fake")
+    env.setdefault("MEDIA_STUDIO_METRICS_PORT", "0")
+    env["MEDIA_STUDIO_CACHE_DIR"] = tempfile.mkdtemp(prefix="media_studio_coldstart_")  # cold caches too
+    command = [sys.executable, "-X", "importtime", "-m", "backend.coldstart", "--child", path]
+    if prewarm:
+        command.append("--prewarm")
+    started = time.perf_counter()
+    proc = subprocess.run(command, cwd=REPO_DIR, env=env, capture_output=True, text=True, timeout=timeout)
+    process_seconds = time.perf_counter() - started
+    if proc.returncode != 0:
+        return {"page": page, "error": proc.stderr.strip().splitlines()[-1:]}
+
+    stderr = proc.stderr.splitlines()
+    first = stderr.index(FIRST_RUN_MARKER)
+    second = stderr.index(SECOND_RUN_MARKER)
+    child = json.loads(proc.stdout.strip().splitlines()[-1])
+    first_run_imports = import_seconds(stderr[first:second])
+    result = {
+        "page": page,
+        "process_seconds": round(process_seconds, 3),
+        "startup_imports_seconds": round(sum(import_seconds(stderr[:first]).values()), 3),
+        "first_run_seconds": round(child["first_run_seconds"], 3),
+        "first_run_imports_seconds": round(sum(first_run_imports.values()), 3),
+        "first_run_imports": first_run_imports,
+        "second_run_seconds": round(child["second_run_seconds"], 3),
+        "clients_built": child["clients_built"],
+        "exceptions": child["exceptions"],
+    }
+    result["first_run_other_seconds"] = round(result["first_run_seconds"] - result["first_run_imports_seconds"], 3)
+    if prewarm:
+        result["prewarm_seconds"] = round(child["prewarm_seconds"], 3)
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(report, out=sys.stdout):
+    print(f"{'page':<32} {'first run':>9} {'imports':>8} {'other':>8} {'2nd run':>8}  top imports", file=out)
+    for result in report["pages"]:
+        if "error" in result:
+            print(f"{result['page']:<32} failed: {result['error']}", file=out)
+            continue
+        top = ", ".join(f"{group} {seconds:.2f}s" for group, seconds in list(result["first_run_imports"].items())[:3])
+        print(f"{result['page']:<32} {result['first_run_seconds']:>9.3f} {result['first_run_imports_seconds']:>8.3f} "
+              f"{result['first_run_other_seconds']:>8.3f} {result['second_run_seconds']:>8.3f}  {top}", file=out)
+
+
+def main(argv=None):
+    if argv is None and "--child" in sys.argv:
+        # Nothing but streamlit may be imported before the child's first run.
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--child")
+        parser.add_argument("--prewarm", action="store_true")
+        args = parser.parse_args()
+        _child(args.child, args.prewarm)
+        return 0
+
+    from backend.loadtest import scripts
+
+    available = list(scripts())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", default=",".join(available), help=f"Comma-separated, from {', '.join(available)}")
+    parser.add_argument("--prewarm", action="store_true", help="Run backend.warmup.prewarm before the first run")
+    parser.add_argument("--json", metavar="PATH", help="Write the report as JSON ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    pages = [page.strip() for page in args.pages.split(",") if page.strip()]
+    unknown = [page for page in pages if page not in available]
+    if unknown:
+        parser.error(f"unknown pages: {', '.join(unknown)}")
+
+    paths = scripts()
+    report = {
+        "commit": _commit(),
+        "config": {"pages": pages, "prewarm": args.prewarm, "backend": os.environ.get("MEDIA_STUDIO_BACKEND", "fake")},
+        "pages": [measure(page, paths[page], args.prewarm) for page in pages],
+    }
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    return 1 if any("error" in result or result["exceptions"] for result in report["pages"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
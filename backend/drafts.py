@@ -0,0 +1,229 @@
+"""Draft-then-final generation: cheap variations first, full quality only for the one that's kept.
+
+Most exploratory variations are thrown away, so the Background Editor and the
+Moodboard page can draft them first (fewer steps, a smaller source image or a
+fast model) and only the draft the user picks is rendered at full quality:
+re-rendered with the full model and the draft's seed, or upscaled. Drafts are
+kept like any other result (``backend.results``, under ``<page>_draft``), with
+the seeds and settings needed for the final render in the session.
+
+Every tier run is timed and its spend estimated from per-image list prices
+(images served from the local cache cost nothing). Totals per page and tier
+are in ``stats()`` (shown on Home) and in the
+``media_studio_image_spend_usd_total`` metric.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import streamlit as st
+
+from backend import imagen, metrics, previews, results, uploads
+
+# USD per returned image. These are only the fallback (list prices at the time of
+# writing, check them against your contract): MEDIA_STUDIO_IMAGE_PRICES_FILE points
+# at a JSON {"model": price} table that replaces them, and
+# MEDIA_STUDIO_IMAGE_PRICES="imagen-4.0-fast-generate-preview-06-06=0.02,..."
+# overrides single models on top. Models without a price show up as "unpriced".
+DEFAULT_IMAGE_PRICES = {
+    "imagen-4.0-generate-preview-06-06": 0.04,
+    "imagen-4.0-fast-generate-preview-06-06": 0.02,
+    "imagen-4.0-ultra-generate-preview-06-06": 0.06,
+    "imagen-3.0-generate-002": 0.04,
+    "imagen-3.0-fast-generate-001": 0.02,
+    "imagen-3.0-capability-001": 0.02,
+    "imagen-4.0-upscale-preview": 0.06,
+}
+DRAFT_COUNT = int(os.environ.get("MEDIA_STUDIO_DRAFT_COUNT", "4"))
+UPSCALE_MODEL = os.environ.get("MEDIA_STUDIO_UPSCALE_MODEL", "imagen-4.0-upscale-preview")
+UPSCALE_FACTOR = os.environ.get("MEDIA_STUDIO_UPSCALE_FACTOR", "x2")
+
+FINAL_RERENDER = "Re-render at full quality"
+FINAL_UPSCALE = "Upscale the draft"
+FINAL_MODES = (FINAL_RERENDER, FINAL_UPSCALE)
+# A re-render reuses the draft's prompt and seed, but not its draft settings, so it isn't the same image.
+FINAL_MODES_HELP = ("Re-render: same prompt and seed at full settings, so the composition is similar but details "
+                    "differ from the draft. Upscale: the picked draft itself, enlarged; exactly what you picked.")
+
+
+def _parse_prices(spec, path=None):
+    if path:
+        with open(path) as f:
+            prices = {model: float(price) for model, price in json.load(f).items()}
+    else:
+        prices = dict(DEFAULT_IMAGE_PRICES)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, price = item.partition("=")
+        prices[model.strip()] = float(price)
+    return prices
+
+
+IMAGE_PRICES = _parse_prices(os.environ.get("MEDIA_STUDIO_IMAGE_PRICES", ""),
+                             os.environ.get("MEDIA_STUDIO_IMAGE_PRICES_FILE"))
+
+IMAGE_SPEND = metrics.Counter("media_studio_image_spend_usd_total", "Estimated image spend at list prices.",
+                              ("tier", "model", "page"))
+
+
+def new_seed():
+    """Seed for a batch of drafts; draft ``i`` uses ``seed + i``, so all of them stay valid 32-bit seeds."""
+    return random.randint(1, 2 ** 31 - 1 - DRAFT_COUNT)
+
+
+def price(model):
+    """USD per image for ``model``, or None if it isn't priced."""
+    return IMAGE_PRICES.get(model)
+
+
+# --- Tier runs ---
+_lock = threading.Lock()
+tier_counters = {}  # (page, tier) -> {"runs", "images", "billed_images", "seconds_total", "spend_usd"}
+
+
+class TierRun:
+    """Latency and spend of one tier run (a batch of drafts, or one final).
+
+    Use as a context manager around the calls, and wrap each call with
+    ``meter`` so billed images are counted (from worker threads too).
+    """
+
+    def __init__(self, page, tier, model):
+        self.page, self.tier, self.model = page, tier, model
+        self.images = 0
+        self.billed = 0
+        self.seconds = None
+        self._count_lock = threading.Lock()
+
+    def meter(self, call):
+        """Wraps ``call(*args)`` returning ``(response, from_cache)`` like the ``backend.imagen`` helpers."""
+        def metered(*args, **kwargs):
+            response, from_cache = call(*args, **kwargs)
+            images = len(response.generated_images or [])
+            with self._count_lock:
+                self.images += images
+                if not from_cache:
+                    self.billed += images
+            return response, from_cache
+        return metered
+
+    @property
+    def spend(self):
+        unit = price(self.model)
+        return None if unit is None else self.billed * unit
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        spend = self.spend
+        with _lock:
+            counters = tier_counters.setdefault((self.page, self.tier), {
+                "runs": 0, "images": 0, "billed_images": 0, "seconds_total": 0.0, "spend_usd": 0.0,
+            })
+            counters["runs"] += 1
+            counters["images"] += self.images
+            counters["billed_images"] += self.billed
+            counters["seconds_total"] += self.seconds
+            counters["spend_usd"] += spend or 0.0
+        if spend:
+            IMAGE_SPEND.inc(spend, tier=self.tier, model=self.model, page=self.page)
+        return False
+
+    def summary(self):
+        """Plain dict for the session state and ``timing_caption``."""
+        return {"tier": self.tier, "model": self.model, "images": self.images, "billed": self.billed,
+                "seconds": self.seconds, "spend_usd": self.spend}
+
+
+def stats():
+    with _lock:
+        tiers = {
+            f"{page}/{tier}": {
+                **counters,
+                "seconds_total": round(counters["seconds_total"], 3),
+                "seconds_avg": round(counters["seconds_total"] / counters["runs"], 3),
+                "spend_usd": round(counters["spend_usd"], 4),
+            }
+            for (page, tier), counters in sorted(tier_counters.items())
+        }
+    return {"tiers": tiers, "prices_usd_per_image": IMAGE_PRICES}
+
+
+def _describe(run):
+    spend = "unpriced" if run["spend_usd"] is None else f"${run['spend_usd']:.2f}"
+    return f"{run['images']} at {run['model']} in {run['seconds']:.1f}s, {spend}"
+
+
+def timing_caption(draft, final=None):
+    """One line with the latency and spend of the draft run and, once there is one, the final."""
+    text = f"Drafts: {_describe(draft)}"
+    if final is not None:
+        text += f" · Final ({final['tier']}): {_describe(final)}"
+    return text
+
+
+# --- Kept drafts ---
+def _state_key(page):
+    return f"{page}_draft_state"
+
+
+def keep(page, outputs, label, state, mime_type="image/png"):
+    """Keeps ``outputs`` as ``page``'s current drafts (replacing earlier ones) with ``state``
+    (seeds, settings, the draft ``TierRun`` summary...). Returns the ``Generation`` or None."""
+    discard(page)
+    generation = results.record(f"{page}_draft", outputs, label=label, caption="Draft", mime_type=mime_type)
+    if generation is not None:
+        st.session_state[_state_key(page)] = {**state, "generation": generation.id, "final": None}
+    return generation
+
+
+def current(page):
+    """``(generation, state)`` of ``page``'s current drafts, or ``(None, None)``."""
+    state = st.session_state.get(_state_key(page))
+    kept = results.history(f"{page}_draft")
+    if state is None or not kept or kept[-1].id != state["generation"]:
+        return None, None
+    return kept[-1], state
+
+
+def discard(page):
+    results.clear(f"{page}_draft")
+    st.session_state.pop(_state_key(page), None)
+
+
+def show_picker(page, generation, max_columns=4):
+    """Draws the drafts, each with a button to pick it; returns the index picked on this run, or None."""
+    picked = None
+    cols = st.columns(min(len(generation.images), max_columns))
+    for i, handle in enumerate(generation.images):
+        with cols[i % len(cols)]:
+            preview = previews.preview_of(handle) if handle is not None else None
+            if preview is None:
+                st.warning(f"Draft {i+1} failed or is no longer available.")
+                continue
+            with metrics.stage("st.image"):
+                st.image(preview, caption=f"Draft {i+1}")
+            if st.button("Use this one", key=f"{page}_pick_draft_{i}"):
+                picked = i
+    return picked
+
+
+def render_final(page, client, handle, final_mode, rerender, rerender_model):
+    """Final tier for the picked draft ``handle``: ``rerender()`` (returning ``(response, from_cache)``
+    like the ``backend.imagen`` helpers) or an upscale of the draft itself.
+
+    Returns ``(response, from_cache, summary)`` with the ``TierRun`` summary of the final.
+    """
+    if final_mode == FINAL_UPSCALE:
+        with TierRun(page, "upscale", UPSCALE_MODEL) as run:
+            response, from_cache = run.meter(imagen.upscale_image)(
+                client, UPSCALE_MODEL, uploads.get_bytes(handle), UPSCALE_FACTOR, mime_type=handle.mime_type,
+            )
+    else:
+        with TierRun(page, "rerender", rerender_model) as run:
+            response, from_cache = run.meter(rerender)()
+    return response, from_cache, run.summary()
@@ -0,0 +1,432 @@
+"""Offline stand-ins for the Vertex AI clients.
+
+``FakeGenAIClient`` implements the parts of ``genai.Client`` the app uses
+(``client.models.generate_images`` / ``edit_image`` / ``generate_content`` /
+``generate_content_stream``) and ``FakePredictionClient`` the
+``PredictionServiceClient.predict`` call used by Virtual Try-On, so tools and
+pages can run without network or credentials.
+
+How the fakes behave is set by a ``FakeProfile``: per-method latency
+distributions, an error rate (mostly 429s, so the rate limiter's retries are
+exercised) and the payload, either tiny solid PNGs or noise PNGs about as big
+as real model output.
+
+``RecordingGenAIClient`` / ``RecordingPredictionClient`` wrap real clients and
+write every response to a fixture directory; the ``Replay*`` clients serve
+those fixtures back for identical requests.
+
+``backend.clients`` hands these out instead of the real clients when
+``MEDIA_STUDIO_BACKEND`` is ``fake``, ``record:<dir>`` or ``replay:<dir>``.
+"""
+import base64
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field, replace
+
+from google.genai import types
+
+from backend.cache import describe_part, describe_reference_image, digest_bytes, fingerprint
+
+FAKE_PROMPT = "A [1] in a softly lit studio scene."
+
+
+@dataclass
+class FakeProfile:
+    latency: dict = field(default_factory=dict)  # method -> (median seconds, sigma) of a lognormal
+    error_rate: float = 0.0  # share of calls that fail
+    throttle_share: float = 0.7  # share of failures that are 429s; the rest are 503s
+    image_size: tuple = (256, 256)
+    payload: str = "solid"  # "solid" (tiny PNGs) or "noise" (PNGs about as big as real output)
+    time_scale: float = 1.0  # multiplies every latency, e.g. 0.05 for quick benchmark runs
+
+
+PROFILES = {
+    "instant": FakeProfile(),
+    # Roughly what the models do in us-central1 at moderate load.
+    "realistic": FakeProfile(
+        latency={
+            "generate_images": (6.0, 0.35),
+            "edit_image": (8.0, 0.35),
+            "generate_content": (1.5, 0.4),
+            "generate_content_stream": (1.5, 0.4),
+            "predict": (12.0, 0.3),
+            "upscale_image": (5.0, 0.3),
+        },
+        error_rate=0.02,
+        image_size=(1024, 1024),
+        payload="noise",
+    ),
+}
+
+
+def profile_from_env():
+    """Profile named by ``MEDIA_STUDIO_FAKE_PROFILE``, scaled by ``MEDIA_STUDIO_FAKE_TIME_SCALE``."""
+    profile = PROFILES[os.environ.get("MEDIA_STUDIO_FAKE_PROFILE", "instant")]
+    return replace(profile, time_scale=float(os.environ.get("MEDIA_STUDIO_FAKE_TIME_SCALE", profile.time_scale)))
+
+
+class FakeAPIError(Exception):
+    """Looks enough like a google-genai ``APIError`` for ``ratelimit.is_throttle_error``."""
+
+    def __init__(self, code, status):
+        super().__init__(f"{code} {status} (simulated)")
+        self.code = code
+        self.status = status
+
+
+# --- Payloads ---
+_noise_lock = threading.Lock()
+_noise_pngs = {}  # size -> [png bytes, ...]
+NOISE_VARIANTS = 4
+
+
+def _placeholder_png(label, size):
+    """Solid-colour PNG whose colour is derived from ``label``."""
+    from PIL import Image as PILImage
+    r, g, b = hashlib.sha256(label.encode("utf-8")).digest()[:3]
+    buf = io.BytesIO()
+    PILImage.new("RGB", size, (r, g, b)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _noise_png(label, size):
+    """Noise PNG that compresses about as badly as a photo; unique per ``label``.
+
+    A few noise images are made once per size; each call only adds a tEXt
+    chunk with the label, so every image has its own digest at no real cost.
+    """
+    with _noise_lock:
+        if size not in _noise_pngs:
+            from PIL import Image as PILImage
+            variants = []
+            for _ in range(NOISE_VARIANTS):
+                img = PILImage.frombytes("RGB", (size[0] // 2, size[1] // 2), os.urandom(size[0] * size[1] * 3 // 4))
+                buf = io.BytesIO()
+                img.resize(size).save(buf, format="PNG", compress_level=1)
+                variants.append(buf.getvalue())
+            _noise_pngs[size] = variants
+        base = _noise_pngs[size][hashlib.sha256(label.encode("utf-8")).digest()[0] % NOISE_VARIANTS]
+    chunk_data = b"Comment\x00" + label.encode("utf-8")
+    chunk = struct.pack(">I", len(chunk_data)) + b"tEXt" + chunk_data + struct.pack(">I", zlib.crc32(b"tEXt" + chunk_data))
+    ihdr_end = 8 + 25  # signature + IHDR chunk
+    return base[:ihdr_end] + chunk + base[ihdr_end:]
+
+
+class _Simulator:
+    """Latency, errors and payloads for one fake client, per ``FakeProfile``."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def latency(self, method):
+        median, sigma = self.profile.latency.get(method, (0.0, 0.0))
+        if not median:
+            return 0.0
+        with self._lock:
+            return median * math.exp(self._random.gauss(0, sigma)) * self.profile.time_scale
+
+    def maybe_fail(self):
+        with self._lock:
+            failing = self._random.random() < self.profile.error_rate
+            throttled = self._random.random() < self.profile.throttle_share
+        if failing:
+            raise FakeAPIError(429, "RESOURCE_EXHAUSTED") if throttled else FakeAPIError(503, "UNAVAILABLE")
+
+    def png(self, label):
+        if self.profile.payload == "noise":
+            return _noise_png(f"{label}/{uuid.uuid4().hex}", self.profile.image_size)
+        return _placeholder_png(label, self.profile.image_size)
+
+
+class FakeModels:
+    def __init__(self, latency=0.0, image_size=(256, 256), profile=None):
+        # ``latency`` / ``image_size`` are shorthands for a constant-latency profile.
+        if profile is None:
+            every_method = {m: (latency, 0.0) for m in ("generate_images", "edit_image", "generate_content",
+                                                        "generate_content_stream", "upscale_image")}
+            profile = FakeProfile(latency=every_method, image_size=image_size)
+        self.profile = profile
+        self._sim = _Simulator(profile)
+        self.calls = {"generate_images": 0, "edit_image": 0, "generate_content": 0, "generate_content_stream": 0,
+                      "upscale_image": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, method, wait=True):
+        with self._lock:
+            self.calls[method] += 1
+        if wait:
+            time.sleep(self._sim.latency(method))
+        self._sim.maybe_fail()
+
+    def _images(self, label, config):
+        count = getattr(config, "number_of_images", None) or 1
+        return [
+            types.GeneratedImage(image=types.Image(image_bytes=self._sim.png(f"{label}/{i}"), mime_type="image/png"))
+            for i in range(count)
+        ]
+
+    def generate_images(self, model, prompt, config=None):
+        self._count("generate_images")
+        return types.GenerateImagesResponse(generated_images=self._images(f"{model}/{prompt}/{getattr(config, 'seed', None)}", config))
+
+    def edit_image(self, model, prompt, reference_images, config=None):
+        self._count("edit_image")
+        return types.EditImageResponse(generated_images=self._images(f"{model}/{prompt}/{getattr(config, 'seed', None)}", config))
+
+    def upscale_image(self, model, image, upscale_factor, config=None):
+        self._count("upscale_image")
+        label = f"{model}/{digest_bytes(image.image_bytes)}/{upscale_factor}"
+        return types.UpscaleImageResponse(generated_images=self._images(label, None))
+
+    def generate_content(self, model, contents, config=None):
+        self._count("generate_content")
+        return self._text_response(FAKE_PROMPT)
+
+    def generate_content_stream(self, model, contents, config=None):
+        # A quarter of the latency before the first chunk, the rest spread over the others.
+        self._count("generate_content_stream", wait=False)
+        total = self._sim.latency("generate_content_stream")
+        words = FAKE_PROMPT.split(" ")
+        time.sleep(total / 4)
+        for n, word in enumerate(words):
+            if n:
+                time.sleep(total * 3 / 4 / (len(words) - 1))
+            yield self._text_response(word + " ")
+
+    @staticmethod
+    def _text_response(text):
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))]
+        )
+
+
+class FakeGenAIClient:
+    """Drop-in for ``genai.Client`` with a ``models`` attribute."""
+
+    def __init__(self, latency=0.0, image_size=(256, 256), profile=None):
+        self.models = FakeModels(latency=latency, image_size=image_size, profile=profile)
+
+
+class FakePredictResponse:
+    def __init__(self, predictions):
+        self.predictions = predictions
+
+
+class FakePredictionClient:
+    """Drop-in for ``PredictionServiceClient`` (VTO): one PNG per instance x sampleCount."""
+
+    def __init__(self, latency=0.0, image_size=(256, 256), profile=None):
+        self.profile = profile or FakeProfile(latency={"predict": (latency, 0.0)}, image_size=image_size)
+        self._sim = _Simulator(self.profile)
+        self.calls = 0
+        self.instances = 0
+        self._lock = threading.Lock()
+
+    def predict(self, endpoint, instances, parameters=None):
+        with self._lock:
+            self.calls += 1
+            self.instances += len(instances)
+        parameters = parameters or {}
+        # Diffusion time grows with the step count; the profile's latency is for the default 25.
+        steps = parameters.get("baseSteps", 25)
+        time.sleep(self._sim.latency("predict") * (0.2 + 0.8 * steps / 25))
+        self._sim.maybe_fail()
+        sample_count = parameters.get("sampleCount", 1)
+        predictions = []
+        for n, instance in enumerate(instances):
+            person = instance["personImage"]["image"]["bytesBase64Encoded"][:64]
+            for s in range(sample_count):
+                png = self._sim.png(f"{person}/{n}/{s}/{parameters.get('seed')}/{steps}")
+                predictions.append({"bytesBase64Encoded": base64.b64encode(png).decode("utf-8"), "mimeType": "image/png"})
+        return FakePredictResponse(predictions)
+
+
+# --- Record / replay ---
+class FixtureMissing(LookupError):
+    """Replay found no recorded response for a request."""
+
+
+def _request_key(method, model, prompt=None, contents=None, reference_images=None, config=None, **other):
+    return fingerprint(
+        method, model, prompt,
+        [describe_part(part) for part in contents] if contents is not None else None,
+        [describe_reference_image(ref) for ref in reference_images] if reference_images is not None else None,
+        config, other,
+    )
+
+
+class _Fixtures:
+    def __init__(self, root):
+        self.root = root
+        self.counters = {"recorded": 0, "replayed": 0, "missing": 0}
+
+    def _path(self, method, key):
+        return os.path.join(self.root, method, f"{key}.json")
+
+    def save(self, method, key, payload):
+        path = self._path(method, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+        self.counters["recorded"] += 1
+
+    def load(self, method, key):
+        try:
+            with open(self._path(method, key)) as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            self.counters["missing"] += 1
+            raise FixtureMissing(f"no recorded {method} response for this request ({key[:12]}) in {self.root}") from None
+        self.counters["replayed"] += 1
+        return payload
+
+
+_RESPONSE_TYPES = {
+    "generate_images": types.GenerateImagesResponse,
+    "edit_image": types.EditImageResponse,
+    "generate_content": types.GenerateContentResponse,
+}
+
+
+class RecordingModels:
+    """Passes calls to real ``models`` and writes each response to the fixture directory."""
+
+    def __init__(self, models, root):
+        self._models = models
+        self.fixtures = _Fixtures(root)
+
+    def _call(self, method, **request):
+        response = getattr(self._models, method)(**request)
+        self.fixtures.save(method, _request_key(method, **request), response.model_dump(mode="json", exclude_none=True))
+        return response
+
+    def generate_images(self, model, prompt, config=None):
+        return self._call("generate_images", model=model, prompt=prompt, config=config)
+
+    def edit_image(self, model, prompt, reference_images, config=None):
+        return self._call("edit_image", model=model, prompt=prompt, reference_images=reference_images, config=config)
+
+    def upscale_image(self, model, image, upscale_factor, config=None):
+        response = self._models.upscale_image(model=model, image=image, upscale_factor=upscale_factor, config=config)
+        key = _request_key("upscale_image", model, image=digest_bytes(image.image_bytes), upscale_factor=upscale_factor,
+                           config=config)
+        self.fixtures.save("upscale_image", key, response.model_dump(mode="json", exclude_none=True))
+        return response
+
+    def generate_content(self, model, contents, config=None):
+        return self._call("generate_content", model=model, contents=contents, config=config)
+
+    def generate_content_stream(self, model, contents, config=None):
+        chunks = []
+        for chunk in self._models.generate_content_stream(model=model, contents=contents, config=config):
+            chunks.append(chunk.model_dump(mode="json", exclude_none=True))
+            yield chunk
+        key = _request_key("generate_content_stream", model=model, contents=contents, config=config)
+        self.fixtures.save("generate_content_stream", key, {"chunks": chunks})
+
+
+class ReplayModels:
+    """Serves recorded responses. Unrecorded requests raise ``FixtureMissing``, or go to ``fallback``."""
+
+    def __init__(self, root, fallback=None):
+        self.fixtures = _Fixtures(root)
+        self._fallback = fallback
+
+    def _replay(self, method, **request):
+        try:
+            payload = self.fixtures.load(method, _request_key(method, **request))
+        except FixtureMissing:
+            if self._fallback is None:
+                raise
+            return getattr(self._fallback, method)(**request)
+        return _RESPONSE_TYPES[method].model_validate(payload)
+
+    def generate_images(self, model, prompt, config=None):
+        return self._replay("generate_images", model=model, prompt=prompt, config=config)
+
+    def edit_image(self, model, prompt, reference_images, config=None):
+        return self._replay("edit_image", model=model, prompt=prompt, reference_images=reference_images, config=config)
+
+    def upscale_image(self, model, image, upscale_factor, config=None):
+        key = _request_key("upscale_image", model, image=digest_bytes(image.image_bytes), upscale_factor=upscale_factor,
+                           config=config)
+        try:
+            payload = self.fixtures.load("upscale_image", key)
+        except FixtureMissing:
+            if self._fallback is None:
+                raise
+            return self._fallback.upscale_image(model=model, image=image, upscale_factor=upscale_factor, config=config)
+        return types.UpscaleImageResponse.model_validate(payload)
+
+    def generate_content(self, model, contents, config=None):
+        return self._replay("generate_content", model=model, contents=contents, config=config)
+
+    def generate_content_stream(self, model, contents, config=None):
+        key = _request_key("generate_content_stream", model=model, contents=contents, config=config)
+        try:
+            payload = self.fixtures.load("generate_content_stream", key)
+        except FixtureMissing:
+            if self._fallback is None:
+                raise
+            yield from self._fallback.generate_content_stream(model=model, contents=contents, config=config)
+            return
+        for chunk in payload["chunks"]:
+            yield types.GenerateContentResponse.model_validate(chunk)
+
+
+class RecordingGenAIClient:
+    def __init__(self, client, root):
+        self.models = RecordingModels(client.models, root)
+
+
+class ReplayGenAIClient:
+    def __init__(self, root, fallback=None):
+        self.models = ReplayModels(root, fallback=getattr(fallback, "models", None))
+
+
+def _predictions_of(response):
+    to_dict = getattr(type(response), "to_dict", None)  # proto-plus PredictResponse
+    if to_dict is not None:
+        return to_dict(response)["predictions"]
+    return [dict(prediction) for prediction in response.predictions]
+
+
+class RecordingPredictionClient:
+    def __init__(self, client, root):
+        self._client = client
+        self.fixtures = _Fixtures(root)
+
+    def predict(self, endpoint, instances, parameters=None):
+        response = self._client.predict(endpoint=endpoint, instances=instances, parameters=parameters)
+        key = _request_key("predict", endpoint, instances=instances, parameters=parameters)
+        self.fixtures.save("predict", key, {"predictions": _predictions_of(response)})
+        return response
+
+
+class ReplayPredictionClient:
+    def __init__(self, root, fallback=None):
+        self.fixtures = _Fixtures(root)
+        self._fallback = fallback
+
+    def predict(self, endpoint, instances, parameters=None):
+        key = _request_key("predict", endpoint, instances=instances, parameters=parameters)
+        try:
+            payload = self.fixtures.load("predict", key)
+        except FixtureMissing:
+            if self._fallback is None:
+                raise
+            return self._fallback.predict(endpoint=endpoint, instances=instances, parameters=parameters)
+        return FakePredictResponse(payload["predictions"])
@@ -0,0 +1,38 @@
+"""Bounded, process-wide worker pool for fanning out model calls.
+
+A request for N variations can be split into N single-image calls that run
+concurrently, so the first image is ready after one model latency instead of
+after the whole batch. All sessions share one pool so a busy replica can't
+spawn an unbounded number of threads.
+"""
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+FANOUT_MAX_WORKERS = int(os.environ.get("MEDIA_STUDIO_FANOUT_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fanout")
+
+
+def submit(fn, *args, **kwargs):
+    """Schedules ``fn(*args, **kwargs)`` on the shared pool and returns its future.
+
+    ``fn`` runs in a copy of the caller's context, so context variables such as
+    the rate limiter's wait reporter follow it into the worker.
+    """
+    return _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def iter_variations(call_variation, count):
+    """Runs ``call_variation(i)`` for ``i`` in ``range(count)`` concurrently.
+
+    Yields ``(i, result, error)`` in completion order; exactly one of ``result``
+    and ``error`` is set, so one failed variation never hides the others.
+    """
+    futures = {submit(call_variation, i): i for i in range(count)}
+    for future in as_completed(futures):
+        i = futures[future]
+        try:
+            yield i, future.result(), None
+        except Exception as e:
+            yield i, None, e
@@ -0,0 +1,176 @@
+"""Gemini calls shared by the pages.
+
+Like ``backend.imagen``: pages call ``generate_content`` here instead of
+``client.models.generate_content`` so rate limiting, metrics and coalescing
+of identical in-flight requests apply everywhere. ``generate_text`` also keeps
+the answer in the on-disk cache, and ``stream_text`` does the same while
+handing the answer to the page chunk by chunk as it arrives.
+"""
+import threading
+import time
+
+from backend import metrics, ratelimit
+from backend.cache import describe_part, fingerprint, generate_content_cache
+from backend.singleflight import SingleFlight
+
+generate_content_flights = SingleFlight("generate_content")
+stream_flights = SingleFlight("generate_content_stream")
+
+_stream_lock = threading.Lock()
+stream_counters = {
+    "streams": 0, "chunks": 0,
+    "ttft_seconds_total": 0.0, "ttft_seconds_max": 0.0,
+    "latency_seconds_total": 0.0, "latency_seconds_max": 0.0,
+}
+
+
+def _content_bytes(contents):
+    """Rough request size: inline data plus text of every part."""
+    size = 0
+    for part in contents:
+        inline_data = getattr(part, "inline_data", None)
+        if inline_data is not None and inline_data.data is not None:
+            size += len(inline_data.data)
+        size += len((getattr(part, "text", None) or "").encode("utf-8"))
+    return size
+
+
+def _safety_blocked(response):
+    feedback = getattr(response, "prompt_feedback", None)
+    if feedback is not None and getattr(feedback, "block_reason", None):
+        return True
+    candidates = getattr(response, "candidates", None) or []
+    return any(str(getattr(c, "finish_reason", "")).endswith("SAFETY") for c in candidates)
+
+
+def _summarize(response):
+    """Metrics summary of a response: (bytes, images, filtered)."""
+    return len((response_text(response) or "").encode("utf-8")), 0, int(_safety_blocked(response))
+
+
+def generate_content(client, model, contents, config=None):
+    """Rate-limited ``client.models.generate_content``; returns the response.
+
+    Requests identical to one already in flight (same model, contents and
+    config) wait for it and get its response instead of calling the model.
+    """
+    key = fingerprint("generate_content", model, [describe_part(part) for part in contents], config)
+    response, _ = generate_content_flights.do(
+        key,
+        lambda: ratelimit.call(
+            model,
+            metrics.observed("generate_content", model, client.models.generate_content,
+                             request_bytes=_content_bytes(contents), summarize=_summarize),
+            model=model, contents=contents, config=config,
+        ),
+    )
+    return response
+
+
+def response_text(response):
+    """Text of a ``generate_content`` response, or None if it has none."""
+    text = getattr(response, 'text', None)
+    candidates = getattr(response, 'candidates', None)
+    content = candidates[0].content if candidates else None
+    if not text and content is not None and content.parts:
+        text = "".join(p.text for p in content.parts if getattr(p, 'text', None))
+    return text
+
+
+def _text_key(model, contents, config):
+    return fingerprint("generate_text", model, [describe_part(part) for part in contents], config)
+
+
+def generate_text(client, model, contents, config=None, bypass_cache=False):
+    """Cached text answer of ``generate_content``.
+
+    Returns ``(text, from_cache)``. The key covers the model, every content
+    part (inline images by the SHA-256 of their bytes) and the config, which
+    holds the system instruction, so changing any of them is a miss.
+    ``bypass_cache=True`` asks the model again (for a different answer) and
+    replaces the cached one. Empty answers are not stored.
+    """
+    key = _text_key(model, contents, config)
+    if bypass_cache:
+        generate_content_cache.note_bypass()
+    else:
+        blobs = generate_content_cache.get(key)
+        if blobs is not None:
+            return blobs[0][0].decode("utf-8"), True
+
+    text = response_text(generate_content(client, model, contents, config=config))
+    if text and text.strip():
+        generate_content_cache.put(key, [(text.encode("utf-8"), "text/plain")])
+    return text, False
+
+
+def _record_stream(chunks, ttft, latency):
+    with _stream_lock:
+        stream_counters["streams"] += 1
+        stream_counters["chunks"] += chunks
+        stream_counters["ttft_seconds_total"] += ttft
+        stream_counters["ttft_seconds_max"] = max(stream_counters["ttft_seconds_max"], ttft)
+        stream_counters["latency_seconds_total"] += latency
+        stream_counters["latency_seconds_max"] = max(stream_counters["latency_seconds_max"], latency)
+
+
+def stream_text(client, model, contents, config=None, bypass_cache=False, on_text=None):
+    """Like ``generate_text``, but streamed with ``generate_content_stream``.
+
+    Returns ``(text, from_cache, timings)``. ``on_text(text_so_far)`` is called
+    after every chunk, so the page can show the answer while it is written.
+    ``timings`` holds ``ttft`` (seconds until the first text) and ``total``
+    (seconds until the stream ended), measured from after the rate-limit
+    queue; it is None for cache hits. Shares cache entries with
+    ``generate_text``. Callers that join an identical stream already in
+    flight only get the finished text (and the leader's timings).
+    """
+    key = _text_key(model, contents, config)
+    if bypass_cache:
+        generate_content_cache.note_bypass()
+    else:
+        blobs = generate_content_cache.get(key)
+        if blobs is not None:
+            text = blobs[0][0].decode("utf-8")
+            if on_text is not None:
+                on_text(text)
+            return text, True, None
+
+    def consume():
+        # Quota errors come back before the first chunk, so a retry starts from scratch.
+        started = time.monotonic()
+        ttft = None
+        pieces = []
+        for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+            piece = response_text(chunk)
+            if not piece:
+                continue
+            if ttft is None:
+                ttft = time.monotonic() - started
+            pieces.append(piece)
+            if on_text is not None:
+                on_text("".join(pieces))
+        total = time.monotonic() - started
+        _record_stream(len(pieces), ttft if ttft is not None else total, total)
+        if ttft is not None:
+            metrics.FIRST_TOKEN_SECONDS.observe(ttft, method="generate_content_stream", model=model, page=metrics.current_page())
+        return "".join(pieces), {"ttft": ttft, "total": total}
+
+    stream = metrics.observed(
+        "generate_content_stream", model, consume, request_bytes=_content_bytes(contents),
+        summarize=lambda result: (len(result[0].encode("utf-8")), 0, 0),
+    )
+    (text, timings), _ = stream_flights.do(key, lambda: ratelimit.call(model, stream))
+    if text and text.strip():
+        generate_content_cache.put(key, [(text.encode("utf-8"), "text/plain")])
+    return text, False, timings
+
+
+def stream_stats():
+    with _stream_lock:
+        streams = stream_counters["streams"]
+        return {
+            **stream_counters,
+            "ttft_seconds_avg": round(stream_counters["ttft_seconds_total"] / streams, 3) if streams else None,
+            "latency_seconds_avg": round(stream_counters["latency_seconds_total"] / streams, 3) if streams else None,
+        }
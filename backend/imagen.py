@@ -0,0 +1,180 @@
+"""Imagen calls shared by the pages.
+
+Pages call these helpers instead of ``client.models.*`` directly so that
+caching, coalescing of identical in-flight calls, rate limiting and metrics
+(and anything else that has to sit in front of the model) are applied the
+same way everywhere.
+"""
+import io
+
+from backend import metrics, ratelimit
+from backend.cache import describe_reference_image, digest_bytes, edit_image_cache, fingerprint, generate_images_cache
+from backend.sdk import types
+from backend.singleflight import SingleFlight
+
+generate_images_flights = SingleFlight("generate_images")
+edit_image_flights = SingleFlight("edit_image")
+upscale_image_flights = SingleFlight("upscale_image")
+
+
+def _response_from_blobs(blobs, response_type=None):
+    response_type = response_type or types.GenerateImagesResponse
+    return response_type(
+        generated_images=[
+            types.GeneratedImage(image=types.Image(image_bytes=data, mime_type=mime_type))
+            for data, mime_type in blobs
+        ]
+    )
+
+
+def _blobs_from_response(response):
+    blobs = []
+    for generated in response.generated_images or []:
+        image = getattr(generated, "image", None)
+        if image is not None and image.image_bytes:
+            blobs.append((image.image_bytes, image.mime_type or "image/png"))
+    return blobs
+
+
+def _summarize(config):
+    """Metrics summary of an image response: (bytes, images, filtered)."""
+    requested = getattr(config, "number_of_images", None) or 1
+
+    def summarize(response):
+        blobs = _blobs_from_response(response)
+        return sum(len(data) for data, _ in blobs), len(blobs), max(0, requested - len(blobs))
+
+    return summarize
+
+
+def image_bytes_of(generated_img_info):
+    """Returns displayable bytes for one entry of ``response.generated_images``."""
+    if hasattr(generated_img_info, 'image_bytes') and generated_img_info.image_bytes:
+        return generated_img_info.image_bytes
+    image = getattr(generated_img_info, 'image', None)
+    if image is not None and getattr(image, 'image_bytes', None):
+        return image.image_bytes
+    if image is not None and hasattr(image, '_pil_image') and image._pil_image:
+        # If SDK gives a PIL image, convert to bytes. Lossless for download, but with the
+        # fastest zlib level; the display uses a preview anyway.
+        buf = io.BytesIO()
+        image._pil_image.save(buf, format="PNG", compress_level=1)
+        return buf.getvalue()
+    return None
+
+
+def _variation_part(variation):
+    # Left out of the key when unset, so existing cache entries stay valid.
+    return () if variation is None else ({"variation": variation},)
+
+
+def generate_images(client, model, prompt, config, bypass_cache=False, variation=None):
+    """Cached ``client.models.generate_images``.
+
+    Returns ``(response, from_cache)``. Identical (model, prompt, config)
+    requests are served from the on-disk cache; ``bypass_cache=True`` always
+    calls the model (for fresh variations) and replaces the cached entry.
+    Identical requests already in flight share one model call. Fan-outs of an
+    unseeded config pass the variation index as ``variation`` so their split
+    calls stay distinct.
+    """
+    key = fingerprint("generate_images", model, prompt, config, *_variation_part(variation))
+    if bypass_cache:
+        generate_images_cache.note_bypass()
+    else:
+        blobs = generate_images_cache.get(key)
+        if blobs is not None:
+            return _response_from_blobs(blobs), True
+
+    def call_model():
+        generate = metrics.observed(
+            "generate_images", model, client.models.generate_images,
+            request_bytes=len((prompt or "").encode("utf-8")), summarize=_summarize(config),
+        )
+        response = ratelimit.call(model, generate, model=model, prompt=prompt, config=config)
+        generate_images_cache.put(key, _blobs_from_response(response))
+        return response
+
+    response, _ = generate_images_flights.do(key, call_model)
+    return response, False
+
+
+def edit_image(client, model, prompt, reference_images, config, bypass_cache=False, variation=None):
+    """Cached ``client.models.edit_image``.
+
+    Returns ``(response, from_cache)``. The key covers the SHA-256 of every
+    reference image's bytes plus its type/config, the prompt and the edit
+    config (mode, seed, ...). Only seeded requests are deterministic, so calls
+    without ``config.seed`` always go to the model and are never stored; they
+    are still coalesced with identical requests in flight.
+    """
+    cacheable = getattr(config, "seed", None) is not None
+    key = fingerprint(
+        "edit_image",
+        model,
+        prompt,
+        [describe_reference_image(ref) for ref in reference_images],
+        config,
+        *_variation_part(variation),
+    )
+    if cacheable:
+        if bypass_cache:
+            edit_image_cache.note_bypass()
+        else:
+            blobs = edit_image_cache.get(key)
+            if blobs is not None:
+                return _response_from_blobs(blobs, types.EditImageResponse), True
+
+    def call_model():
+        request_bytes = len((prompt or "").encode("utf-8")) + sum(
+            len(ref.reference_image.image_bytes or b"") for ref in reference_images if ref.reference_image is not None
+        )
+        edit = metrics.observed(
+            "edit_image", model, client.models.edit_image,
+            request_bytes=request_bytes, summarize=_summarize(config),
+        )
+        response = ratelimit.call(
+            model, edit,
+            model=model, prompt=prompt, reference_images=reference_images, config=config,
+        )
+        if cacheable:
+            edit_image_cache.put(key, _blobs_from_response(response))
+        return response
+
+    response, _ = edit_image_flights.do(key, call_model)
+    return response, False
+
+
+def upscale_image(client, model, image_bytes, upscale_factor="x2", mime_type="image/png"):
+    """``client.models.upscale_image`` with the same rate limiting and metrics.
+
+    Returns ``(response, from_cache)`` like the other helpers. Not cached:
+    upscales are only asked for once per kept image; identical requests in
+    flight are still coalesced.
+    """
+    key = fingerprint("upscale_image", model, digest_bytes(image_bytes), upscale_factor)
+
+    def call_model():
+        upscale = metrics.observed(
+            "upscale_image", model, client.models.upscale_image,
+            request_bytes=len(image_bytes), summarize=_summarize(None),
+        )
+        return ratelimit.call(
+            model, upscale,
+            model=model, image=types.Image(image_bytes=image_bytes, mime_type=mime_type), upscale_factor=upscale_factor,
+        )
+
+    response, _ = upscale_image_flights.do(key, call_model)
+    return response, False
+
+
+def variation_config(config, index):
+    """Single-image copy of ``config`` for variation ``index`` of a fan-out.
+
+    Seeded configs get ``seed + index``; otherwise every split call would
+    return the same image.
+    """
+    update = {"number_of_images": 1}
+    if getattr(config, "seed", None) is not None:
+        update["seed"] = config.seed + index
+    return config.model_copy(update=update)
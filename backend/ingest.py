@@ -0,0 +1,150 @@
+"""Upload ingestion: downsize and recompress images before they go to Vertex AI.
+
+Phone photos are often 12 MP / 8 MB while the models work at a much lower
+resolution, so sending them as-is mostly costs upload time. ``ingest_upload``
+reads just the header to get the dimensions, applies the EXIF orientation,
+downsizes to the target model's maximum edge and re-encodes at a configurable
+quality. Results are cached per (upload digest, settings).
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from backend import metrics
+from backend.cache import digest_bytes
+
+# Longest edge we send to each model; anything larger is downsized.
+MODEL_MAX_EDGE = {
+    "imagen-3.0-capability-001": 1536,
+    "gemini-2.0-flash": 1024,
+    "virtual-try-on-exp-05-31": 1536,
+}
+DEFAULT_MAX_EDGE = int(os.environ.get("MEDIA_STUDIO_INGEST_MAX_EDGE", "2048"))
+INGEST_FORMAT = os.environ.get("MEDIA_STUDIO_INGEST_FORMAT", "JPEG").upper()  # JPEG or WEBP
+INGEST_QUALITY = int(os.environ.get("MEDIA_STUDIO_INGEST_QUALITY", "90"))
+INGEST_CACHE_MB = int(os.environ.get("MEDIA_STUDIO_INGEST_CACHE_MB", "256"))
+# Uploads below this size that need no resize/rotation are sent untouched.
+PASSTHROUGH_KB = int(os.environ.get("MEDIA_STUDIO_INGEST_PASSTHROUGH_KB", "1024"))
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+_EXIF_ORIENTATION = 0x0112
+
+
+@dataclass(frozen=True)
+class IngestedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    original_width: int
+    original_height: int
+
+    def summary(self):
+        if self.data_unchanged:
+            return f"{self.width}×{self.height}, {self.original_bytes / 1e6:.1f} MB (sent as uploaded)"
+        return (f"{self.original_width}×{self.original_height}, {self.original_bytes / 1e6:.1f} MB → "
+                f"{self.width}×{self.height}, {len(self.data) / 1e6:.2f} MB")
+
+    @property
+    def data_unchanged(self):
+        return len(self.data) == self.original_bytes and (self.width, self.height) == (self.original_width, self.original_height)
+
+
+# --- Per-digest result cache ---
+_cache_lock = threading.Lock()
+_cache = OrderedDict()  # key -> IngestedImage
+_cache_bytes = 0
+counters = {"hits": 0, "misses": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def _cache_get(key):
+    with _cache_lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+            counters["hits"] += 1
+        return result
+
+
+def _cache_put(key, result):
+    global _cache_bytes
+    with _cache_lock:
+        counters["misses"] += 1
+        counters["bytes_in"] += result.original_bytes
+        counters["bytes_out"] += len(result.data)
+        _cache[key] = result
+        _cache_bytes += len(result.data)
+        while _cache_bytes > INGEST_CACHE_MB * 1024 * 1024 and len(_cache) > 1:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted.data)
+
+
+def stats():
+    with _cache_lock:
+        return {**counters, "entries": len(_cache), "cached_bytes": _cache_bytes}
+
+
+# --- Ingestion ---
+def ingest_upload(data, model=None, max_edge=None, image_format=None, quality=None):
+    """Returns an ``IngestedImage`` ready to send to ``model``.
+
+    ``image_format`` forces the output format (e.g. "PNG" for control/edge
+    images that must stay lossless). Images that are already small enough,
+    upright and not worth recompressing are passed through untouched.
+    """
+    max_edge = max_edge or MODEL_MAX_EDGE.get(model, DEFAULT_MAX_EDGE)
+    image_format = (image_format or INGEST_FORMAT).upper()
+    quality = quality or INGEST_QUALITY
+    key = (digest_bytes(data), max_edge, image_format, quality)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    with metrics.stage("encode", model=model or ""):
+        result = _encode(data, max_edge, image_format, quality)
+    _cache_put(key, result)
+    return result
+
+
+def _encode(data, max_edge, image_format, quality):
+    from PIL import Image as PILImage, ImageOps
+
+    # Image.open only parses the header; pixels are decoded on first access.
+    img = PILImage.open(io.BytesIO(data))
+    original_width, original_height = img.size
+    orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+    needs_resize = max(img.size) > max_edge
+    source_format = img.format
+    sendable_as_is = not needs_resize and orientation == 1 and source_format in _MIME_TYPES
+
+    if sendable_as_is and len(data) <= PASSTHROUGH_KB * 1024:
+        return IngestedImage(data, _MIME_TYPES[source_format], *img.size, len(data), *img.size)
+
+    if needs_resize and source_format == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size.
+        img.draft("RGB", (max_edge, max_edge))
+    img = ImageOps.exif_transpose(img)
+    if needs_resize:
+        img.thumbnail((max_edge, max_edge), PILImage.LANCZOS)
+
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if has_alpha and image_format == "JPEG":
+        image_format = "PNG"  # keep cut-out transparency instead of flattening it
+    if image_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+
+    buf = io.BytesIO()
+    if image_format == "PNG":
+        img.save(buf, format="PNG", optimize=True)
+    else:
+        img.save(buf, format=image_format, quality=quality)
+    encoded = buf.getvalue()
+
+    if sendable_as_is and len(encoded) >= len(data):
+        # Recompressing didn't help; keep the original bytes.
+        return IngestedImage(data, _MIME_TYPES[source_format], original_width, original_height,
+                             len(data), original_width, original_height)
+    return IngestedImage(encoded, _MIME_TYPES[image_format], *img.size,
+                         len(data), original_width, original_height)
@@ -0,0 +1,268 @@
+"""Background jobs for long generations.
+
+Pages used to run model calls inline under ``st.spinner``: the session froze
+for the whole call and a rerun could abandon the work. A job is submitted
+instead and runs on a shared worker pool; the page keeps only the job ID and
+polls it (see ``ui.show_jobs``), so it survives reruns and page switches and
+can be cancelled.
+
+Job state and outputs are written under ``JOB_DIR`` (one directory per job),
+so a finished try-on or background batch can be opened again later by its ID,
+also after a restart. Jobs that were still running when the process stopped
+come back as "interrupted". Jobs older than ``JOB_TTL_HOURS`` are deleted.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+
+from backend import fanout, metrics
+from backend.cache import CACHE_DIR
+from backend.imagen import image_bytes_of
+
+JOB_DIR = os.environ.get("MEDIA_STUDIO_JOB_DIR", os.path.join(CACHE_DIR, "jobs"))
+JOB_WORKERS = int(os.environ.get("MEDIA_STUDIO_JOB_WORKERS", "8"))
+JOB_TTL_HOURS = float(os.environ.get("MEDIA_STUDIO_JOB_TTL_HOURS", "72"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+FINISHED = {DONE, FAILED, CANCELLED, INTERRUPTED}
+
+_MIME_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function once the job has been cancelled."""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    label: str
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    total: int = 0
+    done: int = 0
+    outputs: list = field(default_factory=list)  # [{"index", "file", "mime_type", "caption"}]
+    errors: list = field(default_factory=list)  # per-item messages; the job can still finish
+    error: str = None  # why the whole job failed
+
+
+class JobContext:
+    """Handed to the job function to report progress and store outputs."""
+
+    def __init__(self, job_id, cancel_event):
+        self.job_id = job_id
+        self._cancel_event = cancel_event
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def progress(self, done, total=None):
+        _update(self.job_id, done=done, **({} if total is None else {"total": total}))
+
+    def add_output(self, index, data, mime_type="image/png", caption=None):
+        """Writes one output image to the job directory."""
+        name = f"{index}{_MIME_EXTENSIONS.get(mime_type, '.bin')}"
+        _write_file(os.path.join(_job_dir(self.job_id), name), data)
+        with _lock:
+            job = _jobs[self.job_id]
+            job.outputs = sorted(
+                [o for o in job.outputs if o["index"] != index]
+                + [{"index": index, "file": name, "mime_type": mime_type, "caption": caption}],
+                key=lambda o: o["index"],
+            )
+            _save(job)
+
+    def add_error(self, message):
+        with _lock:
+            job = _jobs[self.job_id]
+            job.errors = job.errors + [message]
+            _save(job)
+
+
+# --- State ---
+_lock = threading.Lock()
+_jobs = {}  # job_id -> Job
+_cancel_events = {}  # job_id -> threading.Event
+_futures = {}  # job_id -> Future
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+def _job_dir(job_id):
+    return os.path.join(JOB_DIR, job_id)
+
+
+def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _save(job):
+    """Persists ``job`` (call with ``_lock`` held)."""
+    _write_file(os.path.join(_job_dir(job.id), "job.json"), json.dumps(asdict(job)).encode("utf-8"))
+
+
+def _update(job_id, **changes):
+    with _lock:
+        job = _jobs[job_id]
+        for name, value in changes.items():
+            setattr(job, name, value)
+        _save(job)
+
+
+def _load_all():
+    """Reads persisted jobs back; unfinished ones are marked interrupted, expired ones removed."""
+    if not os.path.isdir(JOB_DIR):
+        return
+    cutoff = time.time() - JOB_TTL_HOURS * 3600
+    for job_id in os.listdir(JOB_DIR):
+        path = os.path.join(_job_dir(job_id), "job.json")
+        try:
+            with open(path) as f:
+                job = Job(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            continue
+        if job.created < cutoff:
+            shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+            continue
+        if job.status not in FINISHED:
+            job.status, job.finished = INTERRUPTED, time.time()
+            job.error = "the app restarted before this job finished"
+            _save(job)
+        _jobs[job_id] = job
+
+
+# --- Running ---
+def _run(job_id, fn, page):
+    cancel_event = _cancel_events[job_id]
+    if cancel_event.is_set():
+        return
+    _update(job_id, status=RUNNING, started=time.time())
+    try:
+        with metrics.page_scope(page):
+            fn(JobContext(job_id, cancel_event))
+    except JobCancelled:
+        _update(job_id, status=CANCELLED, finished=time.time())
+    except Exception as e:
+        _update(job_id, status=FAILED, finished=time.time(), error=f"{type(e).__name__}: {e}")
+    else:
+        with _lock:
+            job = _jobs[job_id]
+        if cancel_event.is_set():
+            status = CANCELLED
+        elif job.errors and not job.outputs:
+            status = FAILED
+        else:
+            status = DONE
+        _update(job_id, status=status, finished=time.time(), done=job.total or job.done)
+    finally:
+        with _lock:
+            _futures.pop(job_id, None)
+
+
+def submit(kind, label, fn, total=0):
+    """Queues ``fn(ctx)`` (``ctx`` is a ``JobContext``) and returns the new job's ID right away."""
+    job = Job(id=uuid.uuid4().hex[:12], kind=kind, label=label, total=total)
+    with _lock:
+        _jobs[job.id] = job
+        _cancel_events[job.id] = threading.Event()
+        _save(job)
+        # Only the metrics page label follows the job; the rest of the page's context stays behind.
+        _futures[job.id] = _executor.submit(_run, job.id, fn, metrics.current_page())
+    return job.id
+
+
+def submit_variations(kind, label, call_variation, count, caption):
+    """Runs a fan-out (``call_variation(i)`` returns ``(response, from_cache)``) as a job.
+
+    Each finished variation is stored as an output right away, so the page can
+    show partial results while the rest is still running.
+    """
+    def run(ctx):
+        def guarded(i):
+            ctx.check_cancelled()  # variations still waiting for a worker are skipped
+            return call_variation(i)
+
+        finished = 0
+        for i, result, error in fanout.iter_variations(guarded, count):
+            finished += 1
+            if isinstance(error, JobCancelled) or ctx.cancelled:
+                raise JobCancelled()
+            if error is not None:
+                ctx.add_error(f"{caption} {i+1} failed: {error}")
+            else:
+                response, _ = result
+                output_bytes = image_bytes_of(response.generated_images[0]) if response.generated_images else None
+                if output_bytes:
+                    ctx.add_output(i, output_bytes, caption=f"{caption} {i+1}")
+                else:
+                    ctx.add_error(f"{caption} {i+1}: no image returned (it may have been filtered).")
+            ctx.progress(finished)
+
+    return submit(kind, label, run, total=count)
+
+
+def cancel(job_id):
+    """Asks a job to stop. Queued jobs never start; running ones stop at their next check."""
+    with _lock:
+        event = _cancel_events.get(job_id)
+        future = _futures.get(job_id)
+    if event is None:
+        return False
+    event.set()
+    if future is not None and future.cancel():
+        _update(job_id, status=CANCELLED, finished=time.time())
+    return True
+
+
+# --- Reading ---
+def get(job_id):
+    """Snapshot of the job, or None if it is unknown (or expired)."""
+    with _lock:
+        job = _jobs.get(job_id)
+        return replace(job, outputs=list(job.outputs), errors=list(job.errors)) if job else None
+
+
+def read_output(job_id, index):
+    with _lock:
+        job = _jobs.get(job_id)
+        output = next((o for o in job.outputs if o["index"] == index), None) if job else None
+    if output is None:
+        return None
+    with open(os.path.join(_job_dir(job_id), output["file"]), "rb") as f:
+        return f.read()
+
+
+def output_path(job_id, output):
+    return os.path.join(_job_dir(job_id), output["file"])
+
+
+def stats():
+    with _lock:
+        by_status = {}
+        for job in _jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {"jobs": len(_jobs), "by_status": by_status, "workers": JOB_WORKERS}
+
+
+_load_all()
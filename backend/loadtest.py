@@ -0,0 +1,286 @@
+"""Multi-session load test of the Streamlit scripts, via ``streamlit.testing.v1.AppTest``.
+
+Every simulated session runs ``Home.py`` and each ``pages/*.py`` headlessly:
+first load, fill in the inputs, press Generate, then one plain rerun (the
+redraw every later interaction pays). Model calls go to the fake backend
+(``MEDIA_STUDIO_BACKEND=fake``, see ``backend.fakes``), so this measures the
+app itself: run latency per page and step, process CPU saturation and RSS
+growth per session.
+
+    python -m backend.loadtest --sessions 8
+    python -m backend.loadtest --sessions 16 --iterations 3 --pages Logo_Generator,Virtual_Try_On --json load.json
+
+The JSON report carries the commit it ran on, so reports from different
+commits can be compared directly.
+"""
+import os
+
+# Read at import time by the backend modules, so set before importing them.
+os.environ.setdefault("MEDIA_STUDIO_BACKEND", "fake")
+os.environ.setdefault("MEDIA_STUDIO_FAKE_PROFILE", "realistic")
+os.environ.setdefault("MEDIA_STUDIO_FAKE_TIME_SCALE", "0.05")
+
+import argparse
+import glob
+import json
+import resource
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+from backend.bench import latency_summary  # also moves the cache to a temp dir and lifts rate limits
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_INTERVAL_SECONDS = 0.5
+
+
+def _sample_png():
+    import io
+    from PIL import Image as PILImage
+    buf = io.BytesIO()
+    PILImage.new("RGB", (768, 1024), (180, 150, 120)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+# --- Scenarios: fill the inputs and press Generate ---
+# AppTest can't drive file uploaders, so uploads are put in the blob store and
+# their handles seeded into session state, the way the pages keep them.
+def _button(at, label_prefix=None, key=None):
+    for button in at.button:
+        if (key is not None and button.key == key) or (label_prefix is not None and button.label.startswith(label_prefix)):
+            return button
+    raise LookupError(f"no button {key or label_prefix!r}")
+
+
+def _generate_page(at, handles):
+    at.text_input[0].set_value("Fall collection launch").run()
+    _button(at, "Generate").click().run()
+
+
+def _background(at, handles):
+    at.session_state["bg_edit_image_handle"] = handles["image"]
+    at.run()
+    at.text_input(key="bg_edit_prompt_input").set_value("A white studio backdrop").run()
+    _button(at, key="submit_bg_edit").click().run()
+
+
+def _transpose(at, handles):
+    at.session_state["subject_img_handle"] = handles["image"]
+    at.session_state["cannyedge_img_handle"] = handles["image"]
+    at.run()
+    at.text_input(key="user_prompt").set_value("Make it navy blue").run()
+    _button(at, "Generate customized").click().run()
+
+
+def _product(at, handles):
+    at.session_state["uploaded_subject_image_details"] = [
+        {"handle": handles["image"], "type": handles["image"].mime_type, "name": "product.png"}
+    ]
+    at.run()
+    _button(at, key="gemini_prompt_button").click().run()
+    _button(at, key="imagen_generate_button").click().run()
+
+
+def _vto(at, handles):
+    at.session_state["vto_model_handle"] = handles["image"]
+    at.session_state["vto_prod_handle"] = handles["image"]
+    at.run()
+    _button(at, "Generate try-on").click().run()
+
+
+SCENARIOS = {
+    "Logo_Generator": _generate_page,
+    "Custom_Greeting_Cards": _generate_page,
+    "Moodboard_Generator": _generate_page,
+    "Background_Editor": _background,
+    "Transpose_Customize_Item": _transpose,
+    "Product_Subject_Customization": _product,
+    "Virtual_Try_On": _vto,
+}
+
+
+def scripts():
+    """name -> path for ``Home.py`` and every page."""
+    found = {"Home": os.path.join(REPO_DIR, "Home.py")}
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, "pages", "*.py"))):
+        found[os.path.splitext(os.path.basename(path))[0]] = path
+    return found
+
+
+# --- Process sampling ---
+def rss_mb():
+    """Current resident set size (peak RSS where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class Sampler(threading.Thread):
+    """Samples process CPU use (share of all cores) and RSS until stopped."""
+
+    def __init__(self):
+        super().__init__(name="loadtest-sampler", daemon=True)
+        self.cpu, self.rss = [], []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        cores = os.cpu_count() or 1
+        last_wall, last_cpu = time.perf_counter(), time.process_time()
+        while not self._stop_event.wait(SAMPLE_INTERVAL_SECONDS):
+            wall, cpu = time.perf_counter(), time.process_time()
+            self.cpu.append((cpu - last_cpu) / (wall - last_wall) / cores)
+            self.rss.append(rss_mb())
+            last_wall, last_cpu = wall, cpu
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# --- Running ---
+def run(pages, sessions, iterations, timeout):
+    """Runs ``sessions`` concurrent sessions through ``pages`` ``iterations`` times. Returns the report."""
+    from streamlit.testing.v1 import AppTest
+
+    from backend import uploads
+
+    paths = scripts()
+    timings = {}  # (page, step) -> [seconds]
+    errors = []
+    outputs = {}  # page -> downloads shown after Generate, summed over runs
+    lock = threading.Lock()
+
+    def timed(page, step, fn):
+        started = time.perf_counter()
+        fn()
+        with lock:
+            timings.setdefault((page, step), []).append(time.perf_counter() - started)
+
+    def session_loop(index):
+        handles = {"image": uploads.register(f"loadtest-{index}", "image", _sample_png(), mime_type="image/png")}
+        for _ in range(iterations):
+            for page in pages:
+                at = AppTest.from_file(paths[page], default_timeout=timeout)
+                try:
+                    timed(page, "load", at.run)
+                    scenario = SCENARIOS.get(page)
+                    if scenario is not None:
+                        timed(page, "generate", lambda: scenario(at, handles))
+                    timed(page, "rerun", at.run)  # results recorded by Generate show up here
+                    problems = [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+                    if scenario is not None:
+                        shown = len(at.get("download_button"))
+                        with lock:
+                            outputs[page] = outputs.get(page, 0) + shown
+                        if not shown:
+                            problems.append("Generate produced no downloadable output")
+                except Exception:
+                    problems = [traceback.format_exc(limit=3)]
+                if problems:
+                    with lock:
+                        errors.append({"session": index, "page": page, "errors": problems})
+
+    rss_before = rss_mb()
+    sampler = Sampler()
+    sampler.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=session_loop, args=(i,), name=f"loadtest-session-{i}") for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    sampler.stop()
+    rss_after = rss_mb()
+
+    steps = {}
+    for (page, step), seconds in sorted(timings.items()):
+        steps.setdefault(page, {})[step] = {"runs": len(seconds), "seconds": latency_summary(seconds)}
+    for page, shown in outputs.items():
+        steps[page]["outputs"] = shown
+    runs = sum(len(seconds) for seconds in timings.values())
+    return {
+        "commit": _commit(),
+        "config": {
+            "sessions": sessions, "iterations": iterations, "pages": pages,
+            "backend": os.environ["MEDIA_STUDIO_BACKEND"], "fake_profile": os.environ["MEDIA_STUDIO_FAKE_PROFILE"],
+            "fake_time_scale": float(os.environ["MEDIA_STUDIO_FAKE_TIME_SCALE"]), "cpus": os.cpu_count(),
+        },
+        "wall_seconds": round(wall, 3),
+        "script_runs": runs,
+        "script_runs_per_second": round(runs / wall, 3) if wall else None,
+        "pages": steps,
+        "cpu": {
+            "mean": round(sum(sampler.cpu) / len(sampler.cpu), 3) if sampler.cpu else None,
+            "max": round(max(sampler.cpu), 3) if sampler.cpu else None,
+            "saturated_share": round(sum(1 for c in sampler.cpu if c >= 0.9) / len(sampler.cpu), 3) if sampler.cpu else None,
+        },
+        "rss_mb": {
+            "before": round(rss_before, 1),
+            "after": round(rss_after, 1),
+            "peak": round(max(sampler.rss + [rss_after]), 1),
+            "growth_per_session": round((rss_after - rss_before) / sessions, 2),
+        },
+        "errors": errors,
+    }
+
+
+def print_report(report, out=sys.stdout):
+    config = report["config"]
+    print(f"{config['sessions']} sessions x {config['iterations']} iterations, "
+          f"{report['script_runs']} script runs in {report['wall_seconds']}s", file=out)
+    print(f"{'page':<32} {'step':<9} {'p50':>7} {'p95':>7} {'p99':>7}", file=out)
+    for page, steps in report["pages"].items():
+        for step, result in steps.items():
+            if step == "outputs":
+                continue
+            seconds = result["seconds"]
+            print(f"{page:<32} {step:<9} {seconds['p50']:>7.3f} {seconds['p95']:>7.3f} {seconds['p99']:>7.3f}", file=out)
+    cpu, rss = report["cpu"], report["rss_mb"]
+    print(f"CPU mean {cpu['mean']} / max {cpu['max']} of all cores; RSS {rss['before']} -> {rss['after']} MB "
+          f"(peak {rss['peak']}, {rss['growth_per_session']} MB per session)", file=out)
+    if report["errors"]:
+        print(f"{len(report['errors'])} page runs had errors; see the JSON report", file=out)
+
+
+def main(argv=None):
+    available = list(scripts())
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent simulated sessions")
+    parser.add_argument("--iterations", type=int, default=1, help="Passes over the pages per session")
+    parser.add_argument("--pages", default=",".join(available), help=f"Comma-separated, from {', '.join(available)}")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds one script run may take")
+    parser.add_argument("--json", metavar="PATH", help="Write the report as JSON ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    pages = [page.strip() for page in args.pages.split(",") if page.strip()]
+    unknown = [page for page in pages if page not in available]
+    if unknown:
+        parser.error(f"unknown pages: {', '.join(unknown)}")
+
+    report = run(pages, args.sessions, args.iterations, args.timeout)
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""Prometheus-style metrics for model calls and local processing stages.
+
+Every model call (``generate_images``, ``edit_image``, ``generate_content``,
+``predict``) goes through ``observed``, which records its latency, request
+and response payload sizes, images returned, safety-filtered images and
+errors by type. Local work (encoding, decoding, preview rendering) is timed
+with ``stage``. Everything is labeled by page and model. While a script run
+is being profiled (``backend.profiler``), the same measurements are also
+appended to that run's trace.
+
+The text exposition format is served on ``http://METRICS_HOST:METRICS_PORT/metrics``
+from a daemon thread. The app starts it (``serve()`` in ``ui.page_setup`` at the
+top of every page, and in ``backend.warmup --serve``); importing this module
+doesn't, so the CLIs and tests that import the backend never bind the port.
+Set ``MEDIA_STUDIO_METRICS_PORT=0`` to turn it off. Replicas sharing a host
+need one port each. Kept dependency-free
+(no ``prometheus_client``), so only counters and histograms are supported.
+"""
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = os.environ.get("MEDIA_STUDIO_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("MEDIA_STUDIO_METRICS_PORT", "9464"))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BYTES_BUCKETS = tuple(1024 * 4 ** n for n in range(9))  # 1 KiB .. 64 MiB
+
+_page = contextvars.ContextVar("metrics_page", default="unknown")
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def set_page(page):
+    """Labels metrics recorded by this script run (and the workers it starts) with ``page``."""
+    _page.set(page)
+
+
+def current_page():
+    return _page.get()
+
+
+@contextmanager
+def page_scope(page):
+    token = _page.set(page)
+    try:
+        yield
+    finally:
+        _page.reset(token)
+
+
+def set_trace(events):
+    """Also appends every measurement of this script run (and its workers) to the list
+    ``events``; ``None`` stops that."""
+    _trace.set(events)
+
+
+def _traced(kind, name, model, started, seconds, error=None):
+    events = _trace.get()
+    if events is not None:
+        # list.append is atomic, so fan-out workers sharing the list need no lock
+        events.append({"kind": kind, "name": name, "model": model, "started": started, "seconds": seconds,
+                       "thread": threading.current_thread().name, "error": error})
+
+
+# --- Registry ---
+_lock = threading.Lock()
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(labelnames, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values = {}  # label values -> float
+        with _lock:
+            _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        with _lock:
+            _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with _lock:
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def _render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        lines = [line for metric in _metrics for line in metric._render()]
+    return "\n".join(lines) + "\n"
+
+
+# --- Model calls ---
+_CALL_LABELS = ("method", "model", "page")
+MODEL_CALL_SECONDS = Histogram("media_studio_model_call_seconds", "Model call latency (one attempt).", _CALL_LABELS)
+MODEL_CALLS = Counter("media_studio_model_calls_total", "Model call attempts by outcome.", _CALL_LABELS + ("outcome",))
+MODEL_ERRORS = Counter("media_studio_model_errors_total", "Failed model call attempts by error type.", _CALL_LABELS + ("error",))
+REQUEST_BYTES = Histogram("media_studio_model_request_bytes", "Request payload size.", _CALL_LABELS, BYTES_BUCKETS)
+RESPONSE_BYTES = Histogram("media_studio_model_response_bytes", "Response payload size.", _CALL_LABELS, BYTES_BUCKETS)
+IMAGES_RETURNED = Counter("media_studio_images_returned_total", "Images returned by the model.", _CALL_LABELS)
+IMAGES_FILTERED = Counter("media_studio_images_filtered_total", "Requested images (or answers) withheld by safety filters.", _CALL_LABELS)
+FIRST_TOKEN_SECONDS = Histogram("media_studio_model_first_token_seconds", "Time to the first streamed text.", _CALL_LABELS)
+STAGE_SECONDS = Histogram("media_studio_stage_seconds", "Local processing time per stage.", ("stage", "model", "page"), STAGE_BUCKETS)
+
+
+def observed(method, model, fn, request_bytes=0, summarize=None):
+    """Wraps the model call ``fn`` so that every attempt is measured.
+
+    ``summarize(result)`` returns ``(response_bytes, images, filtered)``.
+    Wrap inside ``ratelimit.call`` so queue time isn't counted as latency.
+    """
+    labels = {"method": method, "model": model, "page": current_page()}
+
+    def call(*args, **kwargs):
+        REQUEST_BYTES.observe(request_bytes, **labels)
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            seconds = time.perf_counter() - started
+            MODEL_CALL_SECONDS.observe(seconds, **labels)
+            MODEL_CALLS.inc(outcome="error", **labels)
+            MODEL_ERRORS.inc(error=type(e).__name__, **labels)
+            _traced("model", method, model, started, seconds, error=type(e).__name__)
+            raise
+        seconds = time.perf_counter() - started
+        MODEL_CALL_SECONDS.observe(seconds, **labels)
+        _traced("model", method, model, started, seconds)
+        MODEL_CALLS.inc(outcome="ok", **labels)
+        if summarize is not None:
+            response_bytes, images, filtered = summarize(result)
+            RESPONSE_BYTES.observe(response_bytes, **labels)
+            if images:
+                IMAGES_RETURNED.inc(images, **labels)
+            if filtered:
+                IMAGES_FILTERED.inc(filtered, **labels)
+        return result
+
+    return call
+
+
+@contextmanager
+def stage(name, model=""):
+    """Times a local processing stage (encode, decode, render, ...)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=name, model=model, page=current_page())
+        _traced("stage", name, model, started, seconds)
+
+
+# --- HTTP endpoint ---
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would flood the app log
+
+
+_server = None
+server_error = None
+
+
+def serve(host=METRICS_HOST, port=METRICS_PORT):
+    """Starts the metrics endpoint once per process. A port already in use (e.g. by the app
+    while the batch CLI runs) only leaves ``server_error`` set, and isn't tried again."""
+    global _server, server_error
+    with _lock:
+        if _server is not None or server_error is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+        except OSError as e:
+            server_error = f"{host}:{port}: {e}"
+            return None
+        _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
+
+
+def endpoint():
+    """URL of this process's metrics endpoint, or None if it isn't running."""
+    if _server is None:
+        return None
+    host, port = _server.server_address[:2]
+    return f"http://{host}:{port}/metrics"
@@ -0,0 +1,77 @@
+"""Gemini -> Imagen in one go, for exploring several directions at once.
+
+The Product page used to take two clicks: wait for Gemini's prompt, then wait
+for Imagen. ``run`` asks for several candidate prompts concurrently and starts
+the image calls for each prompt as soon as that prompt is ready, so exploring
+K directions takes about one Gemini latency plus one Imagen latency. Prompts
+that fail ``accept`` are dropped before any image is requested.
+
+Both stages run on the shared fan-out pool; image calls are additionally
+capped per run so one exploration can't take over the pool.
+"""
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass
+
+from backend import fanout
+
+PIPELINE_MAX_IMAGE_CALLS = int(os.environ.get("MEDIA_STUDIO_PIPELINE_MAX_IMAGE_CALLS", "4"))
+
+PROMPT = "prompt"
+REJECTED = "rejected"
+PROMPT_FAILED = "prompt_failed"
+IMAGE = "image"
+IMAGE_FAILED = "image_failed"
+
+
+@dataclass
+class Event:
+    kind: str  # one of the constants above
+    direction: int
+    prompt: str = None
+    index: int = None  # image index within the direction
+    result: object = None  # (response, from_cache) for IMAGE
+    error: Exception = None
+
+
+def run(write_prompt, render, directions, images_per_prompt, accept=None, max_image_calls=None):
+    """Runs the pipeline from the calling thread and yields ``Event``s as things finish.
+
+    ``write_prompt(k)`` returns the prompt for direction ``k``;
+    ``render(k, prompt, i)`` returns ``(response, from_cache)`` for image ``i``
+    of that direction. At most ``max_image_calls`` render calls are in flight
+    at once. Every direction ends with REJECTED, PROMPT_FAILED or one IMAGE /
+    IMAGE_FAILED event per image.
+    """
+    max_image_calls = max_image_calls or PIPELINE_MAX_IMAGE_CALLS
+    pending = {fanout.submit(write_prompt, k): (PROMPT, k, None, None) for k in range(directions)}
+    waiting_images = deque()  # (k, prompt, i) not started yet because of the cap
+    images_in_flight = 0
+
+    while pending or waiting_images:
+        while waiting_images and images_in_flight < max_image_calls:
+            k, prompt, i = waiting_images.popleft()
+            pending[fanout.submit(render, k, prompt, i)] = (IMAGE, k, prompt, i)
+            images_in_flight += 1
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage, k, prompt, i = pending.pop(future)
+            error = future.exception()
+            if stage == PROMPT:
+                if error is not None:
+                    yield Event(PROMPT_FAILED, k, error=error)
+                    continue
+                prompt = (future.result() or "").strip()
+                if not prompt or (accept is not None and not accept(prompt)):
+                    yield Event(REJECTED, k, prompt=prompt)
+                    continue
+                yield Event(PROMPT, k, prompt=prompt)
+                waiting_images.extend((k, prompt, i) for i in range(images_per_prompt))
+            else:
+                images_in_flight -= 1
+                if error is not None:
+                    yield Event(IMAGE_FAILED, k, prompt=prompt, index=i, error=error)
+                else:
+                    yield Event(IMAGE, k, prompt=prompt, index=i, result=future.result())
@@ -0,0 +1,107 @@
+"""Small display copies of uploaded and generated images.
+
+``st.image(output_bytes)`` ships the full-resolution PNG over the websocket
+and makes the browser decode it, even for a 150 px thumbnail in a grid. Pages
+draw a downsized WebP/JPEG preview instead, made once per (content digest,
+size) and kept in a small in-process LRU. The original bytes are only sent
+when the user downloads the image.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from backend import metrics, uploads
+from backend.cache import digest_bytes
+
+PREVIEW_MAX_EDGE = int(os.environ.get("MEDIA_STUDIO_PREVIEW_MAX_EDGE", "768"))
+PREVIEW_FORMAT = os.environ.get("MEDIA_STUDIO_PREVIEW_FORMAT", "WEBP").upper()  # WEBP or JPEG
+PREVIEW_QUALITY = int(os.environ.get("MEDIA_STUDIO_PREVIEW_QUALITY", "80"))
+PREVIEW_CACHE_MB = int(os.environ.get("MEDIA_STUDIO_PREVIEW_CACHE_MB", "64"))
+# Previews are rendered at this multiple of the display width, for high-DPI screens.
+PREVIEW_PIXEL_RATIO = 2
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # (digest, max_edge) -> preview bytes
+_cache_bytes = 0
+counters = {"hits": 0, "misses": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def edge_for_width(width):
+    """Longest preview edge worth rendering for an image displayed ``width`` px wide."""
+    if not width or not isinstance(width, int):
+        return PREVIEW_MAX_EDGE
+    return min(PREVIEW_MAX_EDGE, width * PREVIEW_PIXEL_RATIO)
+
+
+def _render(data, max_edge):
+    from PIL import Image as PILImage
+
+    img = PILImage.open(io.BytesIO(data))
+    if img.format == "JPEG":
+        # Let libjpeg decode at a reduced scale instead of full size.
+        img.draft("RGB", (max_edge, max_edge))
+    img.thumbnail((max_edge, max_edge), PILImage.LANCZOS)
+    buf = io.BytesIO()
+    if PREVIEW_FORMAT == "WEBP":
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode == "LA" else "RGB")
+        img.save(buf, format="WEBP", quality=PREVIEW_QUALITY, method=0)  # method 0: fastest encoder
+    else:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(buf, format="JPEG", quality=PREVIEW_QUALITY)
+    return buf.getvalue()
+
+
+def _cached(key, load):
+    global _cache_bytes
+    with _lock:
+        preview = _cache.get(key)
+        if preview is not None:
+            _cache.move_to_end(key)
+            counters["hits"] += 1
+            return preview
+    data = load()
+    if data is None:
+        return None
+    with metrics.stage("render"):
+        preview = _render(data, key[1])
+    with _lock:
+        counters["misses"] += 1
+        counters["bytes_in"] += len(data)
+        counters["bytes_out"] += len(preview)
+        if key not in _cache:
+            _cache[key] = preview
+            _cache_bytes += len(preview)
+        while _cache_bytes > PREVIEW_CACHE_MB * 1024 * 1024 and len(_cache) > 1:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+    return preview
+
+
+def preview_bytes(data, max_edge=None):
+    """Preview of an image given as bytes."""
+    return _cached((digest_bytes(data), max_edge or PREVIEW_MAX_EDGE), lambda: data)
+
+
+def preview_of(handle, max_edge=None):
+    """Preview of the image behind a blob handle, or None if it was evicted.
+
+    Uses the handle's digest as the key, so a cached preview costs no read.
+    """
+    return _cached((handle.digest, max_edge or PREVIEW_MAX_EDGE), lambda: uploads.get_view(handle))
+
+
+def preview_file(path, max_edge=None):
+    """Preview of an image file that never changes once written (e.g. a job output)."""
+    def load():
+        with open(path, "rb") as f:
+            return f.read()
+
+    return _cached((f"file:{os.path.abspath(path)}", max_edge or PREVIEW_MAX_EDGE), load)
+
+
+def stats():
+    with _lock:
+        return {**counters, "entries": len(_cache), "cached_bytes": _cache_bytes}
@@ -0,0 +1,235 @@
+"""Opt-in profiling of single script runs, for tracking down one slow rerun.
+
+Turned on per browser tab with the ``?profile=1`` query parameter (or
+``?profile=cprofile``), or for every session with ``MEDIA_STUDIO_PROFILE``
+(same values; ``?profile=0`` turns it off again for one tab). Each page calls
+``begin()`` at the top and ``end()`` at the bottom (through ``ui.page_setup`` /
+``ui.page_end``). In between, every
+``metrics.stage`` (client build, encode, decode, preview render, ``st.image``)
+and model call of the run, including those on fan-out workers, is collected,
+and the sidebar shows the breakdown when the run ends. Time on the script
+thread not covered by any stage is reported as "unaccounted" (Streamlit
+widgets, page code).
+
+With ``cprofile`` the script thread is also run under ``cProfile``; the top
+functions are shown and the ``.prof`` file can be opened with snakeviz or
+turned into a flamegraph with flameprof. Only one run is cProfiled at a time.
+Every profiled run is also written to ``PROFILE_DIR`` as JSON, for comparing
+runs offline.
+
+A run stopped early (``st.stop()``, an exception) never reaches ``end()``; it
+is closed at the start of that session's next run, timed up to its last
+recorded stage. Its cProfile slot doesn't wait for that: it is freed as soon
+as the script thread of the run is done.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+
+import streamlit as st
+
+from backend import metrics, ui
+from backend.cache import CACHE_DIR
+
+PROFILE_MODE = os.environ.get("MEDIA_STUDIO_PROFILE", "")
+PROFILE_DIR = os.environ.get("MEDIA_STUDIO_PROFILE_DIR", os.path.join(CACHE_DIR, "profiles"))
+PROFILE_TOP_FUNCTIONS = 15
+
+_OFF = ("", "0", "off", "false", "no")
+_cprofile_lock = threading.Lock()  # one cProfile at a time per process
+_release_lock = threading.Lock()  # end() and the run's watcher may both try to free the slot
+
+
+def mode():
+    """None, "stages" or "cprofile" for the current script run."""
+    value = st.query_params.get("profile")
+    value = (PROFILE_MODE if value is None else value).strip().lower()
+    if value in _OFF:
+        return None
+    return "cprofile" if value == "cprofile" else "stages"
+
+
+class _Run:
+    def __init__(self, page, mode, number):
+        self.page, self.mode, self.number = page, mode, number
+        self.session = ui.session_id()
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.thread = threading.current_thread().name
+        self.events = []
+        self.profile = None
+        self.holds_cprofile = False
+        self.note = None
+        self.panel = None
+
+
+def begin():
+    """Starts profiling this script run if profiling is on. Call right after ``metrics.set_page``."""
+    leftover = st.session_state.pop("profiler_open_run", None)
+    if leftover is not None:
+        _finish(leftover, stopped_early=True)
+
+    run_mode = mode()
+    if run_mode is None:
+        metrics.set_trace(None)
+        return
+    st.session_state.profiler_runs = st.session_state.get("profiler_runs", 0) + 1
+    run = _Run(metrics.current_page(), run_mode, st.session_state.profiler_runs)
+    run.panel = st.sidebar.empty()
+    _draw(run.panel, st.session_state.get("profiler_last"))
+    if run_mode == "cprofile":
+        if _cprofile_lock.acquire(blocking=False):
+            run.profile = cProfile.Profile()
+            run.holds_cprofile = True
+            # Frees the slot once the script thread is done, also if this run never reaches end()
+            threading.Thread(target=_release_after, args=(run, threading.current_thread()),
+                             name="profiler-release", daemon=True).start()
+        else:
+            run.note = "cProfile skipped: another run is being cProfiled."
+    metrics.set_trace(run.events)
+    st.session_state.profiler_open_run = run
+    if run.profile is not None:
+        run.profile.enable()  # last, so profiling starts with the page code
+
+
+def end():
+    """Ends this script run's profile and shows it in the sidebar. Call at the very bottom of the page."""
+    run = st.session_state.pop("profiler_open_run", None)
+    if run is None:
+        return
+    summary = _finish(run, stopped_early=False)
+    _draw(run.panel, summary)
+
+
+def _release_cprofile(run):
+    with _release_lock:
+        if not run.holds_cprofile:
+            return
+        run.holds_cprofile = False
+    run.profile.disable()
+    _cprofile_lock.release()
+
+
+def _release_after(run, script_thread):
+    script_thread.join()
+    _release_cprofile(run)
+
+
+def _finish(run, stopped_early):
+    if run.profile is not None:
+        _release_cprofile(run)
+    metrics.set_trace(None)
+    if stopped_early:
+        ends = [event["started"] + event["seconds"] for event in run.events]
+        total = (max(ends) if ends else run.started) - run.started
+    else:
+        total = time.perf_counter() - run.started
+
+    summary = {
+        "page": run.page,
+        "session": run.session,
+        "run": run.number,
+        "mode": run.mode,
+        "started_at": run.started_at,
+        "total_seconds": round(total, 4),
+        "stopped_early": stopped_early,
+        "stages": _stages(run),
+        "events": [
+            {**event, "started": round(event["started"] - run.started, 4), "seconds": round(event["seconds"], 4)}
+            for event in sorted(run.events, key=lambda event: event["started"])
+        ],
+    }
+    on_script_thread = sum(event["seconds"] for event in run.events if event["thread"] == run.thread)
+    summary["unaccounted_seconds"] = round(max(total - on_script_thread, 0.0), 4)
+    if run.note:
+        summary["note"] = run.note
+    if run.profile is not None:
+        summary["cprofile_top"] = _top_functions(run.profile)
+    summary["files"] = _write(run, summary)
+    st.session_state.profiler_last = summary
+    return summary
+
+
+def _stages(run):
+    stages = {}
+    for event in run.events:
+        stage = stages.setdefault((event["kind"], event["name"], event["model"]), {
+            "kind": event["kind"], "name": event["name"], "model": event["model"],
+            "count": 0, "seconds": 0.0, "script_thread_seconds": 0.0, "errors": 0,
+        })
+        stage["count"] += 1
+        stage["seconds"] += event["seconds"]
+        if event["thread"] == run.thread:
+            stage["script_thread_seconds"] += event["seconds"]
+        if event["error"]:
+            stage["errors"] += 1
+    for stage in stages.values():
+        stage["seconds"] = round(stage["seconds"], 4)
+        stage["script_thread_seconds"] = round(stage["script_thread_seconds"], 4)
+    return sorted(stages.values(), key=lambda stage: -stage["seconds"])
+
+
+def _top_functions(profile):
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": f"{function} ({os.path.basename(filename)}:{line})", "calls": calls,
+                     "own_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)})
+    rows.sort(key=lambda row: -row["cumulative_seconds"])
+    return rows[:PROFILE_TOP_FUNCTIONS]
+
+
+def _write(run, summary):
+    """Writes the run as JSON (and the cProfile stats) to ``PROFILE_DIR``; returns the paths."""
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(run.started_at))
+    session = re.sub(r"[^A-Za-z0-9]", "", run.session)[:8]
+    base = os.path.join(PROFILE_DIR, f"{stamp}-{run.page}-{session}-{run.number}")
+    files = {}
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if run.profile is not None:
+            run.profile.dump_stats(base + ".prof")
+            files["cprofile"] = base + ".prof"
+        files["json"] = base + ".json"
+        with open(base + ".json", "w") as f:
+            json.dump({**summary, "files": files}, f, indent=2)
+    except OSError as e:
+        files["error"] = str(e)  # the panel still shows the run
+    return files
+
+
+def _draw(panel, summary):
+    if panel is None:
+        return
+    with panel.container():
+        with st.expander("⏱️ Profiler", expanded=True):
+            if summary is None:
+                st.caption("Profiling is on; the breakdown shows up when this run ends.")
+                return
+            state = " (stopped early)" if summary["stopped_early"] else ""
+            st.markdown(f"**{summary['page']}**, run {summary['run']}: "
+                        f"**{summary['total_seconds'] * 1000:.0f} ms**{state}")
+            lines = ["| stage | calls | ms | on script thread |", "|---|---:|---:|---:|"]
+            for stage in summary["stages"]:
+                name = f"{stage['kind']}: {stage['name']}" + (f" ({stage['model']})" if stage["model"] else "")
+                if stage["errors"]:
+                    name += f", {stage['errors']} failed"
+                lines.append(f"| {name} | {stage['count']} | {stage['seconds'] * 1000:.1f} | "
+                             f"{stage['script_thread_seconds'] * 1000:.1f} |")
+            lines.append(f"| unaccounted (widgets, page code) | | | {summary['unaccounted_seconds'] * 1000:.1f} |")
+            st.markdown("\n".join(lines))
+            if summary.get("note"):
+                st.caption(summary["note"])
+            if summary.get("cprofile_top"):
+                st.markdown("**cProfile (by cumulative time)**")
+                st.code("\n".join(f"{row['cumulative_seconds'] * 1000:8.1f} ms {row['calls']:>6}x  {row['function']}"
+                                  for row in summary["cprofile_top"]), language=None)
+            if summary["files"].get("error"):
+                st.caption(f"Not saved: {summary['files']['error']}")
+            else:
+                st.caption("Saved to " + ", ".join(f"`{path}`" for path in summary["files"].values()))
@@ -0,0 +1,183 @@
+"""Process-wide rate limiting for Vertex AI model calls.
+
+Every session used to call the models straight from its script thread, so at
+peak the replica overran the project quota and users got 429 errors. Each
+model ID now has a token bucket refilled at its per-minute quota, and callers
+queue for tokens in arrival order. While a call waits, an optional reporter
+(see ``report_waits``) is told its queue position. Calls that still get a
+quota error are retried with exponential backoff and full jitter.
+
+Limits are per process. When several replicas share one project quota, set
+``MEDIA_STUDIO_REPLICAS`` and every replica takes its share of each limit.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Requests per minute, per model (project quota); override with
+# MEDIA_STUDIO_RATE_LIMITS="imagen-3.0-capability-001=30,gemini-2.0-flash=300".
+DEFAULT_RATE_LIMITS = {
+    "imagen-4.0-generate-preview-06-06": 20,
+    "imagen-4.0-fast-generate-preview-06-06": 20,  # Moodboard drafts
+    "imagen-4.0-upscale-preview": 10,  # upscaled finals of drafts
+    "imagen-3.0-capability-001": 20,
+    "gemini-2.0-flash": 200,
+    "virtual-try-on-exp-05-31": 10,
+}
+DEFAULT_RATE_PER_MINUTE = float(os.environ.get("MEDIA_STUDIO_RATE_LIMIT_DEFAULT", "60"))
+REPLICAS = max(1, int(os.environ.get("MEDIA_STUDIO_REPLICAS", "1")))
+MAX_RETRIES = int(os.environ.get("MEDIA_STUDIO_RATE_LIMIT_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = float(os.environ.get("MEDIA_STUDIO_BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.environ.get("MEDIA_STUDIO_BACKOFF_MAX_SECONDS", "30"))
+ADMISSION_TIMEOUT_SECONDS = float(os.environ.get("MEDIA_STUDIO_ADMISSION_TIMEOUT_SECONDS", "300"))
+
+
+def _parse_limits(spec):
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, per_minute = item.partition("=")
+        limits[model.strip()] = float(per_minute)
+    return limits
+
+
+RATE_LIMITS = _parse_limits(os.environ.get("MEDIA_STUDIO_RATE_LIMITS", ""))
+
+
+class QueueTimeout(TimeoutError):
+    """Raised when a call waited longer than ``ADMISSION_TIMEOUT_SECONDS`` for a slot."""
+
+
+class ModelLimiter:
+    """Token bucket for one model, handing tokens out in FIFO order."""
+
+    def __init__(self, model, per_minute):
+        self.model = model
+        self.rate = per_minute / 60.0 / REPLICAS  # tokens per second
+        self.capacity = max(1.0, self.rate * 5)  # up to 5 seconds' worth of burst
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self.counters = {
+            "admitted": 0, "queued": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+            "throttled": 0, "retries": 0, "timeouts": 0,
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, on_wait=None, timeout=None):
+        """Blocks until this caller is first in line and a token is free. Returns seconds waited.
+
+        ``on_wait(model, position, waited_seconds)`` is called (outside the lock)
+        about once a second once the wait gets noticeable.
+        """
+        timeout = ADMISSION_TIMEOUT_SECONDS if timeout is None else timeout
+        ticket = object()
+        started = time.monotonic()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self._queue[0] is ticket and self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    waited = time.monotonic() - started
+                    if waited >= timeout:
+                        self.counters["timeouts"] += 1
+                        raise QueueTimeout(f"waited {waited:.0f}s for a {self.model} slot; try again shortly")
+                    if on_wait is not None and waited >= 0.5:
+                        position = self._queue.index(ticket) + 1
+                        self._cond.release()
+                        try:
+                            on_wait(self.model, position, waited)
+                        finally:
+                            self._cond.acquire()
+                    until_token = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.05
+                    self._cond.wait(min(1.0, max(0.01, until_token), timeout - waited))
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            self.counters["admitted"] += 1
+            if waited > 0.01:
+                self.counters["queued"] += 1
+            self.counters["wait_seconds_total"] += waited
+            self.counters["wait_seconds_max"] = max(self.counters["wait_seconds_max"], waited)
+        return waited
+
+    def note_throttled(self, retrying):
+        """The model still said 429: drop the spare tokens so the queue slows down too."""
+        with self._cond:
+            self.counters["throttled"] += 1
+            self.counters["retries"] += int(retrying)
+            self._tokens = min(self._tokens, 0.0)
+
+    def stats(self):
+        with self._cond:
+            self._refill()
+            return {
+                **self.counters,
+                "queue_depth": len(self._queue),
+                "tokens": round(self._tokens, 2),
+                "per_minute": round(self.rate * 60, 2),
+            }
+
+
+_lock = threading.Lock()
+_limiters = {}
+_wait_reporter = contextvars.ContextVar("ratelimit_wait_reporter", default=None)
+
+
+def limiter(model):
+    with _lock:
+        if model not in _limiters:
+            _limiters[model] = ModelLimiter(model, RATE_LIMITS.get(model, DEFAULT_RATE_PER_MINUTE))
+        return _limiters[model]
+
+
+@contextmanager
+def report_waits(on_wait):
+    """Calls made inside the block (and in fan-out workers it starts) report their queue position to ``on_wait``."""
+    token = _wait_reporter.set(on_wait)
+    try:
+        yield
+    finally:
+        _wait_reporter.reset(token)
+
+
+def is_throttle_error(error):
+    """True for quota errors from google-genai (APIError 429) and google-api-core (ResourceExhausted)."""
+    code = getattr(error, "code", None)
+    return code == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def call(model, fn, /, *args, **kwargs):
+    """Runs ``fn(*args, **kwargs)`` once a ``model`` slot is free, retrying quota errors with backoff."""
+    model_limiter = limiter(model)
+    for attempt in range(MAX_RETRIES + 1):
+        model_limiter.acquire(on_wait=_wait_reporter.get())
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if not is_throttle_error(e):
+                raise
+            retrying = attempt < MAX_RETRIES
+            model_limiter.note_throttled(retrying)
+            if not retrying:
+                raise
+            # Full jitter: sleep anywhere up to the exponential backoff, so retries don't line up.
+            time.sleep(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+
+def stats():
+    with _lock:
+        limiters = dict(_limiters)
+    return {model: model_limiter.stats() for model, model_limiter in limiters.items()}
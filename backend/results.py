@@ -0,0 +1,122 @@
+"""Per-session history of generated images, redrawn on every rerun.
+
+Outputs used to be drawn only inside the ``if st.button(...)`` branch, so the
+next interaction (a download click, editing a text box) reran the script and
+the images were gone; the usual reaction was to click Generate again. Pages
+now record each generation here and call ``show`` on every run. Only blob
+handles are kept in session state: the images are drawn from cached previews
+and the full-resolution bytes are read from the blob store when a download is
+actually clicked.
+"""
+import os
+import time
+import uuid
+from dataclasses import dataclass
+
+import streamlit as st
+
+from backend import metrics, previews, ui, uploads
+
+RESULTS_TO_KEEP = int(os.environ.get("MEDIA_STUDIO_RESULTS_TO_KEEP", "3"))
+
+_STATE_KEY = "results_history"
+
+
+@dataclass(frozen=True)
+class Generation:
+    id: str
+    label: str
+    caption: str
+    images: tuple  # BlobHandle per variation, None where it failed
+    created: float
+    from_cache: bool = False
+    columns: int = None  # fixed grid width (e.g. one row per model); else up to max_columns
+    captions: tuple = None  # caption per image, when "<caption> <n>" isn't enough
+
+    def caption_of(self, i):
+        return self.captions[i] if self.captions else f"{self.caption} {i+1}"
+
+
+def history(page):
+    """Kept generations of ``page`` for this session, oldest first."""
+    return st.session_state.setdefault(_STATE_KEY, {}).setdefault(page, [])
+
+
+def _drop_oldest(page):
+    kept = history(page)
+    if not kept:
+        return False
+    for handle in kept.pop(0).images:
+        if handle is not None:
+            uploads.release(handle)
+    return True
+
+
+def clear(page):
+    while _drop_oldest(page):
+        pass
+
+
+def _keep(page, slot, data, mime_type):
+    while True:
+        try:
+            return uploads.register(ui.session_id(), slot, data, mime_type=mime_type)
+        except uploads.QuotaExceeded:
+            # Older results make room for new ones; give up once there are none left.
+            if not _drop_oldest(page):
+                return None
+
+
+def record(page, images, label, caption, from_cache=False, mime_type="image/png", columns=None, captions=None):
+    """Keeps ``images`` (bytes per variation, None where it failed) as the newest generation of ``page``.
+
+    ``captions`` (one per image) replaces the numbered ``caption``, e.g. to say
+    which direction or model each image of a combined generation came from.
+
+    Returns the ``Generation`` (pass it to ``show`` as ``skip`` on the run that
+    already drew it), or None if there was nothing to keep.
+    """
+    if not any(images):
+        return None
+    gen_id = uuid.uuid4().hex[:8]
+    handles = tuple(
+        _keep(page, f"result/{page}/{gen_id}/{i}", data, mime_type) if data else None
+        for i, data in enumerate(images)
+    )
+    generation = Generation(gen_id, label, caption, handles, time.time(), from_cache, columns,
+                            tuple(captions) if captions else None)
+    kept = history(page)
+    kept.append(generation)
+    while len(kept) > RESULTS_TO_KEEP:
+        _drop_oldest(page)
+    return generation
+
+
+def show(page, skip=None, download_name="image_{i}.png", max_columns=4):
+    """Draws the kept generations of ``page``, newest first, except ``skip``."""
+    kept = [g for g in reversed(history(page)) if skip is None or g.id != skip.id]
+    if not kept:
+        return
+    st.subheader("Recent results")
+    if st.button("Clear results", key=f"clear_results_{page}"):
+        clear(page)
+        st.rerun()
+    for gen in kept:
+        created = time.strftime("%H:%M:%S", time.localtime(gen.created))
+        st.caption(f"{created} · {gen.label}" + (" (cached)" if gen.from_cache else ""))
+        cols = st.columns(gen.columns or min(len(gen.images), max_columns))
+        for i, handle in enumerate(gen.images):
+            with cols[i % len(cols)]:
+                preview = previews.preview_of(handle) if handle is not None else None
+                if preview is None:
+                    st.warning(f"{gen.caption_of(i)} is no longer available.")
+                    continue
+                with metrics.stage("st.image"):
+                    st.image(preview, caption=gen.caption_of(i))
+                # Full-resolution bytes are only read when the button is clicked, and
+                # clicking it doesn't rerun the page.
+                st.download_button(
+                    "Download", data=lambda h=handle: uploads.get_bytes(h),
+                    file_name=download_name.format(i=i+1), mime=handle.mime_type,
+                    key=f"download_result_{gen.id}_{i}", on_click="ignore",
+                )
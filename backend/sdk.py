@@ -0,0 +1,50 @@
+"""Heavy SDK modules, imported on first use instead of at page import.
+
+``google.genai.types`` alone takes most of a second to import, and every page
+used to pull it in (directly or through ``backend.imagen``) before drawing
+anything. ``types`` here stands in for it until an attribute is first read,
+which only happens once a request is actually built. ``backend.warmup``
+imports everything in ``HEAVY_MODULES`` ahead of traffic.
+"""
+import importlib
+
+HEAVY_MODULES = (
+    "google.genai",
+    "google.genai.types",
+    "google.cloud.aiplatform",
+    "google.cloud.aiplatform.gapic",
+)
+
+
+class LazyModule:
+    """Imports ``name`` the first time one of its attributes is read."""
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        if self.__module is None:
+            # import_module holds the import lock, so racing sessions import it once
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__module is not None else "not loaded"
+        return f"<lazy module {self.__name!r} ({state})>"
+
+
+types = LazyModule("google.genai.types")
+
+
+def load(names=HEAVY_MODULES):
+    """Imports ``names`` now; returns ``{name: seconds}`` (0 for already-imported ones)."""
+    import sys
+    import time
+    timings = {}
+    for name in names:
+        started = time.perf_counter()
+        if name not in sys.modules:
+            importlib.import_module(name)
+        timings[name] = time.perf_counter() - started
+    return timings
@@ -0,0 +1,60 @@
+"""Single-flight coalescing of identical in-flight model calls.
+
+When a campaign launches, many people submit the same default inputs at the
+same moment, and a double-clicked Generate button sends the same request
+twice. Calls with the same fingerprint that overlap in time now share one
+upstream call: the first caller makes it, the others wait for its result.
+"""
+import threading
+from concurrent.futures import Future
+
+_groups = {}
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls per key."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future
+        self.counters = {"calls": 0, "upstream": 0, "coalesced": 0}
+        _groups[name] = self
+
+    def do(self, key, fn):
+        """Returns ``(fn(), shared)``, running ``fn`` only if no call for ``key`` is in flight.
+
+        ``shared`` is True when the result came from another caller's call.
+        Errors are shared the same way, so waiters see the leader's exception.
+        """
+        with self._lock:
+            self.counters["calls"] += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.counters["upstream"] += 1
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "in_flight": len(self._inflight)}
+
+
+def stats():
+    return {name: group.stats() for name, group in _groups.items()}
@@ -0,0 +1,302 @@
+"""Streamlit rendering helpers shared by the pages."""
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from backend import fanout, jobs, metrics, previews, profiler, ratelimit, uploads
+from backend.blobstore import BlobHandle
+from backend.imagen import image_bytes_of  # noqa: F401 (pages use ui.image_bytes_of)
+from backend.ingest import ingest_upload
+
+
+def page_setup(page):
+    """Top of every page script: labels the run's model calls and stages with ``page`` in the
+    metrics, starts the metrics endpoint (once per process, off with MEDIA_STUDIO_METRICS_PORT=0)
+    and starts profiling the run when it is on (``?profile=1`` or MEDIA_STUDIO_PROFILE)."""
+    metrics.set_page(page)
+    metrics.serve()
+    profiler.begin()
+
+
+def page_end():
+    """Bottom of every page script: ends the run's profile, if one was started."""
+    profiler.end()
+
+
+def show_image(image, caption=None, width=None, container=None, **kwargs):
+    """``st.image`` with a cached, downsized preview of ``image`` (bytes or ``BlobHandle``).
+
+    The preview is sized for ``width`` when it is given in pixels.
+    """
+    max_edge = previews.edge_for_width(width)
+    if isinstance(image, BlobHandle):
+        preview = previews.preview_of(image, max_edge)
+        if preview is None:
+            # Evicted (idle session or upload quota): the handle is stale, so drop it
+            # and let the page ask for the upload again instead of failing in st.image.
+            (container or st).warning("Image expired, please re-upload.")
+            forget_handle(image)
+            return
+    else:
+        preview = previews.preview_bytes(image, max_edge)
+    if width is not None:
+        kwargs["width"] = width
+    with metrics.stage("st.image"):
+        (container or st).image(preview, caption=caption, **kwargs)
+
+
+def show_variations_progressively(call_variation, count, caption, max_columns=4, download_name=None):
+    """Fans ``count`` single-image calls out and draws each one as it arrives.
+
+    ``call_variation(i)`` must return ``(response, from_cache)`` like the
+    helpers in ``backend.imagen``. Every variation gets its own tile up front;
+    a failed call only replaces its own tile with an error. Returns the list of
+    image bytes per variation (``None`` where it failed).
+    """
+    cols = st.columns(min(count, max_columns))
+    tiles = []
+    for i in range(count):
+        with cols[i % len(cols)]:
+            st.write(f"Variation {i+1}:")
+            tile = st.empty()
+            tile.info("Generating...")
+            tiles.append(tile)
+
+    results = [None] * count
+    for i, result, error in fanout.iter_variations(call_variation, count):
+        tile = tiles[i]
+        if error is not None:
+            tile.error(f"Variation {i+1} failed: {error}")
+            continue
+        response, from_cache = result
+        output_bytes = image_bytes_of(response.generated_images[0]) if response.generated_images else None
+        if not output_bytes:
+            tile.warning(f"Could not retrieve image data for {i+1} (it may have been filtered).")
+            continue
+        results[i] = output_bytes
+        with tile.container():
+            show_image(output_bytes, caption=f"{caption} {i+1}" + (" (cached)" if from_cache else ""))
+            if download_name:
+                st.download_button(
+                    "Download", output_bytes, download_name.format(i=i+1),
+                    mime="image/png", key=f"download_{download_name}_{i}", on_click="ignore",
+                )
+    return results
+
+
+# --- How a page runs its variations ---
+PARALLEL = "parallel"  # one single-image call per variation, each drawn as it lands
+BATCH = "batch"  # one call for all variations
+BACKGROUND = "background"  # a job on the job pool; the page returns right away
+
+
+def background_option(page):
+    """The "Run in the background" checkbox (keyed ``<page>_background``). Returns whether it is ticked."""
+    return st.checkbox("Run in the background", key=f"{page}_background",
+                       help="Starts a job and returns right away, so you can keep working. Results appear under "
+                            "Background jobs, also after a reload.")
+
+
+def variation_options(page):
+    """Draws the page's "how to run the variations" options (keyed ``<page>_...``). Returns the mode for ``run_variations``."""
+    parallel = st.checkbox("Show each variation as soon as it is ready", value=True, key=f"{page}_parallel",
+                           help="Sends one request per variation in parallel instead of a single batch request.")
+    if background_option(page):
+        return BACKGROUND
+    return PARALLEL if parallel else BATCH
+
+
+def run_variations(page, mode, call_variation, call_batch, count, caption, heading, job_label, success=None,
+                   cached_note="Served from the local cache.", max_columns=4, download_name=None):
+    """Runs ``count`` variations the way ``variation_options`` chose, drawing them under ``heading``.
+
+    ``call_variation(i)`` makes the call for variation ``i`` and ``call_batch()``
+    one call for all of them; both return ``(response, from_cache)`` like the
+    helpers in ``backend.imagen``. Returns ``(outputs, from_cache)`` with the
+    image bytes per variation (``None`` where it failed), for ``results.record``.
+    In the background the variations become a job named ``job_label`` on
+    ``page``'s job panel, and nothing is returned yet.
+    """
+    if mode == BACKGROUND:
+        start_job(page, jobs.submit_variations(page, job_label, call_variation, count=count, caption=caption))
+        return [], False
+    if mode == PARALLEL:
+        st.subheader(f"{heading} ({count}):")
+        outputs = show_variations_progressively(call_variation, count=count, caption=caption,
+                                                max_columns=max_columns, download_name=download_name)
+        return outputs, False
+
+    response, from_cache = call_batch()
+    outputs = [image_bytes_of(g) for g in response.generated_images or []]
+    if success:
+        st.success(success)
+    if from_cache:
+        st.caption(cached_note)
+    if not outputs:
+        st.warning("The API did not return any generated images.")
+        return outputs, from_cache
+    st.subheader(f"{heading} ({len(outputs)}):")
+    cols = st.columns(min(len(outputs), max_columns))
+    for i, output_bytes in enumerate(outputs):
+        with cols[i % len(cols)]:
+            st.write(f"Variation {i+1}:")
+            if not output_bytes:
+                st.warning(f"Could not retrieve image data for {i+1}.")
+                continue
+            show_image(output_bytes, caption=f"{caption} {i+1}")
+            if download_name:
+                st.download_button(
+                    "Download", output_bytes, download_name.format(i=i+1),
+                    mime="image/png", key=f"download_{download_name}_{i}", on_click="ignore",
+                )
+    return outputs, from_cache
+
+
+def session_id():
+    """Streamlit session id of the current script run ("bare" outside a server)."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "bare"
+
+
+def keep_image(slot, data, model, original_bytes=None, **ingest_options):
+    """Ingests ``data`` for ``model`` into the blob store and returns its handle.
+
+    The handle is also stored in ``st.session_state[f"{slot}_handle"]``. A
+    session over its blob quota gets an error and the run stops.
+    """
+    ingested = ingest_upload(data, model, **ingest_options)
+    try:
+        handle = uploads.register(
+            session_id(), slot, ingested.data,
+            original_bytes=original_bytes or len(data), mime_type=ingested.mime_type,
+        )
+    except uploads.QuotaExceeded as e:
+        st.error(f"Could not keep this image: {e}")
+        st.stop()
+    st.session_state[f"{slot}_handle"] = handle
+    return handle
+
+
+def forget_handle(handle):
+    """Releases ``handle`` and clears ``st.session_state[f"{slot}_handle"]`` if it still holds it."""
+    uploads.release(handle)
+    if st.session_state.get(f"{handle.slot}_handle") == handle:
+        st.session_state[f"{handle.slot}_handle"] = None
+        st.session_state.pop(f"{handle.slot}_file_id", None)  # so keep_upload ingests the file again
+
+
+def keep_upload(uploaded_file, slot, model, **ingest_options):
+    """``keep_image`` for a ``st.file_uploader`` file, done once per uploaded file.
+
+    The uploader's ``file_id`` is remembered next to the handle, so reruns with
+    the same file attached don't re-read, re-hash or re-ingest it.
+    """
+    handle = st.session_state.get(f"{slot}_handle")
+    if st.session_state.get(f"{slot}_file_id") != uploaded_file.file_id or uploads.get_view(handle) is None:
+        raw_bytes = uploaded_file.getvalue()
+        handle = keep_image(slot, raw_bytes, model, **ingest_options)
+        st.session_state[f"{slot}_file_id"] = uploaded_file.file_id
+    return handle
+
+
+@contextmanager
+def queue_notice():
+    """Tells the user their place in line while model calls inside the block wait for a rate-limit slot.
+
+    Waits can happen in fan-out worker threads, so the callback attaches this
+    script run's context to the waiting thread before drawing.
+    """
+    placeholder = st.empty()
+    ctx = get_script_run_ctx()
+
+    def on_wait(model, position, waited):
+        if ctx is not None and get_script_run_ctx(suppress_warning=True) is not ctx:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        placeholder.info(f"Lots of requests right now: you're #{position} in line for {model} ({waited:.0f}s so far).")
+
+    try:
+        with ratelimit.report_waits(on_wait):
+            yield
+    finally:
+        placeholder.empty()
+
+
+# --- Background jobs ---
+JOBS_SHOWN_PER_PAGE = 5
+
+
+def track_job(page, job_id):
+    """Remembers ``job_id`` for this session's ``page`` and puts it in the URL, so a reload finds it again."""
+    tracked = st.session_state.setdefault("jobs", {}).setdefault(page, [])
+    tracked.append(job_id)
+    del tracked[:-JOBS_SHOWN_PER_PAGE]
+    st.query_params["job"] = job_id
+
+
+def start_job(page, job_id):
+    """Tracks a job that was just submitted from ``page`` and tells the user it started."""
+    track_job(page, job_id)
+    st.success(f"Started background job `{job_id}`.")
+
+
+def _draw_job(job_id, download_name):
+    job = jobs.get(job_id)
+    if job is None:
+        st.warning(f"Job `{job_id}` was not found (it may have expired).")
+        return None
+    elapsed = (job.finished or time.time()) - (job.started or job.created)
+    st.markdown(f"**{job.label}** · job `{job.id}` · {job.status} · {job.done}/{job.total} · {elapsed:.0f}s")
+    if job.status not in jobs.FINISHED:
+        st.progress(job.done / job.total if job.total else 0.0)
+        if st.button("Cancel", key=f"cancel_job_{job.id}"):
+            jobs.cancel(job.id)
+    if job.error:
+        st.error(job.error)
+    for message in job.errors:
+        st.warning(message)
+    if job.outputs:
+        cols = st.columns(min(len(job.outputs), 4))
+        for n, output in enumerate(job.outputs):
+            with cols[n % len(cols)]:
+                preview = previews.preview_file(jobs.output_path(job.id, output))
+                with metrics.stage("st.image"):
+                    st.image(preview, caption=output["caption"])
+                st.download_button(
+                    "Download", data=lambda i=output["index"]: jobs.read_output(job.id, i),
+                    file_name=download_name.format(i=output["index"] + 1), mime=output["mime_type"],
+                    key=f"download_job_{job.id}_{output['index']}", on_click="ignore",
+                )
+    return job
+
+
+def _show_job(job_id, download_name):
+    job = jobs.get(job_id)
+    active = job is not None and job.status not in jobs.FINISHED
+
+    # Polls once a second while the job runs; only this fragment reruns, not the page.
+    @st.fragment(run_every=1.0 if active else None)
+    def job_panel():
+        current = _draw_job(job_id, download_name)
+        if active and current is not None and current.status in jobs.FINISHED:
+            st.rerun()  # redraw once more without polling
+
+    job_panel()
+
+
+def show_jobs(page, download_name="image_{i}.png"):
+    """Draws this session's background jobs for ``page`` (newest first), plus one named in the URL."""
+    tracked = st.session_state.setdefault("jobs", {}).setdefault(page, [])
+    linked = st.query_params.get("job")
+    if linked and linked not in tracked:
+        job = jobs.get(linked)
+        if job is not None and job.kind == page:
+            tracked.append(linked)
+    if not tracked:
+        return
+    st.subheader("Background jobs")
+    for job_id in reversed(tracked):
+        with st.container(border=True):
+            _show_job(job_id, download_name)
@@ -0,0 +1,76 @@
+"""Registry of uploaded images, keyed by content digest.
+
+Pages keep only a small ``BlobHandle`` in ``st.session_state``. The bytes are
+held once per distinct image in the disk-backed blob store (shared by every
+session that uploaded the same content) and read back through mmap. Encodings
+needed by an API (e.g. base64 for Virtual Try-On) are produced on demand at
+call time instead of being stored next to the raw bytes.
+"""
+import threading
+
+from backend import blobstore
+from backend.blobstore import QuotaExceeded  # noqa: F401 (re-exported for pages)
+
+_lock = threading.Lock()
+_original_sizes = {}  # digest -> size of the upload before ingestion, while some session holds it
+
+
+def _forget_original_size(digest):
+    with _lock:
+        _original_sizes.pop(digest, None)
+
+
+blobstore.on_delete(_forget_original_size)  # released, replaced or evicted with an idle session
+
+
+def register(session_id, slot, data, original_bytes=None, mime_type=None):
+    """Stores ``data`` for ``(session_id, slot)`` and returns its ``BlobHandle``.
+
+    Whatever the slot held before is released. ``original_bytes`` is the size
+    of the upload before ingestion, used for memory accounting.
+    """
+    handle = blobstore.put(session_id, slot, data, mime_type)
+    with _lock:
+        _original_sizes[handle.digest] = original_bytes or len(data)
+    return handle
+
+
+def get_bytes(handle):
+    """The image bytes behind ``handle``, or None if it was evicted."""
+    return blobstore.get_bytes(handle)
+
+
+def get_view(handle):
+    """Zero-copy memoryview of the image behind ``handle`` (for hashing/encoding)."""
+    return blobstore.get_view(handle)
+
+
+def release(handle):
+    """Drops ``handle``'s slot; the file goes once no session references it."""
+    blobstore.release_slot(handle.session_id, handle.slot)
+
+
+def session_report(session_id):
+    """Bytes this session holds, and what the old raw + base64 session-state copies would have held."""
+    report = blobstore.memory_report()
+    session = report["sessions"].get(session_id, {"blobs": 0, "bytes": 0, "idle_seconds": 0})
+    digests = blobstore.session_digests(session_id)
+    with _lock:
+        # Previously every session kept the raw upload plus a base64 string (4/3 the size) in RAM.
+        legacy = sum(_original_sizes.get(d, 0) * 7 // 3 for d in digests)
+    return {
+        "images": session["blobs"],
+        "bytes_on_disk": session["bytes"],
+        "bytes_in_session_state": 0,
+        "legacy_bytes_estimate": legacy,
+        "bytes_saved": legacy,
+    }
+
+
+def stats():
+    report = blobstore.memory_report()
+    return {
+        "images": report["distinct_blobs"],
+        "bytes_on_disk": report["disk_bytes"],
+        "sessions": report["total_sessions"],
+    }
@@ -0,0 +1,302 @@
+"""Virtual Try-On requests against the Vertex AI prediction endpoint."""
+import base64
+import binascii
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from backend import fanout, metrics, previews, ratelimit
+
+VTO_MODEL = "virtual-try-on-exp-05-31"
+# How many person/product instances one predict call may carry, and how many
+# predict calls a matrix run keeps in flight. Both depend on the endpoint quota.
+VTO_MAX_INSTANCES_PER_REQUEST = int(os.environ.get("MEDIA_STUDIO_VTO_MAX_INSTANCES", "4"))
+VTO_MAX_CONCURRENCY = int(os.environ.get("MEDIA_STUDIO_VTO_CONCURRENCY", "4"))
+# Two-tier mode: a quick low-step pass over several samples, then only the chosen one at high steps.
+VTO_PREVIEW_SAMPLES = int(os.environ.get("MEDIA_STUDIO_VTO_PREVIEW_SAMPLES", "4"))
+VTO_PREVIEW_STEPS = int(os.environ.get("MEDIA_STUDIO_VTO_PREVIEW_STEPS", "8"))
+VTO_REFINE_STEPS = int(os.environ.get("MEDIA_STUDIO_VTO_REFINE_STEPS", "40"))
+
+
+def model_endpoint(project, location):
+    return f"projects/{project}/locations/{location}/publishers/google/models/{VTO_MODEL}"
+
+
+def encode_image(image_bytes):
+    with metrics.stage("encode", model=VTO_MODEL):
+        return base64.b64encode(image_bytes).decode("utf-8")
+
+
+def build_instance(person_b64, product_b64):
+    return {
+        "personImage": {"image": {"bytesBase64Encoded": person_b64}},
+        "productImages": [{"image": {"bytesBase64Encoded": product_b64}}],
+    }
+
+
+def build_parameters(sample_count=1, base_steps=25, safety_setting="block_low_and_above", person_generation="allow_adult",
+                     seed=None, add_watermark=None):
+    """Predict parameters. ``add_watermark=None`` leaves the endpoint default (watermark on).
+
+    The endpoint ignores the seed while the watermark is on, so a ``seed`` needs
+    ``add_watermark=False`` spelled out by the caller.
+    """
+    if seed is not None and add_watermark is not False:
+        raise ValueError("A seed only takes effect with add_watermark=False.")
+    parameters = {
+        "sampleCount": sample_count,
+        "baseSteps": base_steps,
+        "safetySetting": safety_setting,
+        "personGeneration": person_generation,
+    }
+    if seed is not None:
+        parameters["seed"] = seed
+    if add_watermark is not None:
+        parameters["addWatermark"] = add_watermark
+    return parameters
+
+
+def _instances_bytes(instances):
+    return sum(
+        len(instance["personImage"]["image"]["bytesBase64Encoded"])
+        + sum(len(product["image"]["bytesBase64Encoded"]) for product in instance["productImages"])
+        for instance in instances
+    )
+
+
+def _prediction_b64(prediction):
+    return prediction.get("bytesBase64Encoded") or (prediction.get("image") or {}).get("bytesBase64Encoded") or ""
+
+
+# --- Decoding predictions ---
+@dataclass
+class DecodedImage:
+    data: bytes  # the image as returned, at full resolution (kept for download)
+    mime_type: str
+    preview: bytes = None  # display copy, if one was asked for
+
+
+def prediction_image_bytes(prediction):
+    """Decoded image bytes of one prediction; ValueError if it carries none."""
+    encoded = _prediction_b64(prediction)
+    if not encoded:
+        raise ValueError("No base64 encoded image found in the prediction dictionary.")
+    with metrics.stage("decode", model=VTO_MODEL):
+        # a2b_base64 reads the str as is and sizes its output once; b64decode
+        # would first copy the whole payload into an ASCII bytes object.
+        return binascii.a2b_base64(encoded)
+
+
+def decode_prediction(prediction, preview_edge=None):
+    """Decodes one prediction and, with ``preview_edge``, renders its display preview.
+
+    The preview goes through ``backend.previews``, so a later ``ui.show_image``
+    of the same bytes is a cache hit instead of a decode on the script thread.
+    """
+    data = prediction_image_bytes(prediction)
+    preview = previews.preview_bytes(data, preview_edge) if preview_edge else None
+    return DecodedImage(data, prediction.get("mimeType") or "image/png", preview)
+
+
+def decode_predictions(predictions, preview_edge=None):
+    """Decodes ``predictions`` concurrently on the fan-out pool.
+
+    Yields ``(i, DecodedImage, error)`` in completion order, like
+    ``fanout.iter_variations``; base64 and PIL work for one sample no longer
+    waits for the previous one.
+    """
+    predictions = list(predictions)
+    yield from fanout.iter_variations(lambda i: decode_prediction(predictions[i], preview_edge), len(predictions))
+
+
+def predict(client, endpoint, instances, parameters):
+    """Rate-limited, measured ``client.predict`` for try-on ``instances``."""
+    requested = len(instances) * parameters.get("sampleCount", 1)
+
+    def summarize(response):
+        predictions = list(response.predictions)
+        size = sum(len(_prediction_b64(prediction)) for prediction in predictions)
+        return size, len(predictions), max(0, requested - len(predictions))
+
+    call = metrics.observed("predict", VTO_MODEL, client.predict,
+                            request_bytes=_instances_bytes(instances), summarize=summarize)
+    return ratelimit.call(VTO_MODEL, call, endpoint=endpoint, instances=instances, parameters=parameters)
+
+
+# --- Matrix runs ---
+_matrix_lock = threading.Lock()
+matrix_counters = {"calls": 0, "pairs": 0, "short_responses": 0, "resent_pairs": 0}
+
+
+def _count_matrix(**amounts):
+    with _matrix_lock:
+        for name, amount in amounts.items():
+            matrix_counters[name] += amount
+
+
+def matrix_stats():
+    with _matrix_lock:
+        return dict(matrix_counters)
+
+
+def _predict_chunk(client, endpoint, chunk, person_b64s, product_b64s, parameters, decode, preview_edge,
+                   cancelled=None):
+    """One predict call for ``chunk``. Returns ``(results, resend)``: the pairs' results, or
+    (for a response that can't be attributed) no results and the pairs to send again one by one."""
+    if cancelled is not None and cancelled():
+        return [], []  # started just as the run was cancelled
+    instances = [build_instance(person_b64s[p], product_b64s[g]) for p, g in chunk]
+    response = predict(client, endpoint, instances, parameters)
+    _count_matrix(calls=1, pairs=len(chunk))
+    predictions = list(response.predictions)
+    # Predictions come back flat, sampleCount per instance, in instance order, but
+    # filtered outputs are simply missing. A short list can't be attributed to its
+    # pairs, so those pairs are sent again, one instance per request.
+    per_instance = parameters.get("sampleCount", 1)
+    if len(chunk) > 1 and len(predictions) != len(chunk) * per_instance:
+        _count_matrix(short_responses=1, resent_pairs=len(chunk))
+        return [], list(chunk)
+    if len(chunk) == 1:
+        per_instance = len(predictions)  # all of them are this pair's, however many got through
+    results = []
+    for i, pair in enumerate(chunk):
+        pair_predictions = predictions[i * per_instance:(i + 1) * per_instance]
+        if decode:
+            # Decoded here, on the worker that made the call, instead of one by one by the caller.
+            try:
+                pair_predictions = [decode_prediction(prediction, preview_edge) for prediction in pair_predictions]
+            except ValueError as e:
+                results.append((pair, None, e))
+                continue
+        results.append((pair, pair_predictions, None))
+    return results, []
+
+
+def run_matrix(client, endpoint, person_images, product_images, parameters,
+               max_instances_per_request=None, max_concurrency=None, decode=False, preview_edge=None, cancelled=None):
+    """Tries every product on every person.
+
+    ``person_images`` / ``product_images`` are lists of raw bytes. Each image
+    is base64-encoded exactly once and reused for all of its pairings. Pairs are
+    packed ``max_instances_per_request`` at a time into predict calls, with at
+    most ``max_concurrency`` calls in flight.
+
+    Yields ``((person_idx, product_idx), predictions, error)`` as calls finish.
+    With ``decode``, ``predictions`` are ``DecodedImage``s (with previews for
+    ``preview_edge``), decoded in parallel on the calls' worker threads.
+
+    A packed call whose response is short (a filtered output is simply
+    missing) can't be attributed to its pairs; they are sent again one per call
+    (counted in ``matrix_stats``), which bills the pairs that did succeed twice.
+
+    ``cancelled()`` is checked before every call is started. Once it returns
+    True the run stops without waiting for the calls in flight, and the rest
+    are never sent. The same happens when the caller stops iterating.
+    """
+    max_instances = max_instances_per_request or VTO_MAX_INSTANCES_PER_REQUEST
+    concurrency = max_concurrency or VTO_MAX_CONCURRENCY
+    cancelled = cancelled or (lambda: False)
+    person_b64s = [encode_image(b) for b in person_images]
+    product_b64s = [encode_image(b) for b in product_images]
+
+    pairs = [(p, g) for p in range(len(person_images)) for g in range(len(product_images))]
+    queued = [pairs[i:i + max_instances] for i in range(0, len(pairs), max_instances)]
+    queued.reverse()  # popped from the end, first chunk first
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="vto")
+    in_flight = {}
+    try:
+        while queued or in_flight:
+            # Submitted only as workers free up, so a cancel stops the calls not yet sent.
+            while queued and len(in_flight) < concurrency and not cancelled():
+                chunk = queued.pop()
+                future = executor.submit(contextvars.copy_context().run,
+                                         _predict_chunk, client, endpoint, chunk, person_b64s, product_b64s,
+                                         parameters, decode, preview_edge, cancelled)
+                in_flight[future] = chunk
+            if cancelled():
+                return
+            done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = in_flight.pop(future)
+                try:
+                    results, resend = future.result()
+                except Exception as e:
+                    for pair in chunk:
+                        yield pair, None, e
+                    continue
+                # Sent again next, one pair per call, on the same pool as the rest
+                queued.extend([pair] for pair in reversed(resend))
+                yield from results
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Two-tier try-on: fast preview, then refine ---
+_tier_lock = threading.Lock()
+tier_counters = {
+    "preview": {"runs": 0, "samples": 0, "seconds_total": 0.0},
+    "refine": {"runs": 0, "samples": 0, "seconds_total": 0.0},
+}
+
+
+def _record_tier(tier, samples, seconds):
+    with _tier_lock:
+        counters = tier_counters[tier]
+        counters["runs"] += 1
+        counters["samples"] += samples
+        counters["seconds_total"] += seconds
+
+
+def new_seed():
+    return random.randint(1, 2 ** 31 - 1)
+
+
+def _seeded_sample(client, endpoint, instance, base_steps, seed, preview_edge):
+    # Unwatermarked: the seed is what lets the refine re-run the previewed sample.
+    parameters = build_parameters(sample_count=1, base_steps=base_steps, seed=seed, add_watermark=False)
+    response = predict(client, endpoint, [instance], parameters)
+    predictions = list(response.predictions)
+    if not predictions:
+        raise ValueError("No image returned (it may have been filtered).")
+    return decode_prediction(predictions[0], preview_edge)
+
+
+def preview_samples(client, endpoint, person_b64, product_b64, seeds, base_steps=None, preview_edge=None):
+    """Tier 1: one low-step sample per seed in ``seeds``, all requested at once.
+
+    Each sample is its own ``sampleCount=1`` call with a known seed, so the
+    chosen one can be re-run at high steps by ``refine_sample``; with one call
+    of ``sampleCount=N`` the per-sample seeds are unknown. Yields
+    ``(i, DecodedImage, error)`` as samples finish, and records the tier's
+    latency (until the last sample) when done.
+    """
+    base_steps = base_steps or VTO_PREVIEW_STEPS
+    instance = build_instance(person_b64, product_b64)
+    started = time.perf_counter()
+    yield from fanout.iter_variations(
+        lambda i: _seeded_sample(client, endpoint, instance, base_steps, seeds[i], preview_edge), len(seeds)
+    )
+    _record_tier("preview", len(seeds), time.perf_counter() - started)
+
+
+def refine_sample(client, endpoint, person_b64, product_b64, seed, base_steps=None, preview_edge=None):
+    """Tier 2: re-runs the sample of ``seed`` at high steps. Returns ``(DecodedImage, seconds)``."""
+    started = time.perf_counter()
+    decoded = _seeded_sample(client, endpoint, build_instance(person_b64, product_b64),
+                             base_steps or VTO_REFINE_STEPS, seed, preview_edge)
+    seconds = time.perf_counter() - started
+    _record_tier("refine", 1, seconds)
+    return decoded, seconds
+
+
+def tier_stats():
+    with _tier_lock:
+        return {
+            tier: {**counters, "seconds_avg": round(counters["seconds_total"] / counters["runs"], 3) if counters["runs"] else None}
+            for tier, counters in tier_counters.items()
+        }
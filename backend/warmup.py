@@ -0,0 +1,108 @@
+"""Pre-warming a replica before it takes traffic.
+
+Pages import the SDKs and build their clients on first use (see
+``backend.sdk`` and ``lazy=True`` in ``backend.clients``), so a cold replica
+draws its first page quickly, but the first request still pays for the
+imports, credentials and client setup. ``prewarm`` does all of that up
+front. Run as the container entrypoint,
+
+    python -m backend.warmup --serve --project my-project -- --server.port 8080 --server.address 0.0.0.0
+
+it warms up and only then starts Streamlit in the same process. Streamlit
+binds its port after the warm-up, so a startup probe (Cloud Run's default
+TCP probe) doesn't admit traffic to a cold replica. Without ``--serve`` it
+warms up once and prints what each step cost.
+
+Clients are pooled by project, so pass the ``PROJECT_ID`` the pages are
+configured with; without ``--project`` only the SDKs, backend modules and
+credentials are warmed.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+HOME = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Home.py")
+DEFAULT_LOCATION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
+
+last_report = None  # shown in Home's backend status
+
+
+def _step(report, name, fn):
+    started = time.perf_counter()
+    entry = {"step": name}
+    try:
+        detail = fn()
+        if isinstance(detail, dict):
+            entry["detail"] = detail
+    except Exception as e:
+        # A replica that can't warm up still serves; the pages report the error on first use.
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["seconds"] = round(time.perf_counter() - started, 4)
+    report["steps"].append(entry)
+    return "error" not in entry
+
+
+def _import_backend():
+    # Every backend module a page imports; importing them opens the caches and blob store.
+    from backend import (  # noqa: F401
+        background, gemini, imagen, jobs, metrics, pipeline, previews, results, ui, uploads, vto,
+    )
+
+
+def prewarm(projects=(), location=DEFAULT_LOCATION):
+    """Imports the heavy SDKs and backend modules, loads credentials and builds the
+    pooled clients for ``projects``. Returns (and keeps in ``last_report``) the cost of each step."""
+    global last_report
+    from backend import clients, sdk
+
+    report = {"started_at": time.time(), "backend": clients.BACKEND, "steps": []}
+    started = time.perf_counter()
+    _step(report, "import streamlit", lambda: importlib.import_module("streamlit"))
+    _step(report, "import SDKs", lambda: {name: round(seconds, 4) for name, seconds in sdk.load().items()})
+    _step(report, "import backend", _import_backend)
+    if clients.BACKEND == "vertex" or clients.BACKEND.startswith("record:"):
+        if not _step(report, "credentials", clients.get_credentials):
+            projects = ()  # every client build would fail (slowly) the same way
+    for project in projects:
+        for family in ("imagen", "gemini"):
+            _step(report, f"genai client {project}/{family}",
+                  lambda: clients.get_genai_client(project, location, family=family))
+        _step(report, f"prediction client {project}",
+              lambda: clients.get_prediction_client(project, location))
+    report["seconds"] = round(time.perf_counter() - started, 4)
+    last_report = report
+    return report
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    argv, streamlit_args = (argv[:argv.index("--")], argv[argv.index("--") + 1:]) if "--" in argv else (argv, [])
+    parser = argparse.ArgumentParser(description="Warm up the SDKs and client pool, optionally then serve the app.")
+    parser.add_argument("--project", action="append", default=[],
+                        help="Project whose clients to build (repeatable; defaults to $GOOGLE_CLOUD_PROJECT)")
+    parser.add_argument("--location", default=DEFAULT_LOCATION)
+    parser.add_argument("--serve", action="store_true", help="Start Streamlit (Home.py) in this process afterwards; "
+                                                             "arguments after -- are passed to `streamlit run`")
+    args = parser.parse_args(argv)
+    projects = args.project or ([os.environ["GOOGLE_CLOUD_PROJECT"]] if os.environ.get("GOOGLE_CLOUD_PROJECT") else [])
+
+    # Through the imported module: run with -m, this file is __main__, and Home reads
+    # last_report from backend.warmup.
+    from backend import warmup
+    report = warmup.prewarm(projects, args.location)
+    print(json.dumps(report, indent=2), file=sys.stderr if args.serve else sys.stdout)
+    if not args.serve:
+        return 0
+
+    from backend import metrics
+    from streamlit.web import cli as stcli
+    metrics.serve()  # the pages would start it on first use anyway; up before traffic like the rest
+    sys.argv = ["streamlit", "run", HOME, *streamlit_args]
+    return stcli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,31 @@
-from google import genai
+from backend.clients import get_genai_client
 import streamlit as st
-from PIL import Image as PILImage # Alias PIL.Image to avoid name collision
-import io
+from backend import background, drafts, imagen, results, ui, uploads
+from backend.ingest import ingest_upload
 import os
 # Unused imports removed for clarity:
 # pandas, StringIO, IPython.display, re, base64, time, urllib, tempfile
 
-from google.genai.types import (
-    EditImageConfig,
-    Image, # This is google.genai.types.Image
-    MaskReferenceConfig,
-    MaskReferenceImage,
-    RawReferenceImage,
-    HarmBlockThreshold, # For safety_filter_level if passed directly
-    # HarmCategory, # Not directly used here but good for safety_settings generally
-)
+
+ui.page_setup("bg_edit")
 
 # --- Configuration ---
 PROJECT_ID = "<project-id>"
 REGION = "us-central1"
 # lang_model = "gemini-2.0-flash" # Not used in this specific script
 # img_model = "imagen-3.0-fast-generate-001" # Not used in this specific script
-edit_model = "imagen-3.0-capability-001" # This is the Imagen model for editing
+edit_model = background.EDIT_MODEL # This is the Imagen model for editing
 
 LOCATION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
 
-# --- Initialize Client ---
-try:
-    client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-except Exception as e:
-    st.error(f"Failed to initialize Google GenAI Client: {e}")
-    st.error(f"Project ID: {PROJECT_ID}, Location: {LOCATION}")
-    st.stop()
+# --- Google GenAI Client (shared, process-wide pool, built on first use) ---
+client = get_genai_client(PROJECT_ID, LOCATION, family="imagen", lazy=True)
 
 # --- Initialize Session State (Optional but good for prompt persistence) ---
 if 'bg_edit_prompt' not in st.session_state:
     st.session_state.bg_edit_prompt = "A serene beach at sunset with calm waves"
-if 'uploaded_image_bytes_for_bg_edit' not in st.session_state:
-    st.session_state.uploaded_image_bytes_for_bg_edit = None
+if 'bg_edit_image_handle' not in st.session_state:
+    st.session_state.bg_edit_image_handle = None  # blob handle; the bytes live in the blob store
 
 # --- Streamlit UI ---
 st.title('Background Editor')
@@ -51,28 +39,30 @@ uploaded_file_obj = st.file_uploader(
 
 # Handle image upload or use a default
 if uploaded_file_obj is not None:
-    st.session_state.uploaded_image_bytes_for_bg_edit = uploaded_file_obj.getvalue()
+    # Downsized/recompressed for the edit model once per upload and kept in the blob store
+    ui.keep_upload(uploaded_file_obj, "bg_edit_image", edit_model)
     st.info("Image uploaded successfully!")
-elif st.session_state.uploaded_image_bytes_for_bg_edit is None: # Only try default if nothing in session state
+elif uploads.get_view(st.session_state.bg_edit_image_handle) is None: # Only try default if nothing in session state
     # Optional: Load a default image if you have one
     default_image_path = "imgs/default_for_bg_edit.png" # Create this path and image
     if os.path.exists(default_image_path):
         try:
             with open(default_image_path, "rb") as f:
-                st.session_state.uploaded_image_bytes_for_bg_edit = f.read()
+                ui.keep_image("bg_edit_image", f.read(), edit_model)
             st.info(f"No file uploaded. Using default image: {default_image_path}")
         except Exception as e:
             st.warning(f"Could not load default image: {e}")
-            st.session_state.uploaded_image_bytes_for_bg_edit = None # Ensure it's None
+            st.session_state.bg_edit_image_handle = None # Ensure it's None
     else:
         st.info("No file uploaded and no default image found. Please upload an image.")
-        st.session_state.uploaded_image_bytes_for_bg_edit = None
+        st.session_state.bg_edit_image_handle = None
 
 
 # Proceed if we have image bytes
-if st.session_state.uploaded_image_bytes_for_bg_edit:
+bg_edit_image_bytes = uploads.get_bytes(st.session_state.bg_edit_image_handle)
+if bg_edit_image_bytes:
     st.subheader("Original Image:")
-    st.image(st.session_state.uploaded_image_bytes_for_bg_edit, caption="Your Image", width=400)
+    ui.show_image(st.session_state.bg_edit_image_handle, caption="Your Image", width=400)
 
     st.subheader("Describe the New Background")
     # Use session state for the prompt text input
@@ -82,76 +72,133 @@ if st.session_state.uploaded_image_bytes_for_bg_edit:
         key="bg_edit_prompt_input"
     )
 
-    if st.button("🎨 Edit Background", key="submit_bg_edit"):
+    draft_mode = st.toggle("Draft first, then finish the one I pick", key="bg_edit_draft_mode",
+                           help="Drafts are quick low-step edits of a downsized copy. Only the draft you pick is "
+                                "re-rendered at full quality (same seed) or upscaled.")
+    if not draft_mode:  # drafts always run in parallel, in the page
+        variation_mode = ui.variation_options("bg_edit")
+    fresh_results = None  # generation drawn by this run, so the history below doesn't repeat it
+    if draft_mode:
+        # --- Drafts: cheap variations first, full quality only for the picked one ---
+        final_mode = st.radio("Finish the picked draft by", drafts.FINAL_MODES, horizontal=True, key="bg_edit_final_mode",
+                              help=drafts.FINAL_MODES_HELP)
+        if final_mode == drafts.FINAL_RERENDER:
+            st.caption(f"The final is re-rendered from the full-resolution photo at full steps, with the draft's seed: "
+                       f"similar to the draft (which used {background.DRAFT_MAX_EDGE}px and {background.DRAFT_STEPS} steps), "
+                       f"not identical.")
+        generation, draft_state = drafts.current("bg_edit")
+        if generation is not None and draft_state["source"] != st.session_state.bg_edit_image_handle.digest:
+            drafts.discard("bg_edit")  # drafts of a previous photo
+            generation = draft_state = None
+
+        draft_area = st.empty()
+        if st.button(f"✏️ Draft {drafts.DRAFT_COUNT} backgrounds", key="submit_bg_draft"):
+            if not st.session_state.bg_edit_prompt.strip():
+                st.warning("Please enter a description for the background.")
+            else:
+                draft_prompt = st.session_state.bg_edit_prompt
+                draft_source = ingest_upload(bg_edit_image_bytes, background.DRAFT_MODEL, max_edge=background.DRAFT_MAX_EDGE).data
+                draft_references = background.bgswap_reference_images(draft_source)
+                # A new seed per click gives new drafts (seeded edits are cached); it is kept for the re-render.
+                draft_config = background.bgswap_config(number_of_images=drafts.DRAFT_COUNT, seed=drafts.new_seed(),
+                                                        base_steps=background.DRAFT_STEPS, output_mime_type="image/jpeg")
+
+                def call_draft(i):
+                    return imagen.edit_image(
+                        client,
+                        model=background.DRAFT_MODEL,
+                        prompt=draft_prompt,
+                        reference_images=draft_references,
+                        config=imagen.variation_config(draft_config, i),
+                    )
+
+                with draft_area.container(), st.spinner("Drafting backgrounds..."), ui.queue_notice():
+                    with drafts.TierRun("bg_edit", "draft", background.DRAFT_MODEL) as draft_run:
+                        draft_outputs = ui.show_variations_progressively(draft_run.meter(call_draft),
+                                                                         count=drafts.DRAFT_COUNT, caption="Draft")
+                generation = drafts.keep(
+                    "bg_edit", draft_outputs, label=draft_prompt, mime_type="image/jpeg",
+                    state={"source": st.session_state.bg_edit_image_handle.digest, "prompt": draft_prompt,
+                           "seed": draft_config.seed, "draft": draft_run.summary()},
+                )
+                draft_state = drafts.current("bg_edit")[1]
+
+        if generation is not None:
+            # Redrawn in place of the progressive tiles, now with a pick button under every draft
+            with draft_area.container():
+                picked = drafts.show_picker("bg_edit", generation)
+            if picked is not None:
+                try:
+                    with st.spinner(f"Finishing draft {picked+1}..."), ui.queue_notice():
+                        response, from_cache, draft_state["final"] = drafts.render_final(
+                            "bg_edit", client, generation.images[picked], final_mode,
+                            rerender=lambda: imagen.edit_image(
+                                client,
+                                model=edit_model,
+                                prompt=draft_state["prompt"],
+                                reference_images=background.bgswap_reference_images(bg_edit_image_bytes),
+                                config=background.bgswap_config(number_of_images=1, seed=draft_state["seed"] + picked),
+                            ),
+                            rerender_model=edit_model,
+                        )
+                    output_bytes = ui.image_bytes_of(response.generated_images[0]) if response.generated_images else None
+                    if output_bytes:
+                        st.success(f"Draft {picked+1} finished!")
+                        ui.show_image(output_bytes, caption=f"Edited version (draft {picked+1}, {final_mode.lower()})")
+                        fresh_results = results.record(
+                            "bg_edit", [output_bytes], label=f"{draft_state['prompt']} (draft {picked+1})",
+                            caption="Edited version", from_cache=from_cache,
+                        )
+                    else:
+                        st.warning("The API did not return an image (it may have been filtered).")
+                except Exception as e:
+                    st.error(f"An error occurred while finishing the draft: {e}")
+            st.caption(drafts.timing_caption(draft_state["draft"], draft_state["final"]))
+    elif st.button("🎨 Edit Background", key="submit_bg_edit"):
         if not st.session_state.bg_edit_prompt.strip():
             st.warning("Please enter a description for the background.")
         else:
-            with st.spinner("Generating new backgrounds... This might take a few moments."):
+            with st.spinner("Generating new backgrounds... This might take a few moments."), ui.queue_notice():
                 try:
-                    # Prepare the source image for the API
-                    source_gcp_image = Image(image_bytes=st.session_state.uploaded_image_bytes_for_bg_edit)
-
-                    raw_ref_image = RawReferenceImage(
-                        reference_image=source_gcp_image,
-                        reference_id=0
-                    )
-                    mask_ref_image = MaskReferenceImage(
-                        reference_id=1,
-                        reference_image=None, # No explicit mask needed for MASK_MODE_BACKGROUND
-                        config=MaskReferenceConfig(mask_mode="MASK_MODE_BACKGROUND"),
-                    )
-
-                    # Make the API call to Imagen
-                    response = client.models.edit_image(
-                        model=edit_model,
-                        prompt=st.session_state.bg_edit_prompt,
-                        reference_images=[raw_ref_image, mask_ref_image],
-                        config=EditImageConfig(
-                            edit_mode="EDIT_MODE_BGSWAP",
-                            number_of_images=4, # <<< REQUEST 4 IMAGES
-                            # aspect_ratio="1:1", # Optional: "16:9", "ORIGINAL"
-                            seed=42, # Optional: for reproducibility, or omit for variety
-                            safety_filter_level=HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE, # Your choice
-                            person_generation="ALLOW_ADULT", # Your choice
-                        ),
+                    # Source image + background mask, shared with the batch CLI (backend/batch_background.py)
+                    reference_images = background.bgswap_reference_images(bg_edit_image_bytes)
+                    edit_config = background.bgswap_config(number_of_images=4, seed=42) # <<< REQUEST 4 IMAGES
+
+                    # Workers can't read st.session_state, so pass the prompt in
+                    edit_prompt = st.session_state.bg_edit_prompt
+
+                    def call_variation(i):
+                        return imagen.edit_image(
+                            client,
+                            model=edit_model,
+                            prompt=edit_prompt,
+                            reference_images=reference_images,
+                            config=imagen.variation_config(edit_config, i),
+                        )
+
+                    outputs, from_cache = ui.run_variations(
+                        "bg_edit", variation_mode, call_variation,
+                        lambda: imagen.edit_image(client, model=edit_model, prompt=edit_prompt,
+                                                 reference_images=reference_images, config=edit_config),
+                        count=edit_config.number_of_images, caption="Edited version", heading="Generated Background Variations",
+                        job_label=f"Backgrounds: {st.session_state.bg_edit_prompt}",
+                        success="Backgrounds edited successfully!",
+                        cached_note="Same image, prompt and seed as an earlier request: served from the local cache.",
                     )
 
-                    st.success("Backgrounds edited successfully!")
-
-                    if response.generated_images:
-                        st.subheader(f"Generated Background Variations ({len(response.generated_images)}):")
-                        # Display images in columns for better layout
-                        cols = st.columns(min(len(response.generated_images), 4)) # Max 4 columns, or as many as images
-                        
-                        for i, generated_img_info in enumerate(response.generated_images):
-                            with cols[i % len(cols)]: # Cycle through columns
-                                st.write(f"Variation {i+1}:")
-                                output_bytes = None
-                                if hasattr(generated_img_info, 'image_bytes') and generated_img_info.image_bytes:
-                                    output_bytes = generated_img_info.image_bytes
-                                elif hasattr(generated_img_info, 'image') and hasattr(generated_img_info.image, '_pil_image') and generated_img_info.image._pil_image:
-                                    # If SDK gives a PIL image, convert to bytes for st.image
-                                    pil_img_obj = generated_img_info.image._pil_image
-                                    buf = io.BytesIO()
-                                    pil_img_obj.save(buf, format="PNG") # Or JPEG
-                                    output_bytes = buf.getvalue()
-                                
-                                if output_bytes:
-                                    st.image(output_bytes, caption=f"Edited version {i+1}")
-                                else:
-                                    st.warning(f"Could not retrieve image data for edited version {i+1}.")
-                                    # For debugging, you can print the structure of generated_img_info
-                                    # st.json(generated_img_info.to_dict() if hasattr(generated_img_info, 'to_dict') else str(generated_img_info))
-                    else:
-                        st.warning("The API did not return any generated images.")
-                        # st.json(response.to_dict() if hasattr(response, 'to_dict') else str(response))
-
+                    fresh_results = results.record("bg_edit", outputs, label=st.session_state.bg_edit_prompt,
+                                                   caption="Edited version", from_cache=from_cache)
 
                 except Exception as e:
                     st.error(f"An error occurred during image editing: {e}")
                     st.exception(e) # Provides full traceback for debugging
 
-else: # This else corresponds to 'if st.session_state.uploaded_image_bytes_for_bg_edit:'
+    results.show("bg_edit", skip=fresh_results, download_name="background_{i}.png")
+    ui.show_jobs("bg_edit", download_name="background_{i}.png")
+
+else: # This else corresponds to 'if bg_edit_image_bytes:'
     # This message is shown if no image is uploaded and no default is loaded.
     if not uploaded_file_obj: # only show if uploader is also empty (avoid showing if default load failed but uploader empty)
         st.warning("Please upload an image to edit its background.")
+
+ui.page_end()
@@ -1,22 +1,18 @@
-from google import genai
+from backend.clients import get_genai_client
 import streamlit as st
-from google.genai import types
-from PIL import Image
-import io
+from backend import imagen, results, ui
+from backend.sdk import types  # google.genai.types, imported on first use
 import os
 
+ui.page_setup("card")
+
 # --- Configuration  ---
 PROJECT_ID = "<projectid>"
 LOCATION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
 IMG_MODEL = "imagen-4.0-generate-preview-06-06"
 
-# --- Initialize Google GenAI Client ---
-try:
-    client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-except Exception as e:
-    st.error(f"Failed to initialize Google GenAI Client: {e}")
-    st.error(f"Project ID: {PROJECT_ID}, Location: {LOCATION}")
-    st.stop()
+# --- Google GenAI Client (shared, process-wide pool, built on first use) ---
+client = get_genai_client(PROJECT_ID, LOCATION, family="imagen", lazy=True)
 
 ## Greeting Card Template
 greeting_card_template = """
@@ -57,11 +53,15 @@ style = st.selectbox(
     )
 st.write("---")
 
+bypass_cache = st.checkbox("Bypass cache (new variations)", key="card_bypass_cache",
+                           help="Identical requests are served from the local cache. Tick to ask the model for new variations.")
+variation_mode = ui.variation_options("card")
+fresh_results = None  # generation drawn by this run, so the history below doesn't repeat it
 if st.button("Generate Card Options"):
     if not st.session_state.card_reason:
         st.warning("Please enter the reason for the card before generating.")
         st.stop()
-    with st.spinner("Generating card options... this might take a moment!"):
+    with st.spinner("Generating card options... this might take a moment!"), ui.queue_notice():
         try:
             card_prompt = greeting_card_template.format(
                 card_reason=st.session_state.card_reason,
@@ -70,46 +70,42 @@ if st.button("Generate Card Options"):
                 colors=st.session_state.colors,
                 card_style=style
             )
-            response = client.models.generate_images(
-                model=IMG_MODEL,
-                prompt=card_prompt,
-                config=types.GenerateImagesConfig(
-                    number_of_images=4,
-                    aspect_ratio="3:4",
-                    safety_filter_level="block_only_high",
-                    add_watermark=False,
-                    person_generation="ALLOW_ADULT",
-                ),
+            imagen_config = types.GenerateImagesConfig(
+                number_of_images=4,
+                aspect_ratio="3:4",
+                safety_filter_level="block_only_high",
+                add_watermark=False,
+                person_generation="ALLOW_ADULT",
+            )
+
+            def call_variation(i):
+                return imagen.generate_images(
+                    client,
+                    model=IMG_MODEL,
+                    prompt=card_prompt,
+                    config=imagen.variation_config(imagen_config, i),
+                    bypass_cache=bypass_cache,
+                    variation=i,
+                )
+
+            outputs, from_cache = ui.run_variations(
+                "card", variation_mode, call_variation,
+                lambda: imagen.generate_images(client, model=IMG_MODEL, prompt=card_prompt, config=imagen_config,
+                                               bypass_cache=bypass_cache),
+                count=imagen_config.number_of_images, caption="Card", heading="Card",
+                job_label=f"Cards: {st.session_state.card_reason}",
+                success="Card options generated successfully!",
+                cached_note="Served from the local cache. Tick \"Bypass cache\" for new variations.",
+                download_name="card_{i}.png",
             )
-            st.success("Card options generated successfully!")
-            if response.generated_images:
-                st.subheader(f"Card ({len(response.generated_images)}):")
-                # Display images in columns for better layout
-                cols = st.columns(min(len(response.generated_images), 4)) # Max 4 columns, or as many as images
-                
-                for i, generated_img_info in enumerate(response.generated_images):
-                    with cols[i % len(cols)]: # Cycle through columns
-                        st.write(f"Variation {i+1}:")
-                        output_bytes = None
-                        if hasattr(generated_img_info, 'image_bytes') and generated_img_info.image_bytes:
-                            output_bytes = generated_img_info.image_bytes
-                        elif hasattr(generated_img_info, 'image') and hasattr(generated_img_info.image, '_pil_image') and generated_img_info.image._pil_image:
-                            # If SDK gives a PIL image, convert to bytes for st.image
-                            pil_img_obj = generated_img_info.image._pil_image
-                            buf = io.BytesIO()
-                            pil_img_obj.save(buf, format="PNG") # Or JPEG
-                            output_bytes = buf.getvalue()
-                        if output_bytes:
-                            st.image(output_bytes, caption=f"Card {i+1}")
-                            st.download_button("Download Card", output_bytes, f"logo_{i+1}.png", mime="image/png")
-                        else:
-                            st.warning(f"Could not retrieve image data for {i+1}.")
-                            # For debugging, you can print the structure of generated_img_info
-                            # st.json(generated_img_info.to_dict() if hasattr(generated_img_info, 'to_dict') else str(generated_img_info))
-            else:
-                st.warning("The API did not return any generated images.")
-                # st.json(response.to_dict() if hasattr(response, 'to_dict') else str(response))
+
+            fresh_results = results.record("card", outputs, label=st.session_state.card_reason, caption="Card", from_cache=from_cache)
 
         except Exception as e:
             st.error(f"An error occurred during image editing: {e}")
             st.exception(e) # Provides full traceback for debugging
+
+results.show("card", skip=fresh_results, download_name="card_{i}.png")
+ui.show_jobs("card", download_name="card_{i}.png")
+
+ui.page_end()
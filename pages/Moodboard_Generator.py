@@ -1,23 +1,21 @@
-from google import genai
+from backend.clients import get_genai_client
 import streamlit as st
-from google.genai import types
-from PIL import Image
-import io
+from backend import drafts, imagen, results, ui
+from backend.sdk import types  # google.genai.types, imported on first use
 import os
 
+ui.page_setup("moodboard")
+
 # --- Configuration (unchanged) ---
 PROJECT_ID = "<project-id>"
 LOCATION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
 MODEL_ID = "gemini-2.5-flash-001"
 IMG_MODEL = "imagen-4.0-generate-preview-06-06"
+# Drafts (see backend.drafts) use the fast model; only the picked one is re-rendered with IMG_MODEL.
+DRAFT_IMG_MODEL = os.environ.get("MEDIA_STUDIO_MOODBOARD_DRAFT_MODEL", "imagen-4.0-fast-generate-preview-06-06")
 
-# --- Initialize Google GenAI Client (unchanged) ---
-try:
-    client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-except Exception as e:
-    st.error(f"Failed to initialize Google GenAI Client: {e}")
-    st.error(f"Project ID: {PROJECT_ID}, Location: {LOCATION}")
-    st.stop()
+# --- Google GenAI Client (shared, process-wide pool, built on first use) ---
+client = get_genai_client(PROJECT_ID, LOCATION, family="imagen", lazy=True)
 
 # --- Moodboard Prompt Template and Fixed Values (unchanged) ---
 moodboard_prompt_template = """
@@ -77,73 +75,149 @@ st.text_input("Target Audience:", key="target_audience")
 
 st.write("---")
 
+def moodboard_prompt():
+    return moodboard_prompt_template.format(
+        title=st.session_state.title_input,
+        keywords=st.session_state.keywords,
+        target_audience=st.session_state.target_audience,
+        color_1=fixed_colors["color_1"],
+        color_2=fixed_colors["color_2"],
+        color_3=fixed_colors["color_3"],
+        color_4=fixed_colors["color_4"],
+        color_5=fixed_colors["color_5"],
+        color_6=fixed_colors["color_6"],
+        remember=remember_notes
+    )
+
+
+def moodboard_config(number_of_images, seed=None):
+    return types.GenerateImagesConfig(
+        number_of_images=number_of_images,
+        aspect_ratio="16:9",
+        safety_filter_level="block_only_high",
+        add_watermark=False,  # also what lets a seed be set
+        person_generation="ALLOW_ADULT",
+        seed=seed,
+    )
+
+
 # --- Generate Moodboards Button ---
-if st.button("Generate Moodboards ✨", use_container_width=True):
+fresh_results = None  # generation drawn by this run, so the history below doesn't repeat it
+draft_mode = st.toggle("Draft first, then finish the one I pick", key="moodboard_draft_mode",
+                       help=f"Drafts come from the fast model ({DRAFT_IMG_MODEL}). Only the draft you pick is re-rendered "
+                            f"with {IMG_MODEL} (same prompt and seed, so close but not identical) or upscaled.")
+if not draft_mode:  # drafts are always new (fresh seed), parallel and in the page
+    bypass_cache = st.checkbox("Bypass cache (new variations)", key="moodboard_bypass_cache",
+                               help="Identical requests are served from the local cache. Tick to ask the model for new variations.")
+    variation_mode = ui.variation_options("moodboard")
+if draft_mode:
+    # --- Drafts: cheap variations first, full quality only for the picked one ---
+    final_mode = st.radio("Finish the picked draft by", drafts.FINAL_MODES, horizontal=True, key="moodboard_final_mode",
+                          help=drafts.FINAL_MODES_HELP)
+    if final_mode == drafts.FINAL_RERENDER:
+        st.caption(f"The final is re-rendered by {IMG_MODEL} with the draft's prompt and seed: similar to the draft "
+                   f"(from {DRAFT_IMG_MODEL}), not identical.")
+    generation, draft_state = drafts.current("moodboard")
+
+    draft_area = st.empty()
+    if st.button(f"Draft {drafts.DRAFT_COUNT} moodboards ✏️", use_container_width=True, key="moodboard_draft_button"):
+        if not st.session_state.title_input:
+            st.warning("Please enter a Moodboard Title before generating.")
+            st.stop()
+        draft_prompt = moodboard_prompt()
+        # Seeded, so the picked draft can be re-rendered; a new seed per click gives new drafts.
+        draft_config = moodboard_config(number_of_images=drafts.DRAFT_COUNT, seed=drafts.new_seed())
+
+        def call_draft(i):
+            return imagen.generate_images(
+                client,
+                model=DRAFT_IMG_MODEL,
+                prompt=draft_prompt,
+                config=imagen.variation_config(draft_config, i),
+            )
+
+        with draft_area.container(), st.spinner("Drafting your moodboards..."), ui.queue_notice():
+            with drafts.TierRun("moodboard", "draft", DRAFT_IMG_MODEL) as draft_run:
+                draft_outputs = ui.show_variations_progressively(draft_run.meter(call_draft),
+                                                                 count=drafts.DRAFT_COUNT, caption="Draft")
+        generation = drafts.keep(
+            "moodboard", draft_outputs, label=st.session_state.title_input,
+            state={"prompt": draft_prompt, "seed": draft_config.seed, "draft": draft_run.summary()},
+        )
+        draft_state = drafts.current("moodboard")[1]
+
+    if generation is not None:
+        # Redrawn in place of the progressive tiles, now with a pick button under every draft
+        with draft_area.container():
+            picked = drafts.show_picker("moodboard", generation)
+        if picked is not None:
+            try:
+                with st.spinner(f"Finishing draft {picked+1}..."), ui.queue_notice():
+                    response, from_cache, draft_state["final"] = drafts.render_final(
+                        "moodboard", client, generation.images[picked], final_mode,
+                        rerender=lambda: imagen.generate_images(
+                            client,
+                            model=IMG_MODEL,
+                            prompt=draft_state["prompt"],
+                            config=moodboard_config(number_of_images=1, seed=draft_state["seed"] + picked),
+                        ),
+                        rerender_model=IMG_MODEL,
+                    )
+                output_bytes = ui.image_bytes_of(response.generated_images[0]) if response.generated_images else None
+                if output_bytes:
+                    st.success(f"Draft {picked+1} finished!")
+                    ui.show_image(output_bytes, caption=f"Moodboard (draft {picked+1}, {final_mode.lower()})")
+                    fresh_results = results.record(
+                        "moodboard", [output_bytes], label=f"{generation.label} (draft {picked+1})",
+                        caption="Moodboard", from_cache=from_cache,
+                    )
+                else:
+                    st.warning("The API did not return an image (it may have been filtered).")
+            except Exception as e:
+                st.error(f"An error occurred while finishing the draft: {e}")
+        st.caption(drafts.timing_caption(draft_state["draft"], draft_state["final"]))
+elif st.button("Generate Moodboards ✨", use_container_width=True):
+
     if not st.session_state.title_input:
         st.warning("Please enter a Moodboard Title before generating.")
         st.stop()
 
-    with st.spinner("Generating your moodboards... this might take a moment!"):
+    with st.spinner("Generating your moodboards... this might take a moment!"), ui.queue_notice():
         try:
-            final_prompt = moodboard_prompt_template.format(
-                title=st.session_state.title_input,
-                keywords=st.session_state.keywords,
-                target_audience=st.session_state.target_audience,
-                color_1=fixed_colors["color_1"],
-                color_2=fixed_colors["color_2"],
-                color_3=fixed_colors["color_3"],
-                color_4=fixed_colors["color_4"],
-                color_5=fixed_colors["color_5"],
-                color_6=fixed_colors["color_6"],
-                remember=remember_notes
-            )
+            final_prompt = moodboard_prompt()
 
             st.info("Prompt sent to image generation model:")
             st.code(final_prompt)
 
-            # Make the API call to Imagen
-            response = client.models.generate_images(
-                model=IMG_MODEL,
-                prompt=final_prompt,
-                config=types.GenerateImagesConfig(
-                    number_of_images=4,
-                    aspect_ratio="16:9",
-                    safety_filter_level="block_only_high",
-                    add_watermark=False,
-                    person_generation="ALLOW_ADULT",
-                ),
+            imagen_config = moodboard_config(number_of_images=4)
+
+            def call_variation(i):
+                return imagen.generate_images(
+                    client,
+                    model=IMG_MODEL,
+                    prompt=final_prompt,
+                    config=imagen.variation_config(imagen_config, i),
+                    bypass_cache=bypass_cache,
+                    variation=i,
                 )
-            st.success("Moodboards generated successfully!")
-
-            if response.generated_images:
-                st.subheader(f"Generated Moodboard Variations ({len(response.generated_images)}):")
-                # Display images in columns for better layout
-                cols = st.columns(min(len(response.generated_images), 4)) # Max 4 columns, or as many as images
-                
-                for i, generated_img_info in enumerate(response.generated_images):
-                    with cols[i % len(cols)]: # Cycle through columns
-                        st.write(f"Variation {i+1}:")
-                        output_bytes = None
-                        if hasattr(generated_img_info, 'image_bytes') and generated_img_info.image_bytes:
-                            output_bytes = generated_img_info.image_bytes
-                        elif hasattr(generated_img_info, 'image') and hasattr(generated_img_info.image, '_pil_image') and generated_img_info.image._pil_image:
-                            # If SDK gives a PIL image, convert to bytes for st.image
-                            pil_img_obj = generated_img_info.image._pil_image
-                            buf = io.BytesIO()
-                            pil_img_obj.save(buf, format="PNG") # Or JPEG
-                            output_bytes = buf.getvalue()
-                        
-                        if output_bytes:
-                            st.image(output_bytes, caption=f"Moodboard {i+1}")
-                        else:
-                            st.warning(f"Could not retrieve image data for {i+1}.")
-                            # For debugging, you can print the structure of generated_img_info
-                            # st.json(generated_img_info.to_dict() if hasattr(generated_img_info, 'to_dict') else str(generated_img_info))
-            else:
-                st.warning("The API did not return any generated images.")
-                # st.json(response.to_dict() if hasattr(response, 'to_dict') else str(response))
 
+            outputs, from_cache = ui.run_variations(
+                "moodboard", variation_mode, call_variation,
+                lambda: imagen.generate_images(client, model=IMG_MODEL, prompt=final_prompt, config=imagen_config,
+                                               bypass_cache=bypass_cache),
+                count=imagen_config.number_of_images, caption="Moodboard", heading="Generated Moodboard Variations",
+                job_label=f"Moodboards: {st.session_state.title_input}",
+                success="Moodboards generated successfully!",
+                cached_note="Served from the local cache. Tick \"Bypass cache\" for new variations.",
+            )
+
+            fresh_results = results.record("moodboard", outputs, label=st.session_state.title_input, caption="Moodboard", from_cache=from_cache)
 
         except Exception as e:
             st.error(f"An error occurred during image editing: {e}")
             st.exception(e) # Provides full traceback for debugging
+
+results.show("moodboard", skip=fresh_results, download_name="moodboard_{i}.png")
+ui.show_jobs("moodboard", download_name="moodboard_{i}.png")
+
+ui.page_end()
@@ -1,20 +1,11 @@
-from google import genai
+from backend.clients import get_genai_client
 import streamlit as st
-import io
+from backend import gemini, imagen, pipeline, results, ui, uploads
 import os
-import json # For parsing Gemini's JSON output if we go that route
-
-from google.genai.types import (
-    GenerateContentConfig,
-    HarmBlockThreshold,
-    HarmCategory,
-    MediaResolution,
-    Part,
-    EditImageConfig,
-    Image,
-    SubjectReferenceImage,
-    SubjectReferenceConfig, # Ensure this is imported if used
-)
+
+from backend.sdk import types  # google.genai.types, imported on first use
+
+ui.page_setup("product")
 
 # --- Configuration ---
 PROJECT_ID = "<projectid>"
@@ -23,17 +14,17 @@ lang_model = "gemini-2.0-flash" # YOUR Gemini model
 edit_model = "imagen-3.0-capability-001" # YOUR Imagen model
 LOCATION = os.environ.get("GOOGLE_CLOUD_REGION", REGION) # Use REGION as default
 
-# --- Initialize Client ---
-try:
-    client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-except Exception as e:
-    st.error(f"Failed to initialize Google GenAI Client: {e}"); st.stop()
+# --- Google GenAI Client (shared, process-wide pool, built on first use) ---
+client = get_genai_client(PROJECT_ID, LOCATION, family="imagen", lazy=True)
+gemini_client = get_genai_client(PROJECT_ID, LOCATION, family="gemini", lazy=True)
 
 # --- Initialize Session State ---
 if 'user_base_imagen_prompt' not in st.session_state: # User's initial idea for the scene
     st.session_state.user_base_imagen_prompt = "A lifestyle shot of [1] on a marble countertop."
 if 'final_imagen_prompt_for_imagen' not in st.session_state: # This will hold the prompt ready for IMAGEN
     st.session_state.final_imagen_prompt_for_imagen = ""
+if 'final_imagen_prompt_area_key' not in st.session_state: # State of the (keyed) final prompt text area
+    st.session_state.final_imagen_prompt_area_key = st.session_state.final_imagen_prompt_for_imagen
 if 'uploaded_subject_image_details' not in st.session_state:
     st.session_state.uploaded_subject_image_details = []
 if 'ran_once_without_upload' not in st.session_state:
@@ -52,14 +43,26 @@ subject_files_widget_output = st.file_uploader( # Renamed for clarity
     key="subject_uploader_widget_key"
 )
 
-if subject_files_widget_output: # New files uploaded
+# This branch runs on every rerun while files are attached, so only a changed set of
+# files (by uploader file_id) re-ingests them and clears the prompt.
+subject_file_ids = tuple(file_obj.file_id for file_obj in subject_files_widget_output or ())
+if subject_files_widget_output and subject_file_ids != st.session_state.get("subject_file_ids"): # New files uploaded
+    st.session_state.subject_file_ids = subject_file_ids
     st.session_state.uploaded_subject_image_details = []
-    for file_obj in subject_files_widget_output:
+    for n, file_obj in enumerate(subject_files_widget_output):
+        # Downsized/recompressed once per upload and kept in the blob store; only the handle stays here
+        handle = ui.keep_upload(file_obj, f"subject_ref_{n}", edit_model)
         st.session_state.uploaded_subject_image_details.append(
-            {"bytes": file_obj.getvalue(), "type": file_obj.type, "name": file_obj.name}
+            {"handle": handle, "type": handle.mime_type, "name": file_obj.name}
         )
+    # Fewer files than last time: the slots past the new count would otherwise hold their images until the session ends
+    n = len(subject_files_widget_output)
+    while st.session_state.get(f"subject_ref_{n}_handle") is not None:
+        ui.forget_handle(st.session_state[f"subject_ref_{n}_handle"])
+        n += 1
     # If new images are uploaded, the old Gemini prompt might be irrelevant
     st.session_state.final_imagen_prompt_for_imagen = "" # Clear old prompt
+    st.session_state.final_imagen_prompt_area_key = ""
 
 # Display uploaded images
 if st.session_state.uploaded_subject_image_details:
@@ -72,8 +75,9 @@ if st.session_state.uploaded_subject_image_details:
         for j in range(cols_per_row):
             img_idx = i + j
             if img_idx < num_images and j < len(cols):
-                cols[j].image(st.session_state.uploaded_subject_image_details[img_idx]["bytes"],
-                              caption=f"{st.session_state.uploaded_subject_image_details[img_idx]['name']}", width=150)
+                ui.show_image(st.session_state.uploaded_subject_image_details[img_idx]["handle"],
+                              caption=f"{st.session_state.uploaded_subject_image_details[img_idx]['name']}", width=150,
+                              container=cols[j])
 else:
     if not st.session_state.ran_once_without_upload:
         st.info("Please upload at least one product image.")
@@ -118,9 +122,16 @@ def construct_gemini_user_text(user_scene_idea): # Renamed from your 'prompt' fu
 col1, col2 = st.columns(2)
 
 with col1:
-    if st.button("✨ Generate/Refine Imagen Prompt (with Gemini)", key="gemini_prompt_button",
-                  disabled=not st.session_state.uploaded_subject_image_details or not st.session_state.user_base_imagen_prompt.strip()):
-        with st.spinner("Gemini is crafting the Imagen prompt..."):
+    refine_disabled = not st.session_state.uploaded_subject_image_details or not st.session_state.user_base_imagen_prompt.strip()
+    refine_clicked = st.button("✨ Generate/Refine Imagen Prompt (with Gemini)", key="gemini_prompt_button",
+                               disabled=refine_disabled)
+    # Same image + scene + instruction is answered from the cache; this one always asks Gemini again.
+    different_clicked = st.button("🔄 Give me a different refinement", key="gemini_prompt_different_button",
+                                  disabled=refine_disabled)
+    stream_refinement = st.checkbox("Show Gemini's prompt as it is written", value=True, key="product_stream_refinement",
+                                    help="Streams the answer instead of waiting for the whole prompt.")
+    if refine_clicked or different_clicked:
+        with st.spinner("Gemini is crafting the Imagen prompt..."), ui.queue_notice():
             if not st.session_state.uploaded_subject_image_details: # Should be caught by disabled but good check
                 st.error("No images uploaded for Gemini."); st.stop()
 
@@ -128,50 +139,110 @@ with col1:
             # Using first image for Gemini's visual reference for description (if system prompt asks for it)
             first_image_detail = st.session_state.uploaded_subject_image_details[0]
             try:
-                gemini_image_parts.append(Part.from_bytes(
-                    data=first_image_detail["bytes"], mime_type=first_image_detail["type"]
+                gemini_image_parts.append(types.Part.from_bytes(
+                    data=uploads.get_bytes(first_image_detail["handle"]), mime_type=first_image_detail["type"]
                 ))
             except AttributeError: st.error("Part object missing 'from_bytes'. Check library."); st.exception(e); st.stop()
             except Exception as e: st.error(f"Error creating image Part for Gemini: {e}"); st.exception(e); st.stop()
 
             gemini_user_text_str = construct_gemini_user_text(st.session_state.user_base_imagen_prompt)
             try:
-                text_part_for_gemini = Part(text=gemini_user_text_str) # Using direct instantiation for text part
+                text_part_for_gemini = types.Part(text=gemini_user_text_str) # Using direct instantiation for text part
             except Exception as e: st.error(f"Failed to create text Part: {e}"); st.exception(e); st.stop()
 
             all_contents_for_gemini = [text_part_for_gemini] + gemini_image_parts
 
             try:
-                gemini_response = client.models.generate_content(
-                    model=lang_model, # YOUR lang_model
-                    contents=all_contents_for_gemini,
-                    config=GenerateContentConfig(
-                        system_instruction=system_instruction_for_gemini,
-                        # media_resolution=MediaResolution.MEDIA_RESOLUTION_LOW, # From your original code
-                    )
+                gemini_config = types.GenerateContentConfig(
+                    system_instruction=system_instruction_for_gemini,
+                    # media_resolution=types.MediaResolution.MEDIA_RESOLUTION_LOW, # From your original code
                 )
-                generated_text_from_gemini = getattr(gemini_response, 'text', None)
-                if not generated_text_from_gemini and gemini_response.candidates and gemini_response.candidates[0].content.parts:
-                    generated_text_from_gemini = "".join(p.text for p in gemini_response.candidates[0].content.parts if hasattr(p, 'text'))
+                timings = None
+                if stream_refinement:
+                    streamed_prompt = st.empty()
+                    generated_text_from_gemini, from_cache, timings = gemini.stream_text(
+                        gemini_client,
+                        model=lang_model, # YOUR lang_model
+                        contents=all_contents_for_gemini,
+                        config=gemini_config,
+                        bypass_cache=different_clicked,
+                        on_text=lambda text_so_far: streamed_prompt.info(text_so_far + " ▌"),
+                    )
+                    streamed_prompt.empty()
+                else:
+                    generated_text_from_gemini, from_cache = gemini.generate_text(
+                        gemini_client,
+                        model=lang_model, # YOUR lang_model
+                        contents=all_contents_for_gemini,
+                        config=gemini_config,
+                        bypass_cache=different_clicked,
+                    )
 
                 if generated_text_from_gemini and generated_text_from_gemini.strip():
                     st.session_state.final_imagen_prompt_for_imagen = generated_text_from_gemini.strip()
-                    st.success("Gemini generated/refined the Imagen prompt!")
-                    # No st.rerun() here, the text_area below will pick up the new session_state value
+                    # The text area below is keyed, so its own state has to be updated too
+                    st.session_state.final_imagen_prompt_area_key = st.session_state.final_imagen_prompt_for_imagen
+                    if from_cache:
+                        st.success("Reused Gemini's earlier refinement for this image and scene (from cache).")
+                    else:
+                        st.success("Gemini generated/refined the Imagen prompt!")
+                    if timings:
+                        st.caption(f"First words after {timings['ttft'] or timings['total']:.2f}s, full prompt after {timings['total']:.2f}s.")
+                    if "[1]" not in st.session_state.final_imagen_prompt_for_imagen:
+                        st.warning("Gemini's prompt is missing `[1]`. Edit it below or ask for a different refinement.")
                 else: st.error("Gemini returned an empty prompt.")
             except Exception as e: st.error(f"Error calling Gemini: {e}"); st.exception(e)
 
-# Text area for the FINAL Imagen prompt (populated by Gemini or user edited)
+# Text area for the FINAL Imagen prompt (populated by Gemini or user edited); its value lives in
+# st.session_state.final_imagen_prompt_area_key, which the Gemini step sets
 st.session_state.final_imagen_prompt_for_imagen = st.text_area(
     "**Final Prompt for Imagen (edit if needed):**",
-    value=st.session_state.final_imagen_prompt_for_imagen, # Displays Gemini's output or user's edits
     height=150,
     key="final_imagen_prompt_area_key",
     help="This prompt (containing [1]) will be sent to Imagen."
 )
 
 
+def subject_references_for_imagen():
+    """Reference images for Imagen: the first uploaded image as subject [1]."""
+    # Using ALL uploaded images as SubjectReferenceImage for [1]
+    # Imagen should ideally use these to better understand the subject for the [1] placeholder.
+    # If Imagen only uses the first one with reference_id=1, this is okay too.
+    # Your provided example used reference_id=1 for mujer[1].
+    # If multiple uploaded images refer to the same subject [1]:
+    # Option 1: Create one SubjectReferenceImage from the first uploaded image.
+    # Option 2: Create multiple SubjectReferenceImages, all with reference_id=1. (Let's try this)
+    # Option 3: Create multiple SubjectReferenceImages with unique IDs (0,1,2)
+    #           but prompt refers only to [1]. Less clear how Imagen handles this.
+
+    # Using first image as the primary SubjectReferenceImage for [1]
+    # (as per updated understanding from your snippet)
+    first_image_for_imagen_ref = st.session_state.uploaded_subject_image_details[0]
+    subject_gcp_image = types.Image(image_bytes=uploads.get_bytes(first_image_for_imagen_ref["handle"]))
+
+    # For SubjectReferenceConfig, we need a description.
+    # Let's use a simple one or derive it via another Gemini call if complex.
+    # For now, a generic one, or you can have a text_input for it.
+    # Or derive it from Gemini's general understanding if the Gemini system prompt was different.
+    # For now, let's use a simple description based on filename if available.
+    subject_desc_for_config = f"the uploaded product: {first_image_for_imagen_ref.get('name', 'product')}"
+    # This could also be a fixed string like you had "a headshot of a woman"
+    # Or derived from another Gemini output.
+
+    subject_ref_img = types.SubjectReferenceImage(
+        reference_id=1, # To match [1] in the prompt
+        reference_image=subject_gcp_image,
+        config=types.SubjectReferenceConfig( # As per your example
+            subject_description=subject_desc_for_config,
+            subject_type="SUBJECT_TYPE_PRODUCT" # Or "SUBJECT_TYPE_GENERIC" - check valid enums
+        )
+    )
+    return [subject_ref_img]
+
+
 with col2:
+    variation_mode = ui.variation_options("product")
+    fresh_results = None  # generation drawn by this run, so the history below doesn't repeat it
     if st.button("🎨 Generate Image with Imagen", key="imagen_generate_button",
                   disabled=not st.session_state.uploaded_subject_image_details or not st.session_state.final_imagen_prompt_for_imagen.strip()):
 
@@ -180,94 +251,161 @@ with col2:
         if "[1]" not in imagen_prompt_to_use: # Crucial check
             st.warning("The Final Imagen Prompt must include `[1]` to refer to your product. Please edit or regenerate."); st.stop()
 
-        with st.spinner(f"Imagen ('{edit_model}') is generating your image..."):
-            imagen_reference_images_list = []
-            # Using ALL uploaded images as SubjectReferenceImage for [1]
-            # Imagen should ideally use these to better understand the subject for the [1] placeholder.
-            # If Imagen only uses the first one with reference_id=1, this is okay too.
-            # Your provided example used reference_id=1 for mujer[1].
-            # If multiple uploaded images refer to the same subject [1]:
-            # Option 1: Create one SubjectReferenceImage from the first uploaded image.
-            # Option 2: Create multiple SubjectReferenceImages, all with reference_id=1. (Let's try this)
-            # Option 3: Create multiple SubjectReferenceImages with unique IDs (0,1,2)
-            #           but prompt refers only to [1]. Less clear how Imagen handles this.
-
-            # Using first image as the primary SubjectReferenceImage for [1]
-            # (as per updated understanding from your snippet)
+        with st.spinner(f"Imagen ('{edit_model}') is generating your image..."), ui.queue_notice():
             if not st.session_state.uploaded_subject_image_details:
                  st.error("No images uploaded for Imagen reference."); st.stop()
-
-            first_image_for_imagen_ref = st.session_state.uploaded_subject_image_details[0]
-            subject_gcp_image = Image(image_bytes=first_image_for_imagen_ref["bytes"])
-
-            # For SubjectReferenceConfig, we need a description.
-            # Let's use a simple one or derive it via another Gemini call if complex.
-            # For now, a generic one, or you can have a text_input for it.
-            # Or derive it from Gemini's general understanding if the Gemini system prompt was different.
-            # For now, let's use a simple description based on filename if available.
-            subject_desc_for_config = f"the uploaded product: {first_image_for_imagen_ref.get('name', 'product')}"
-            # This could also be a fixed string like you had "a headshot of a woman"
-            # Or derived from another Gemini output.
-
-            subject_ref_img = SubjectReferenceImage(
-                reference_id=1, # To match [1] in the prompt
-                reference_image=subject_gcp_image,
-                config=SubjectReferenceConfig( # As per your example
-                    subject_description=subject_desc_for_config,
-                    subject_type="SUBJECT_TYPE_PRODUCT" # Or "SUBJECT_TYPE_GENERIC" - check valid enums
-                )
-            )
-            references_for_imagen = [subject_ref_img]
+            references_for_imagen = subject_references_for_imagen()
 
             # !!! CRITICAL: Verify edit_mode from docs !!!
             # Your example used "EDIT_MODE_DEFAULT". Using that.
             chosen_imagen_edit_mode = "EDIT_MODE_DEFAULT"
 
+            imagen_config = types.EditImageConfig(
+                edit_mode=chosen_imagen_edit_mode,
+                number_of_images=4, #
+               # seed=1, # From your example
+                safety_filter_level=types.HarmBlockThreshold.BLOCK_ONLY_HIGH,
+                person_generation="ALLOW_ADULT", # From your example
+            )
+
             try:
-                imagen_response = client.models.edit_image(
-                    model=edit_model, # YOUR edit_model
-                    prompt=imagen_prompt_to_use,
-                    reference_images=references_for_imagen,
-                    config=EditImageConfig(
-                        edit_mode=chosen_imagen_edit_mode,
-                        number_of_images=4, #
-                       # seed=1, # From your example
-                        safety_filter_level=HarmBlockThreshold.BLOCK_ONLY_HIGH,
-                        person_generation="ALLOW_ADULT", # From your example
+                def call_variation(i):
+                    return imagen.edit_image(
+                        client,
+                        model=edit_model,
+                        prompt=imagen_prompt_to_use,
+                        reference_images=references_for_imagen,
+                        config=imagen.variation_config(imagen_config, i),
+                        variation=i,
                     )
+
+                outputs, from_cache = ui.run_variations(
+                    "product", variation_mode, call_variation,
+                    lambda: imagen.edit_image(client, model=edit_model, prompt=imagen_prompt_to_use,
+                                             reference_images=references_for_imagen, config=imagen_config),
+                    count=imagen_config.number_of_images, caption="Imagen Output", heading="Generated Images by Imagen",
+                    job_label=f"Product: {imagen_prompt_to_use}",
+                    success="Imagen processing complete!",
+                    cached_note="Same image, prompt and seed as an earlier request: served from the local cache.",
+                    max_columns=2,
                 )
-                st.success("Imagen processing complete!")
-                if imagen_response.generated_images: # This list will now contain up to 4 images
-                    st.subheader(f"Generated Images by Imagen ({len(imagen_response.generated_images)} variations):")
-                    
-                    # Determine number of columns, e.g., 2 or 4
-                    num_generated = len(imagen_response.generated_images)
-                    cols_per_row_output = min(num_generated, 2) # Display 2 images per row, or 4 if you prefer
-                    
-                    for i in range(0, num_generated, cols_per_row_output):
-                        cols = st.columns(cols_per_row_output)
-                        for j in range(cols_per_row_output):
-                            img_idx_output = i + j
-                            if img_idx_output < num_generated:
-                                with cols[j]: # Use the current column
-                                    img_info = imagen_response.generated_images[img_idx_output]
-                                    output_bytes = getattr(img_info, 'image_bytes', None)
-                                    if not output_bytes and hasattr(img_info, 'image') and hasattr(img_info.image, '_pil_image'):
-                                        buf = io.BytesIO()
-                                        img_info.image._pil_image.save(buf, format="PNG") # Or JPG
-                                        output_bytes = buf.getvalue()
-                                    
-                                    if output_bytes:
-                                        st.image(output_bytes, caption=f"Imagen Output {img_idx_output + 1}")
-                                    else:
-                                        st.warning(f"Could not display Imagen output {img_idx_output + 1}.")
-                else:
-                    st.warning("Imagen returned no images.")
+
+                fresh_results = results.record("product", outputs, label=imagen_prompt_to_use,
+                                               caption="Imagen Output", from_cache=from_cache)
 
             except Exception as e: st.error(f"Error during Imagen processing: {e}"); st.exception(e)
 
+    results.show("product", skip=fresh_results, download_name="product_{i}.png", max_columns=2)
+    ui.show_jobs("product", download_name="product_{i}.png")
+
+
+# --- One-click exploration: K Gemini prompts, each rendered by Imagen as soon as it is ready ---
+st.header('4. Explore Several Directions (Gemini → Imagen in one click)')
+st.caption("Gemini writes several different prompts for your scene; every prompt that keeps `[1]` goes straight to Imagen.")
+explore_col1, explore_col2 = st.columns(2)
+with explore_col1:
+    explore_directions = st.slider("Directions", min_value=2, max_value=6, value=3, key="product_explore_directions")
+with explore_col2:
+    explore_images = st.slider("Images per direction", min_value=1, max_value=4, value=2, key="product_explore_images")
+
+def construct_direction_user_text(user_scene_idea, direction, directions):
+    return (construct_gemini_user_text(user_scene_idea)
+            + f"\n\nThis is direction {direction + 1} of {directions}: take a clearly different angle"
+              " (setting, mood, lighting or composition) than the other directions would.")
+
+explore_disabled = not st.session_state.uploaded_subject_image_details or not st.session_state.user_base_imagen_prompt.strip()
+explore_button_col1, explore_button_col2 = st.columns(2)
+explore_clicked = explore_button_col1.button("🚀 Explore Directions", key="product_explore_button", disabled=explore_disabled)
+# Same image + scene gives the same directions from the cache; this one always asks Gemini again.
+explore_different_clicked = explore_button_col2.button("🔄 Explore different directions", key="product_explore_different_button",
+                                                      disabled=explore_disabled)
+if explore_clicked or explore_different_clicked:
+    try:
+        # Everything the workers need is read from the session here, on the script thread
+        first_image_detail = st.session_state.uploaded_subject_image_details[0]
+        explore_image_bytes = uploads.get_bytes(first_image_detail["handle"])
+        if explore_image_bytes is None:
+            raise ValueError("the uploaded product image expired, please re-upload it.")
+        explore_image_part = types.Part.from_bytes(data=explore_image_bytes, mime_type=first_image_detail["type"])
+        explore_scene = st.session_state.user_base_imagen_prompt
+        explore_references = subject_references_for_imagen()
+        explore_config = types.EditImageConfig(
+            edit_mode="EDIT_MODE_DEFAULT",
+            number_of_images=explore_images,
+            safety_filter_level=types.HarmBlockThreshold.BLOCK_ONLY_HIGH,
+            person_generation="ALLOW_ADULT",
+        )
+
+        def write_prompt(k):
+            text, _ = gemini.generate_text(
+                gemini_client,
+                model=lang_model,
+                contents=[types.Part(text=construct_direction_user_text(explore_scene, k, explore_directions)), explore_image_part],
+                config=types.GenerateContentConfig(system_instruction=system_instruction_for_gemini),
+                bypass_cache=explore_different_clicked,
+            )
+            return text
+
+        def render(k, prompt, i):
+            return imagen.edit_image(
+                client,
+                model=edit_model,
+                prompt=prompt,
+                reference_images=explore_references,
+                config=imagen.variation_config(explore_config, i),
+                variation=i,
+            )
+
+        # One block per direction, filled in as its prompt and images arrive
+        headers, tiles = [], []
+        for k in range(explore_directions):
+            headers.append(st.empty())
+            headers[k].info(f"Direction {k+1}: Gemini is writing the prompt...")
+            cols = st.columns(min(explore_images, 4))
+            tiles.append([cols[i % len(cols)].empty() for i in range(explore_images)])
+        outputs = [[None] * explore_images for _ in range(explore_directions)]
+        prompts = [None] * explore_directions
+
+        with ui.queue_notice():
+            for event in pipeline.run(write_prompt, render, explore_directions, explore_images,
+                                      accept=lambda prompt: "[1]" in prompt):
+                k, i = event.direction, event.index
+                if event.kind == pipeline.PROMPT:
+                    prompts[k] = event.prompt
+                    headers[k].markdown(f"**Direction {k+1}:** {event.prompt}")
+                    for tile in tiles[k]:
+                        tile.info("Generating...")
+                elif event.kind == pipeline.REJECTED:
+                    headers[k].warning(f"Direction {k+1} skipped: Gemini's prompt is missing `[1]`. ({event.prompt or 'empty'})")
+                elif event.kind == pipeline.PROMPT_FAILED:
+                    headers[k].error(f"Direction {k+1}: Gemini failed: {event.error}")
+                elif event.kind == pipeline.IMAGE_FAILED:
+                    tiles[k][i].error(f"Image {i+1} failed: {event.error}")
+                else:
+                    response, from_cache = event.result
+                    output_bytes = ui.image_bytes_of(response.generated_images[0]) if response.generated_images else None
+                    if not output_bytes:
+                        tiles[k][i].warning(f"Could not retrieve image {i+1} (it may have been filtered).")
+                        continue
+                    outputs[k][i] = output_bytes
+                    with tiles[k][i].container():
+                        ui.show_image(output_bytes, caption=f"Direction {k+1} · {i+1}" + (" (cached)" if from_cache else ""))
+
+        # One generation for the whole exploration (one row per direction), so it doesn't push
+        # its own directions and the earlier results out of the history.
+        explored = [k for k, prompt in enumerate(prompts) if prompt is not None]
+        results.record(
+            "product", [output for k in explored for output in outputs[k]],
+            label=f"Exploration of {len(explored)} directions: {explore_scene}", caption="Direction",
+            captions=[f"Direction {k+1} · {i+1}" for k in explored for i in range(explore_images)],
+            columns=explore_images,
+        )
+    except Exception as e: st.error(f"Error during exploration: {e}"); st.exception(e)
+
 
 # Your previous code for the Gemini call (which you said didn't show the prompt)
 # was mixed into the "Generate & Customize" button.
 # I've separated it for clarity: one button for Gemini, one for Imagen.
 # The text_area for final_imagen_prompt_for_imagen is the bridge.
+
+ui.page_end()
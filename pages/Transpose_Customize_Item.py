@@ -1,40 +1,26 @@
 # --- imports and configuration are correct ---
-from google import genai
+from backend.clients import get_genai_client
 import streamlit as st
-from PIL import Image
-import io
+from backend import imagen, results, ui, uploads
 import os
-from google import genai
-from google.genai import types
-
-from google.genai.types import (
-    SubjectReferenceConfig,
-    SubjectReferenceImage,
-    Image, # This is google.genai.types.Image
-    ControlReferenceImage,
-    ControlReferenceConfig,
-    RawReferenceImage,
-    EditImageConfig,
-)
+from backend.sdk import types  # google.genai.types, imported on first use
+ui.page_setup("transpose")
+
 # --- Configuration ---
 PROJECT_ID = "<project-id>"
 LOCATION = os.environ.get("GOOGLE_CLOUD_REGION", "us-central1")
 IMG_MODEL = "imagen-3.0-capability-001"
 
-# --- Initialize Google GenAI Client ---
-try:
-    client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-except Exception as e:
-    st.error(f"Failed to initialize Google GenAI Client: {e}")
-    st.error(f"Project ID: {PROJECT_ID}, Location: {LOCATION}")
-    st.stop()
+# --- Google GenAI Client (shared, process-wide pool, built on first use) ---
+client = get_genai_client(PROJECT_ID, LOCATION, family="imagen", lazy=True)
 
 
 # --- Initialize Session State (unchanged) ---
-if 'subject_img' not in st.session_state:
-    st.session_state.subject_img = None
-if 'cannyedge_img' not in st.session_state:
-    st.session_state.cannyedge_img = None
+# Blob handles; the image bytes live in the blob store, not in the session
+if 'subject_img_handle' not in st.session_state:
+    st.session_state.subject_img_handle = None
+if 'cannyedge_img_handle' not in st.session_state:
+    st.session_state.cannyedge_img_handle = None
 if 'user_prompt' not in st.session_state:
     st.session_state.user_prompt = None        
 
@@ -49,21 +35,22 @@ subject_file = st.file_uploader(
     key="subject_file"
 )
 if subject_file is not None:
-    st.session_state.subject_img = subject_file.getvalue()
-elif st.session_state.subject_img is None:
+    ui.keep_upload(subject_file, "subject_img", IMG_MODEL)
+elif uploads.get_view(st.session_state.subject_img_handle) is None:
     default_image_path = "imgs/subject.png"
     if os.path.exists(default_image_path):
         try:
             with open(default_image_path, "rb") as f:
-                st.session_state.subject_img = f.read()
+                ui.keep_image("subject_img", f.read(), IMG_MODEL)
         except Exception as e:
             st.warning(f"Could not load default image: {e}")
-            st.session_state.subject_img = None
+            st.session_state.subject_img_handle = None
     else:
-        st.session_state.subject_img = None
+        st.session_state.subject_img_handle = None
 
-if st.session_state.subject_img:
-    st.image(st.session_state.subject_img, caption="Current Product Image", width=250)
+subject_img_bytes = uploads.get_bytes(st.session_state.subject_img_handle)
+if subject_img_bytes:
+    ui.show_image(st.session_state.subject_img_handle, caption="Current Product Image", width=250)
 else:
     st.info("Please upload a product image.")
 
@@ -75,97 +62,101 @@ design_file = st.file_uploader(
     key="design_file"
 )
 if design_file is not None:
-    st.session_state.cannyedge_img = design_file.getvalue()
-elif st.session_state.cannyedge_img is None:
+    # Edge/control images stay lossless (PNG); JPEG artifacts would show up as edges
+    ui.keep_upload(design_file, "cannyedge_img", IMG_MODEL, image_format="PNG")
+elif uploads.get_view(st.session_state.cannyedge_img_handle) is None:
     default_image_path = "imgs/canny_edge.png"
     if os.path.exists(default_image_path):
         try:
             with open(default_image_path, "rb") as f:
-                st.session_state.cannyedge_img = f.read()
+                ui.keep_image("cannyedge_img", f.read(), IMG_MODEL, image_format="PNG")
         except Exception as e:
             st.warning(f"Could not load default image: {e}")
-            st.session_state.cannyedge_img = None
+            st.session_state.cannyedge_img_handle = None
     else:
-        st.session_state.cannyedge_img = None
+        st.session_state.cannyedge_img_handle = None
 
-if st.session_state.cannyedge_img:
-    st.image(st.session_state.cannyedge_img, caption="Current Design Image", width=250)
+cannyedge_img_bytes = uploads.get_bytes(st.session_state.cannyedge_img_handle)
+if cannyedge_img_bytes:
+    ui.show_image(st.session_state.cannyedge_img_handle, caption="Current Design Image", width=250)
 else:
     st.info("Please upload a design image.")
 
 st.text_input("Prompt:", key="user_prompt")
 
 # --- Generation Logic ---
-if st.session_state.cannyedge_img and st.session_state.subject_img:
+if cannyedge_img_bytes and subject_img_bytes:
     st.subheader("Ready to Print!")
+    variation_mode = ui.variation_options("transpose")
+    fresh_results = None  # generation drawn by this run, so the history below doesn't repeat it
     if st.button("Generate customized product image"):
         try:
-            with st.spinner("Generating customized product image... this might take a moment!"):
+            with st.spinner("Generating customized product image... this might take a moment!"), ui.queue_notice():
 
                 # FIX: Wrap the raw bytes in the google.genai.types.Image class
-                subject_image_sdk = Image(image_bytes=st.session_state.subject_img)
-                design_image_sdk = Image(image_bytes=st.session_state.cannyedge_img)
+                subject_image_sdk = types.Image(image_bytes=subject_img_bytes)
+                design_image_sdk = types.Image(image_bytes=cannyedge_img_bytes)
 
                 # Now, create the reference image objects using the wrapped Image objects
-                subject_reference_image = SubjectReferenceImage(
+                subject_reference_image = types.SubjectReferenceImage(
                     reference_id=1,
                     reference_image=subject_image_sdk, # <-- FIX
-                    config=SubjectReferenceConfig(
+                    config=types.SubjectReferenceConfig(
                         subject_description=st.session_state.subject_description, subject_type="SUBJECT_TYPE_PRODUCT"
                     )
                 )
 
-                control_reference_image = ControlReferenceImage(
+                control_reference_image = types.ControlReferenceImage(
                     reference_id=2,
                     reference_image=subject_image_sdk, # <-- FIX
-                    config=ControlReferenceConfig(control_type="CONTROL_TYPE_CANNY"),
+                    config=types.ControlReferenceConfig(control_type="CONTROL_TYPE_CANNY"),
                 )
 
-                control_ref_img = ControlReferenceImage(
+                control_ref_img = types.ControlReferenceImage(
                     reference_id=4,
                     reference_image=design_image_sdk, # <-- FIX
-                    config=ControlReferenceConfig(control_type="CONTROL_TYPE_CANNY"),
+                    config=types.ControlReferenceConfig(control_type="CONTROL_TYPE_CANNY"),
                 )
 
 
-                response = client.models.edit_image(
-                    model=IMG_MODEL,
-                    prompt=st.session_state.user_prompt,
-                    reference_images=[subject_reference_image, control_reference_image, control_ref_img],
-                    config=EditImageConfig(
-                        edit_mode="EDIT_MODE_DEFAULT",
-                        number_of_images=4,
-                        seed=1,
-                        safety_filter_level="BLOCK_MEDIUM_AND_ABOVE",
-                    ),
+                edit_config = types.EditImageConfig(
+                    edit_mode="EDIT_MODE_DEFAULT",
+                    number_of_images=4,
+                    seed=1,
+                    safety_filter_level="BLOCK_MEDIUM_AND_ABOVE",
                 )
-                
-                # --- (The rest of your response handling code is unchanged and should work) ---
-                st.success("Preview generation successful!")
-                if response.generated_images:
-                    st.subheader(f"Generated Preview ({len(response.generated_images)}):")
-                    cols = st.columns(min(len(response.generated_images), 4)) 
-                    
-                    for i, generated_img_info in enumerate(response.generated_images):
-                        with cols[i % len(cols)]: 
-                            st.write(f"Variation {i+1}:")
-                            output_bytes = None
-                            if hasattr(generated_img_info, 'image_bytes') and generated_img_info.image_bytes:
-                                output_bytes = generated_img_info.image_bytes
-                            elif hasattr(generated_img_info, 'image') and hasattr(generated_img_info.image, '_pil_image') and generated_img_info.image._pil_image:
-                                pil_img_obj = generated_img_info.image._pil_image
-                                buf = io.BytesIO()
-                                pil_img_obj.save(buf, format="PNG")
-                                output_bytes = buf.getvalue()
-                            if output_bytes:
-                                st.image(output_bytes, caption=f"Preview {i+1}")
-                            else:
-                                st.warning(f"Could not retrieve image data for {i+1}.")
-
-                else:
-                    st.warning("The API did not return any generated images.")
+                reference_images = [subject_reference_image, control_reference_image, control_ref_img]
+
+                # Workers can't read st.session_state, so pass the prompt in
+                edit_prompt = st.session_state.user_prompt
+
+                def call_variation(i):
+                    return imagen.edit_image(
+                        client,
+                        model=IMG_MODEL,
+                        prompt=edit_prompt,
+                        reference_images=reference_images,
+                        config=imagen.variation_config(edit_config, i),
+                    )
+
+                outputs, from_cache = ui.run_variations(
+                    "transpose", variation_mode, call_variation,
+                    lambda: imagen.edit_image(client, model=IMG_MODEL, prompt=edit_prompt,
+                                             reference_images=reference_images, config=edit_config),
+                    count=edit_config.number_of_images, caption="Preview", heading="Generated Preview",
+                    job_label=f"Prints: {st.session_state.user_prompt or 'Untitled'}",
+                    success="Preview generation successful!",
+                    cached_note="Same image, prompt and seed as an earlier request: served from the local cache.",
+                )
+
+                fresh_results = results.record("transpose", outputs, label=st.session_state.user_prompt or "Untitled",
+                                               caption="Preview", from_cache=from_cache)
 
         except Exception as e:
             st.error(f"Error during Imagen processing: {e}")
             st.exception(e)
 
+    results.show("transpose", skip=fresh_results, download_name="print_{i}.png")
+    ui.show_jobs("transpose", download_name="print_{i}.png")
+
+ui.page_end()
@@ -1,70 +1,25 @@
 import streamlit as st
-import base64
-import io
-import os
-import re
-import timeit
-from PIL import Image
-from google.cloud import aiplatform
-from google.cloud.aiplatform.gapic import PredictResponse
-from google.cloud import storage
-import matplotlib.pyplot as plt # Keep this if you still want to use display_row for debugging or other purposes
+from backend import jobs, previews, results, ui, uploads, vto
+from backend.clients import get_prediction_client
+from backend.ingest import ingest_upload
+import functools
+import time
+
+ui.page_setup("vto")
 
 # --- Configuration ---
 PROJECT_ID = "<projectid>"  # @param {type:"string"}
 LOCATION = "us-central1"  # @param ["us-central1"]
 
-aiplatform.init(project=PROJECT_ID, location=LOCATION)
-
-api_regional_endpoint = f"{LOCATION}-aiplatform.googleapis.com"
-client_options = {"api_endpoint": api_regional_endpoint}
-client = aiplatform.gapic.PredictionServiceClient(client_options=client_options)
+# --- Prediction Client (shared, process-wide pool) ---
+# aiplatform.init and the regional PredictionServiceClient are set up once per
+# process by the pool instead of on every rerun, and only once a try-on is requested.
+client = get_prediction_client(PROJECT_ID, LOCATION, lazy=True)
 
 # IMPORTANT: Verify this model endpoint. Sometimes models are updated or
 # have different versions. Check your Vertex AI console.
-model_endpoint = f"projects/{PROJECT_ID}/locations/{LOCATION}/publishers/google/models/virtual-try-on-exp-05-31"
-print(f"Prediction client initiated on project {PROJECT_ID} in {LOCATION}.")
-
-
-# Parses the generated image bytes from the response and converts it
-# to a PIL Image object.
-# This function expects a single prediction dictionary, NOT the whole PredictResponse object.
-def prediction_to_pil_image(
-    prediction_dict: dict, size=(640, 640)
-) -> Image.Image:
-    """
-    Parses the generated image bytes from a single prediction dictionary
-    and converts it to a PIL Image object.
-    """
-    encoded_bytes_string = None
-    # The Vertex AI Virtual Try-On model's prediction output structure is often like this:
-    # { 'bytesBase64Encoded': '...' } or { 'image': { 'bytesBase64Encoded': '...' } }
-    if "bytesBase64Encoded" in prediction_dict:
-        encoded_bytes_string = prediction_dict["bytesBase64Encoded"]
-    elif "image" in prediction_dict and isinstance(prediction_dict["image"], dict) and "bytesBase64Encoded" in prediction_dict["image"]:
-        encoded_bytes_string = prediction_dict["image"]["bytesBase64Encoded"]
-    # Add other potential keys if you discover them from debugging the API response
-
-    if not encoded_bytes_string:
-        raise ValueError("No base64 encoded image found in the prediction dictionary.")
-
-    decoded_image_bytes = base64.b64decode(encoded_bytes_string)
-    image_pil = Image.open(io.BytesIO(decoded_image_bytes))
-    image_pil.thumbnail(size)
-    return image_pil
-
-# This function is good as is for converting Streamlit uploads to base64
-def convert_uploaded_file_to_base64_string(uploaded_file):
-    if uploaded_file is not None:
-        try:
-            raw_bytes = uploaded_file.getvalue()
-            base64_bytes = base64.b64encode(raw_bytes)
-            base64_string = base64_bytes.decode("utf-8")
-            return base64_string
-        except Exception as e:
-            st.error(f"Error converting file to base64: {e}")
-            return None
-    return None
+model_endpoint = vto.model_endpoint(PROJECT_ID, LOCATION)
+
 
 # --- Streamlit UI Setup ---
 st.title('Virtual Try On')
@@ -74,16 +29,17 @@ st.markdown(''' 2) Bottoms: pants, leggings, shorts, skirts dresses''')
 st.markdown(''' 3) Footwear: Sneakers, boots, sandals, flats, heels, formal shoes''')
 
 # --- Initialize Session State ---
-# Store the RAW BYTES here from uploads
-if 'vto_model_bytes' not in st.session_state:
-    st.session_state.vto_model_bytes = None
-if 'vto_prod_bytes' not in st.session_state:
-    st.session_state.vto_prod_bytes = None
-# Store the BASE64 ENCODED STRINGS here for the API call
-if 'encoded_vto_model' not in st.session_state:
-    st.session_state.encoded_vto_model = None
-if 'encoded_vto_prod' not in st.session_state:
-    st.session_state.encoded_vto_prod = None
+# Only small blob handles live in the session. The (ingested) bytes sit once on disk in
+# the shared upload registry and are base64-encoded only when predict is called.
+if 'vto_model_handle' not in st.session_state:
+    st.session_state.vto_model_handle = None
+if 'vto_prod_handle' not in st.session_state:
+    st.session_state.vto_prod_handle = None
+# file_id of the upload behind each handle, so reruns don't re-read or re-hash it
+if 'vto_model_file_id' not in st.session_state:
+    st.session_state.vto_model_file_id = None
+if 'vto_prod_file_id' not in st.session_state:
+    st.session_state.vto_prod_file_id = None
 
 # --- Upload Model Image ---
 st.header('Upload a photo of your model')
@@ -93,14 +49,11 @@ uploaded_model = st.file_uploader(
     key="model_uploader" # Ensure this key is unique
 )
 if uploaded_model is not None:
-    # Store raw bytes for potential display or re-encoding
-    st.session_state.vto_model_bytes = uploaded_model.getvalue()
-    # Encode for API call and store the base64 string
-    st.session_state.encoded_vto_model = convert_uploaded_file_to_base64_string(uploaded_model)
+    vto_model_handle = ui.keep_upload(uploaded_model, "vto_model", vto.VTO_MODEL)
     st.info(f"Model image '{uploaded_model.name}' uploaded successfully!")
     # Display the uploaded image for confirmation
-    st.image(st.session_state.vto_model_bytes, caption="Model Image", use_container_width=True)
-elif st.session_state.vto_model_bytes is None:
+    ui.show_image(vto_model_handle, caption="Model Image", use_container_width=True)
+elif st.session_state.vto_model_handle is None:
     st.info("Please upload a model image.")
 
 # --- Upload Product Image ---
@@ -111,22 +64,116 @@ uploaded_item = st.file_uploader(
     key="item_uploader" # Ensure this key is unique
 )
 if uploaded_item is not None:
-    # Store raw bytes for potential display or re-encoding
-    st.session_state.vto_prod_bytes = uploaded_item.getvalue()
-    # Encode for API call and store the base64 string
-    st.session_state.encoded_vto_prod = convert_uploaded_file_to_base64_string(uploaded_item)
+    vto_prod_handle = ui.keep_upload(uploaded_item, "vto_prod", vto.VTO_MODEL)
     st.info(f"Product image '{uploaded_item.name}' uploaded successfully!")
     # Display the uploaded image for confirmation
-    st.image(st.session_state.vto_prod_bytes, caption="Product Image", use_container_width=True)
-elif st.session_state.vto_prod_bytes is None:
+    ui.show_image(vto_prod_handle, caption="Product Image", use_container_width=True)
+elif st.session_state.vto_prod_handle is None:
     st.info("Please upload a product image.")
 
+with st.expander("Session memory"):
+    st.json(uploads.session_report(ui.session_id()))
+
 # --- Generate Try-On Button and Logic ---
-if st.session_state.encoded_vto_model and st.session_state.encoded_vto_prod:
+vto_model_view = uploads.get_view(st.session_state.vto_model_handle)
+vto_prod_view = uploads.get_view(st.session_state.vto_prod_handle)
+if vto_model_view is not None and vto_prod_view is not None:
     st.subheader("Ready to Try On!")
-    if st.button("Generate try-on image"):
+    fresh_results = None  # generation drawn by this run, so the history below doesn't repeat it
+    progressive = st.toggle("Fast preview, then refine", key="vto_progressive",
+                            help="Tries several low-step samples first; only the one you pick is re-run at full quality.")
+    if progressive:
+        # --- Two-tier try-on: cheap previews, then one high-step refine ---
+        prog_col1, prog_col2, prog_col3 = st.columns(3)
+        preview_count = prog_col1.number_input("Preview samples", min_value=1, max_value=8,
+                                               value=vto.VTO_PREVIEW_SAMPLES, key="vto_preview_samples")
+        preview_steps = prog_col2.number_input("Preview steps", min_value=1, max_value=50,
+                                               value=vto.VTO_PREVIEW_STEPS, key="vto_preview_steps")
+        refine_steps = prog_col3.number_input("Refine steps", min_value=1, max_value=100,
+                                              value=vto.VTO_REFINE_STEPS, key="vto_refine_steps")
+        st.caption("Previews and the refined image are not watermarked: the refine re-runs the preview's seed, "
+                   "and the endpoint only honours a seed with the watermark off.")
+
+        # Previews are kept as blob handles (like the uploads) and dropped once either photo changes.
+        pair = (st.session_state.vto_model_handle.digest, st.session_state.vto_prod_handle.digest)
+        preview_state = st.session_state.get("vto_previews")
+        if preview_state is not None and (pair != preview_state["pair"] or st.button("Clear previews", key="vto_clear_previews")):
+            for handle in preview_state["handles"]:
+                uploads.release(handle)
+            preview_state = st.session_state.vto_previews = None
+
+        preview_area = st.empty()
+        if st.button(f"Preview {int(preview_count)} samples", key="vto_preview_button"):
+            if preview_state is not None:
+                for handle in preview_state["handles"]:
+                    uploads.release(handle)
+            first_seed = vto.new_seed()
+            seeds = [first_seed + i for i in range(int(preview_count))]
+            handles = [None] * len(seeds)
+            with preview_area.container():
+                cols = st.columns(min(len(seeds), 4))
+                tiles = [cols[i % len(cols)].empty() for i in range(len(seeds))]
+                started = time.perf_counter()
+                with st.spinner("Generating previews..."), ui.queue_notice():
+                    for i, decoded, error in vto.preview_samples(
+                        client, model_endpoint, vto.encode_image(vto_model_view), vto.encode_image(vto_prod_view),
+                        seeds, base_steps=int(preview_steps), preview_edge=previews.PREVIEW_MAX_EDGE,
+                    ):
+                        if error is not None:
+                            tiles[i].warning(f"Preview {i+1} failed: {error}")
+                        else:
+                            handles[i] = uploads.register(ui.session_id(), f"vto_preview/{i}", decoded.data,
+                                                          mime_type=decoded.mime_type)
+                            ui.show_image(handles[i], caption=f"Preview {i+1}", container=tiles[i],
+                                          use_container_width=True)
+            preview_state = st.session_state.vto_previews = {
+                "pair": pair, "seeds": seeds, "handles": handles, "steps": int(preview_steps),
+                "seconds": time.perf_counter() - started, "refined": None,
+            }
+
+        if preview_state is not None:
+            refine_clicked = None
+            # Redrawn in place of the tiles above, now with a refine button under every sample
+            with preview_area.container():
+                cols = st.columns(min(len(preview_state["seeds"]), 4))
+                for i, handle in enumerate(preview_state["handles"]):
+                    with cols[i % len(cols)]:
+                        if handle is None:
+                            st.warning(f"Preview {i+1} failed.")
+                            continue
+                        ui.show_image(handle, caption=f"Preview {i+1}", use_container_width=True)
+                        if st.button("Refine this one", key=f"vto_refine_{i}"):
+                            refine_clicked = i
+            if refine_clicked is not None:
+                seed = preview_state["seeds"][refine_clicked]
+                try:
+                    with st.spinner(f"Refining preview {refine_clicked+1} at {int(refine_steps)} steps..."), ui.queue_notice():
+                        refined, refine_seconds = vto.refine_sample(
+                            client, model_endpoint, vto.encode_image(vto_model_view), vto.encode_image(vto_prod_view),
+                            seed, base_steps=int(refine_steps), preview_edge=previews.PREVIEW_MAX_EDGE,
+                        )
+                    preview_state["refined"] = {"index": refine_clicked, "steps": int(refine_steps), "seconds": refine_seconds}
+                    st.success("Refined try-on ready!")
+                    ui.show_image(refined.data, caption=f"Refined try-on (preview {refine_clicked+1})",
+                                  use_container_width=True)
+                    fresh_results = results.record(
+                        "vto", [refined.data], label=f"Refined preview {refine_clicked+1} ({int(refine_steps)} steps)",
+                        caption="Refined try-on",
+                    )
+                except Exception as e:
+                    st.error(f"An error occurred during refine: {e}")
+
+            # Latency of both tiers for this pair
+            timing = (f"Preview: {len(preview_state['seeds'])} samples at {preview_state['steps']} steps "
+                      f"in {preview_state['seconds']:.1f}s")
+            if preview_state["refined"] is not None:
+                refined_info = preview_state["refined"]
+                timing += (f" · Refine: preview {refined_info['index']+1} at {refined_info['steps']} steps "
+                           f"in {refined_info['seconds']:.1f}s")
+            st.caption(timing)
+    elif st.button("Generate try-on image"):
         try:
-            with st.spinner("Generating your virtual try-on..."):
+            with st.spinner("Generating your virtual try-on..."), ui.queue_notice():
                 # --- CALL VERTEX AI API ---
                 sample_count = 1
                 base_steps = 25 # Controls quality vs speed
@@ -135,22 +182,16 @@ if st.session_state.encoded_vto_model and st.session_state.encoded_vto_prod:
 
                 # The Vertex AI Virtual Try-On API expects specific instance formatting.
                 # It expects a list of instances, and each instance is a dictionary.
-                # The image data should be base64 encoded strings.
+                # The image data should be base64 encoded strings, encoded here (only when
+                # a call is actually made) from the canonical registry buffers.
                 instances_payload = [
-                    {
-                        "personImage": {"image": {"bytesBase64Encoded": st.session_state.encoded_vto_model}},
-                        "productImages": [{"image": {"bytesBase64Encoded": st.session_state.encoded_vto_prod}}],
-                    }
+                    vto.build_instance(vto.encode_image(vto_model_view), vto.encode_image(vto_prod_view))
                 ]
 
-                parameters_payload = {
-                    "sampleCount": sample_count,
-                    "baseSteps": base_steps,
-                    "safetySetting": safety_setting,
-                    "personGeneration": person_generation,
-                }
+                parameters_payload = vto.build_parameters(sample_count, base_steps, safety_setting, person_generation)
 
-                response = client.predict(
+                response = vto.predict(
+                    client,
                     endpoint=model_endpoint,
                     instances=instances_payload,
                     parameters=parameters_payload # Pass parameters here
@@ -162,26 +203,27 @@ if st.session_state.encoded_vto_model and st.session_state.encoded_vto_prod:
                 st.subheader(f"Generated try-on ({len(response.predictions)}):")
 
                 num_predictions = len(response.predictions)
+                outputs = [None] * num_predictions
                 # Use Streamlit columns for better display
                 cols = st.columns(min(num_predictions, 4)) # Max 4 columns
+                tiles = []
+                for i in range(num_predictions):
+                    with cols[i % len(cols)]:
+                        st.write(f"Variation {i+1}:")
+                        tiles.append(st.empty())
 
-                for i, prediction_data_dict in enumerate(response.predictions):
-                    try:
-                        # Process each prediction dictionary to get a PIL Image
-                        pil_image = prediction_to_pil_image(prediction_data_dict)
-                        
-                        # Display in the correct column
-                        with cols[i % len(cols)]:
-                            st.write(f"Variation {i+1}:")
-                            st.image(pil_image, caption=f"Try-on image {i+1}", use_container_width=True)
-                            
-                    except ValueError as ve: # Catch errors from prediction_to_pil_image
-                        with cols[i % len(cols)]:
-                            st.warning(f"Could not display try-on image {i+1}: {ve}")
-                    except Exception as e: # Catch any other display errors
-                        with cols[i % len(cols)]:
-                            st.error(f"An error occurred displaying image {i+1}: {e}")
-                            st.exception(e) # For detailed debugging
+                # Samples are decoded (and their previews rendered) in parallel; each tile is
+                # filled as soon as its own sample is ready. Full-resolution bytes are kept for download.
+                for i, decoded, error in vto.decode_predictions(response.predictions, preview_edge=previews.PREVIEW_MAX_EDGE):
+                    if isinstance(error, ValueError): # No image in the prediction
+                        tiles[i].warning(f"Could not display try-on image {i+1}: {error}")
+                    elif error is not None: # Catch any other decode errors
+                        tiles[i].error(f"An error occurred displaying image {i+1}: {error}")
+                    else:
+                        outputs[i] = decoded.data
+                        ui.show_image(decoded.data, caption=f"Try-on image {i+1}", container=tiles[i],
+                                      use_container_width=True)
+                fresh_results = results.record("vto", outputs, label="Try-on", caption="Try-on image")
 
             else:
                 st.warning("The API did not return any generated images or the response was empty.")
@@ -192,3 +234,127 @@ if st.session_state.encoded_vto_model and st.session_state.encoded_vto_prod:
         except Exception as e:
             st.error(f"An error occurred during try-on: {e}")
             st.exception(e) # Provides full traceback for debugging
+
+    results.show("vto", skip=fresh_results, download_name="try_on_{i}.png")
+
+
+# --- Matrix Try-On: several models x several garments ---
+st.write("---")
+st.header('Try many garments on many models')
+st.caption("Every garment is tried on every model. Pairs are packed into as few predict calls as the endpoint allows "
+           "and run in parallel; each cell fills in as soon as its call returns.")
+matrix_models = st.file_uploader(
+    "Model photos (PNG, JPG, JPEG):",
+    type=["png", "jpg", "jpeg"],
+    accept_multiple_files=True,
+    key="matrix_model_uploader"
+)
+matrix_products = st.file_uploader(
+    "Garment photos (PNG, JPG, JPEG):",
+    type=["png", "jpg", "jpeg"],
+    accept_multiple_files=True,
+    key="matrix_item_uploader"
+)
+matrix_col1, matrix_col2 = st.columns(2)
+matrix_instances = matrix_col1.number_input("Try-ons per request", min_value=1, max_value=16,
+                                            value=vto.VTO_MAX_INSTANCES_PER_REQUEST, key="matrix_instances")
+matrix_concurrency = matrix_col2.number_input("Parallel requests", min_value=1, max_value=16,
+                                              value=vto.VTO_MAX_CONCURRENCY, key="matrix_concurrency")
+
+matrix_in_background = ui.background_option("vto_matrix")
+
+
+def run_matrix_job(ctx, person_images, product_images, captions, parameters, max_instances, concurrency):
+    """Background-job version of the matrix run: every finished pair is stored as a job output."""
+    finished = 0
+    for pair, predictions, error in vto.run_matrix(client, model_endpoint, person_images, product_images, parameters,
+                                                   max_instances_per_request=max_instances, max_concurrency=concurrency,
+                                                   decode=True, cancelled=lambda: ctx.cancelled):
+        ctx.check_cancelled()
+        index = pair[0] * len(product_images) + pair[1]
+        if error is not None:
+            ctx.add_error(f"{captions[index]} failed: {error}")
+        elif not predictions:
+            ctx.add_error(f"{captions[index]}: no image returned.")
+        else:
+            ctx.add_output(index, predictions[0].data, caption=captions[index])
+        finished += 1
+        ctx.progress(finished)
+    ctx.check_cancelled()  # run_matrix stops early (without an error) once cancelled
+
+
+fresh_matrix_results = None
+if matrix_models and matrix_products:
+    if st.button(f"Generate {len(matrix_models) * len(matrix_products)} try-on images", key="matrix_generate"):
+        matrix_captions = [f"{m.name} × {g.name}" for m in matrix_models for g in matrix_products]
+        matrix_label = f"{len(matrix_models)} models × {len(matrix_products)} garments"
+        try:
+            person_images = [ingest_upload(f.getvalue(), vto.VTO_MODEL).data for f in matrix_models]
+            product_images = [ingest_upload(f.getvalue(), vto.VTO_MODEL).data for f in matrix_products]
+            if matrix_in_background:
+                ui.start_job("vto_matrix", jobs.submit(
+                    "vto_matrix",
+                    matrix_label,
+                    functools.partial(
+                        run_matrix_job,
+                        person_images=person_images,
+                        product_images=product_images,
+                        captions=matrix_captions,
+                        parameters=vto.build_parameters(),
+                        max_instances=int(matrix_instances),
+                        concurrency=int(matrix_concurrency),
+                    ),
+                    total=len(matrix_models) * len(matrix_products),
+                ))
+            else:
+                # Grid: one row per model, one column per garment; each cell is filled as results arrive.
+                header_cols = st.columns(len(matrix_products) + 1)
+                for g, product_file in enumerate(matrix_products):
+                    ui.show_image(product_images[g], caption=product_file.name, container=header_cols[g + 1],
+                                  use_container_width=True)
+                cells = {}
+                for p, model_file in enumerate(matrix_models):
+                    row_cols = st.columns(len(matrix_products) + 1)
+                    ui.show_image(person_images[p], caption=model_file.name, container=row_cols[0],
+                                  use_container_width=True)
+                    for g in range(len(matrix_products)):
+                        cells[(p, g)] = row_cols[g + 1].empty()
+                        cells[(p, g)].info("Waiting...")
+
+                matrix_outputs = [None] * (len(matrix_models) * len(matrix_products))
+                with st.spinner("Generating try-on matrix..."), ui.queue_notice():
+                    for pair, predictions, error in vto.run_matrix(
+                        client,
+                        model_endpoint,
+                        person_images,
+                        product_images,
+                        vto.build_parameters(),
+                        max_instances_per_request=int(matrix_instances),
+                        max_concurrency=int(matrix_concurrency),
+                        decode=True,
+                        preview_edge=previews.PREVIEW_MAX_EDGE,
+                    ):
+                        cell = cells[pair]
+                        if isinstance(error, ValueError): # No image in the prediction
+                            cell.warning(f"Could not display: {error}")
+                        elif error is not None:
+                            cell.error(f"Failed: {error}")
+                        elif not predictions:
+                            cell.warning("No image returned.")
+                        else:
+                            # Decoded, with its preview, on the worker that made the call
+                            matrix_outputs[pair[0] * len(matrix_products) + pair[1]] = predictions[0].data
+                            ui.show_image(predictions[0].data, container=cell, use_container_width=True)
+                # Kept one row per model, as in the grid above, each image with its model × garment
+                fresh_matrix_results = results.record(
+                    "vto_matrix", matrix_outputs, caption="Try-on", columns=len(matrix_products),
+                    label=matrix_label, captions=matrix_captions,
+                )
+        except Exception as e:
+            st.error(f"An error occurred during the try-on matrix: {e}")
+            st.exception(e)
+
+results.show("vto_matrix", skip=fresh_matrix_results, download_name="try_on_matrix_{i}.png")
+ui.show_jobs("vto_matrix", download_name="try_on_matrix_{i}.png")
+
+ui.page_end()
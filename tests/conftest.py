@@ -0,0 +1,18 @@
+"""Offline defaults for the backend, which reads its configuration at import time."""
+import os
+import tempfile
+
+os.environ.setdefault("MEDIA_STUDIO_BACKEND", "fake")
+os.environ.setdefault("MEDIA_STUDIO_CACHE_DIR", tempfile.mkdtemp(prefix="media_studio_test_"))
+os.environ.setdefault("MEDIA_STUDIO_METRICS_PORT", "0")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def no_rate_limits(monkeypatch):
+    """Fresh, effectively unlimited per-model limiters, so tests don't queue for quota."""
+    from backend import ratelimit
+    monkeypatch.setattr(ratelimit, "RATE_LIMITS", {})
+    monkeypatch.setattr(ratelimit, "DEFAULT_RATE_PER_MINUTE", 1_000_000)
+    monkeypatch.setattr(ratelimit, "_limiters", {})
@@ -0,0 +1,93 @@
+"""Offline tests of the batch background CLI against the fake client."""
+import io
+import json
+import os
+import tempfile
+
+import pytest
+
+# Read at import time by the backend modules, so set before importing them.
+os.environ.setdefault("MEDIA_STUDIO_CACHE_DIR", tempfile.mkdtemp(prefix="media_studio_test_"))
+os.environ.setdefault("MEDIA_STUDIO_METRICS_PORT", "0")
+os.environ.setdefault("MEDIA_STUDIO_RATE_LIMITS", "imagen-3.0-capability-001=1000000")
+
+from backend import batch_background  # noqa: E402
+from backend.fakes import FakeGenAIClient  # noqa: E402
+
+
+def _png(color):
+    from PIL import Image as PILImage
+    buf = io.BytesIO()
+    PILImage.new("RGB", (64, 64), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    # Every test calls the fake model instead of reading another test's cached results.
+    from backend import cache
+    monkeypatch.setattr(cache.edit_image_cache, "root", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache.edit_image_cache, "_index", None)
+
+
+@pytest.fixture
+def shots(tmp_path):
+    shots = tmp_path / "shots"
+    (shots / "a").mkdir(parents=True)
+    (shots / "shoe.jpg").write_bytes(_png((200, 0, 0)))
+    (shots / "shoe.png").write_bytes(_png((0, 200, 0)))
+    (shots / "a" / "b.png").write_bytes(_png((0, 0, 200)))
+    (shots / "a_b.png").write_bytes(_png((200, 200, 0)))
+    return shots
+
+
+def _results(out_dir):
+    with open(out_dir / batch_background.RESULTS_FILE) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_run_writes_outputs_and_results(shots, tmp_path):
+    out_dir = tmp_path / "out"
+    rows = batch_background.read_rows(str(shots), "A white studio backdrop")
+    client = FakeGenAIClient()
+
+    summary = batch_background.run(client, rows, str(out_dir), concurrency=2, number_of_images=2, log=io.StringIO())
+
+    assert summary["total"] == 4 and summary["ok"] == 4 and summary["error"] == 0 and summary["skipped"] == 0
+    assert client.models.calls["edit_image"] == 4
+    results = {result["id"]: result for result in _results(out_dir)}
+    assert set(results) == {"shoe.jpg", "shoe.png", os.path.join("a", "b.png"), "a_b.png"}
+    outputs = [path for result in results.values() for path in result["outputs"]]
+    assert len(outputs) == 8 and len(set(outputs)) == 8  # no two rows share an output file
+    for path in outputs:
+        assert (out_dir / path).read_bytes().startswith(b"\x89PNG")
+
+
+def test_rerun_skips_rows_already_done(shots, tmp_path):
+    out_dir = tmp_path / "out"
+    rows = batch_background.read_rows(str(shots), "A white studio backdrop")
+    batch_background.run(FakeGenAIClient(), rows[:2], str(out_dir), log=io.StringIO())
+
+    client = FakeGenAIClient()
+    summary = batch_background.run(client, rows, str(out_dir), log=io.StringIO())
+
+    assert summary["skipped"] == 2 and summary["ok"] == 2
+    assert client.models.calls["edit_image"] == 2
+    assert sorted(result["id"] for result in _results(out_dir)) == sorted(row["id"] for row in rows)
+
+
+def test_rows_without_prompt_fail_and_are_retried(shots, tmp_path):
+    out_dir = tmp_path / "out"
+    rows = batch_background.read_rows(str(shots), "")
+    summary = batch_background.run(FakeGenAIClient(), rows, str(out_dir), log=io.StringIO())
+    assert summary["error"] == 4
+
+    rows = batch_background.read_rows(str(shots), "A white studio backdrop")
+    summary = batch_background.run(FakeGenAIClient(), rows, str(out_dir), log=io.StringIO())
+    assert summary["skipped"] == 0 and summary["ok"] == 4
+
+
+def test_duplicate_ids_are_rejected(tmp_path):
+    rows = [{"id": "shoe.png", "image": "x.png", "prompt": "p"}, {"id": "shoe.png", "image": "y.png", "prompt": "p"}]
+    with pytest.raises(ValueError, match="same output name"):
+        batch_background.run(FakeGenAIClient(), rows, str(tmp_path / "out"), log=io.StringIO())
@@ -0,0 +1,27 @@
+"""The load benchmark's statistics and a small offline run."""
+from backend import bench
+from backend.fakes import FakeGenAIClient, FakePredictionClient
+
+
+def test_percentiles_interpolate():
+    assert bench.percentile([4, 1, 3, 2], 50) == 2.5
+    assert bench.percentile([1, 2, 3, 4], 0) == 1
+    assert bench.percentile([1, 2, 3, 4], 100) == 4
+    assert bench.percentile([10], 99) == 10
+    assert bench.percentile([], 50) is None
+
+
+def test_latency_summary():
+    summary = bench.latency_summary([i / 100 for i in range(1, 101)])
+    assert summary == {"p50": 0.505, "p95": 0.9505, "p99": 0.9901, "max": 1.0}
+    assert bench.latency_summary([]) == {"p50": None, "p95": None, "p99": None, "max": None}
+
+
+def test_run_reports_every_request(no_rate_limits):
+    report = bench.run(["logo"], sessions=2, requests=2, genai_client=FakeGenAIClient(),
+                       prediction_client=FakePredictionClient())
+
+    logo = report["pipelines"]["logo"]
+    assert logo["requests"] == 4 and logo["failed_requests"] == 0
+    assert logo["images"] == 4 * bench.VARIATIONS
+    assert logo["latency_seconds"]["p50"] is not None
@@ -0,0 +1,58 @@
+"""Per-session blob storage."""
+import types
+
+import pytest
+
+from backend import blobstore
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """An empty store under ``tmp_path`` with a 1 MB quota and a clock that only moves when told to."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(blobstore, "BLOB_DIR", str(tmp_path))
+    monkeypatch.setattr(blobstore, "SESSION_QUOTA_MB", 1)
+    monkeypatch.setattr(blobstore, "BLOB_IDLE_MINUTES", 30)
+    monkeypatch.setattr(blobstore, "_sessions", {})
+    monkeypatch.setattr(blobstore, "counters", dict.fromkeys(blobstore.counters, 0))
+    monkeypatch.setattr(blobstore, "_on_delete", [])
+    monkeypatch.setattr(blobstore, "time", types.SimpleNamespace(time=lambda: now[0]))
+
+    def advance(minutes):
+        now[0] += minutes * 60
+    return types.SimpleNamespace(advance=advance)
+
+
+def test_session_quota(store):
+    first = blobstore.put("s1", "person", b"a" * (MB // 2))
+    blobstore.put("s1", "garment", b"a" * (MB // 2))  # same content: counted once
+
+    with pytest.raises(blobstore.QuotaExceeded):
+        blobstore.put("s1", "mask", b"b" * (MB // 2 + 1))
+    assert blobstore.session_bytes("s1") == MB // 2
+
+    # Replacing a slot frees what it held, and other sessions have their own quota.
+    blobstore.put("s1", "person", b"c" * (MB // 2))
+    blobstore.put("s2", "person", b"d" * MB)
+    assert blobstore.session_bytes("s1") == MB and blobstore.session_bytes("s2") == MB
+    assert blobstore.get_bytes(first) == b"a" * (MB // 2)
+
+
+def test_idle_sessions_are_evicted(store):
+    deleted = []
+    blobstore.on_delete(deleted.append)
+    shared = blobstore.put("idle", "person", b"shared")
+    only_idle = blobstore.put("idle", "garment", b"only idle")
+    blobstore.put("active", "person", b"shared")
+
+    store.advance(minutes=20)
+    blobstore.get_view(blobstore.put("active", "garment", b"active"))
+    store.advance(minutes=20)
+    blobstore.put("new", "person", b"new")  # every put first evicts idle sessions
+
+    assert set(blobstore.memory_report()["sessions"]) == {"active", "new"}
+    assert blobstore.counters["idle_sessions_evicted"] == 1
+    assert blobstore.get_bytes(only_idle) is None and deleted == [only_idle.digest]
+    assert blobstore.get_bytes(shared) == b"shared"  # still used by the active session
@@ -0,0 +1,77 @@
+"""The on-disk result cache."""
+import os
+import types
+
+import pytest
+
+from backend import cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the cache's clock with one that only moves when told to."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+
+    def advance(seconds=1):
+        now[0] += seconds
+    return advance
+
+
+def _blob(text):
+    return [(text.encode(), "image/png")]
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    store = cache.DiskCache(str(tmp_path), max_bytes=8, ttl_seconds=0)
+    store.put("a" * 64, _blob("aaaa"))
+    clock()
+    store.put("b" * 64, _blob("bbbb"))
+    clock()
+    assert store.get("a" * 64) == _blob("aaaa")  # a is now the most recent
+    clock()
+
+    store.put("c" * 64, _blob("cccc"))
+
+    assert store.get("b" * 64) is None
+    assert store.get("a" * 64) == _blob("aaaa") and store.get("c" * 64) == _blob("cccc")
+    assert store.stats()["evictions"] == 1 and store.stats()["bytes"] == 8
+
+
+def test_expired_entry_is_a_miss_and_removed(tmp_path, clock):
+    store = cache.DiskCache(str(tmp_path), max_bytes=1024, ttl_seconds=60)
+    store.put("a" * 64, _blob("aaaa"))
+    clock(59)
+    assert store.get("a" * 64) == _blob("aaaa")
+
+    clock(2)
+
+    assert store.get("a" * 64) is None
+    assert store.stats()["expired"] == 1 and store.stats()["entries"] == 0
+    assert not (tmp_path / "aa" / ("a" * 64)).exists()
+
+
+def test_index_and_lru_order_survive_a_restart(tmp_path):
+    store = cache.DiskCache(str(tmp_path), max_bytes=8, ttl_seconds=0)
+    store.put("a" * 64, _blob("aaaa"))
+    store.put("b" * 64, _blob("bbbb"))
+    # The LRU order lives in the meta files' mtimes: a was used after b.
+    os.utime(tmp_path / "bb" / ("b" * 64) / "meta.json", (1_000, 1_000))
+    os.utime(tmp_path / "aa" / ("a" * 64) / "meta.json", (2_000, 2_000))
+    (tmp_path / "cc" / ("c" * 64)).mkdir(parents=True)  # half-written entry without meta.json
+
+    restarted = cache.DiskCache(str(tmp_path), max_bytes=8, ttl_seconds=0)
+    assert restarted.stats()["entries"] == 2
+    assert not (tmp_path / "cc" / ("c" * 64)).exists()
+    restarted.put("d" * 64, _blob("dddd"))
+
+    assert restarted.get("b" * 64) is None
+    assert restarted.get("a" * 64) == _blob("aaaa")
+
+
+def test_fingerprint_and_digest():
+    assert cache.fingerprint("model", {"b": 1, "a": 2}) == cache.fingerprint("model", {"a": 2, "b": 1})
+    assert cache.fingerprint("model", {"a": 1}) != cache.fingerprint("model", {"a": 2})
+    data = bytes(range(256)) * 10_000  # spans several hash chunks
+    assert cache.digest_bytes(data) == cache.digest_bytes(bytearray(data))
+    assert cache.digest_bytes(data) != cache.digest_bytes(data[:-1])
@@ -0,0 +1,98 @@
+"""The offline fakes: latency/error profiles and record/replay fixtures."""
+import base64
+import time
+
+import pytest
+from google.genai import types
+
+from backend import ratelimit
+from backend.fakes import (
+    FakeAPIError, FakeGenAIClient, FakePredictionClient, FakeProfile, FixtureMissing, RecordingGenAIClient,
+    RecordingPredictionClient, ReplayGenAIClient, ReplayPredictionClient,
+)
+
+MODEL = "imagen-4.0-generate-preview-06-06"
+
+
+def _image_bytes(response):
+    return [generated.image.image_bytes for generated in response.generated_images]
+
+
+def test_profile_latency_is_scaled():
+    profile = FakeProfile(latency={"generate_images": (0.2, 0.0)}, time_scale=0.5)
+    models = FakeGenAIClient(profile=profile).models
+
+    started = time.perf_counter()
+    models.generate_images(model=MODEL, prompt="a cat")
+    elapsed = time.perf_counter() - started
+
+    assert 0.09 <= elapsed < 0.2
+    assert models.calls["generate_images"] == 1
+
+
+def test_profile_errors_are_throttles_or_unavailable():
+    throttled = FakeGenAIClient(profile=FakeProfile(error_rate=1.0, throttle_share=1.0)).models
+    with pytest.raises(FakeAPIError) as error:
+        throttled.generate_images(model=MODEL, prompt="a cat")
+    assert error.value.code == 429 and ratelimit.is_throttle_error(error.value)
+
+    unavailable = FakePredictionClient(profile=FakeProfile(error_rate=1.0, throttle_share=0.0))
+    with pytest.raises(FakeAPIError) as error:
+        unavailable.predict(endpoint="vto", instances=[])
+    assert error.value.code == 503 and not ratelimit.is_throttle_error(error.value)
+
+
+def test_noise_payload_is_unique_and_photo_sized():
+    solid = FakeGenAIClient(profile=FakeProfile(image_size=(256, 256))).models
+    noise = FakeGenAIClient(profile=FakeProfile(image_size=(256, 256), payload="noise")).models
+    config = types.GenerateImagesConfig(number_of_images=2)
+
+    solid_images = _image_bytes(solid.generate_images(model=MODEL, prompt="a cat", config=config))
+    noise_images = _image_bytes(noise.generate_images(model=MODEL, prompt="a cat", config=config))
+
+    assert all(image.startswith(b"\x89PNG") for image in solid_images + noise_images)
+    assert len(set(noise_images)) == 2
+    assert min(map(len, noise_images)) > 20 * max(map(len, solid_images))
+
+
+def test_genai_record_then_replay(tmp_path):
+    config = types.GenerateImagesConfig(number_of_images=2, seed=7, add_watermark=False)
+    recorder = RecordingGenAIClient(FakeGenAIClient(), str(tmp_path))
+    recorded = recorder.models.generate_images(model=MODEL, prompt="a cat", config=config)
+    recorded_text = [chunk.text for chunk in recorder.models.generate_content_stream(model="gemini", contents=["hi"])]
+
+    replay = ReplayGenAIClient(str(tmp_path))
+    replayed = replay.models.generate_images(model=MODEL, prompt="a cat", config=config)
+    replayed_text = [chunk.text for chunk in replay.models.generate_content_stream(model="gemini", contents=["hi"])]
+
+    assert _image_bytes(replayed) == _image_bytes(recorded)
+    assert replayed_text == recorded_text
+    assert replay.models.fixtures.counters["replayed"] == 2
+    with pytest.raises(FixtureMissing):
+        replay.models.generate_images(model=MODEL, prompt="a dog", config=config)
+
+
+def test_replay_falls_back_for_missing_fixtures(tmp_path):
+    fallback = FakeGenAIClient()
+    replay = ReplayGenAIClient(str(tmp_path), fallback=fallback)
+
+    response = replay.models.generate_images(model=MODEL, prompt="a dog")
+
+    assert len(response.generated_images) == 1
+    assert fallback.models.calls["generate_images"] == 1
+    assert replay.models.fixtures.counters["missing"] == 1
+
+
+def test_predict_record_then_replay(tmp_path):
+    person = base64.b64encode(b"person").decode()
+    instances = [{"personImage": {"image": {"bytesBase64Encoded": person}},
+                  "productImages": [{"image": {"bytesBase64Encoded": person}}]}]
+    parameters = {"sampleCount": 2, "baseSteps": 8}
+    recorded = RecordingPredictionClient(FakePredictionClient(), str(tmp_path)).predict(
+        endpoint="vto", instances=instances, parameters=parameters)
+
+    replay = ReplayPredictionClient(str(tmp_path))
+
+    assert replay.predict(endpoint="vto", instances=instances, parameters=parameters).predictions == recorded.predictions
+    with pytest.raises(FixtureMissing):
+        replay.predict(endpoint="vto", instances=instances, parameters={**parameters, "baseSteps": 40})
@@ -0,0 +1,73 @@
+"""Background jobs and what is left of them after a restart."""
+import time
+
+import pytest
+
+from backend import jobs
+
+
+@pytest.fixture
+def job_dir(tmp_path, monkeypatch):
+    """An empty job store under ``tmp_path``."""
+    monkeypatch.setattr(jobs, "JOB_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "_jobs", {})
+    monkeypatch.setattr(jobs, "_cancel_events", {})
+    monkeypatch.setattr(jobs, "_futures", {})
+    return tmp_path
+
+
+def _restart(monkeypatch):
+    """What a new process sees: only the job files."""
+    monkeypatch.setattr(jobs, "_jobs", {})
+    jobs._load_all()
+
+
+def _wait(job_id):
+    deadline = time.monotonic() + 5
+    while jobs.get(job_id).status not in jobs.FINISHED and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return jobs.get(job_id)
+
+
+def test_unfinished_jobs_come_back_interrupted(job_dir, monkeypatch):
+    now = time.time()
+    for job in [
+        jobs.Job(id="running", kind="logo", label="Logos", status=jobs.RUNNING, started=now, total=4, done=2),
+        jobs.Job(id="queued", kind="logo", label="Logos", status=jobs.QUEUED),
+        jobs.Job(id="done", kind="logo", label="Logos", status=jobs.DONE, finished=now),
+        jobs.Job(id="expired", kind="logo", label="Logos", status=jobs.RUNNING,
+                 created=now - (jobs.JOB_TTL_HOURS + 1) * 3600),
+    ]:
+        jobs._save(job)
+    (job_dir / "corrupt").mkdir()
+    (job_dir / "corrupt" / "job.json").write_text("{")
+
+    _restart(monkeypatch)
+
+    assert sorted(jobs._jobs) == ["done", "queued", "running"]
+    for job_id in ["running", "queued"]:
+        job = jobs.get(job_id)
+        assert job.status == jobs.INTERRUPTED and job.finished and "restarted" in job.error
+    assert jobs.get("running").done == 2
+    assert jobs.get("done").status == jobs.DONE and jobs.get("done").error is None
+    assert not (job_dir / "expired").exists()
+
+    _restart(monkeypatch)  # the new status was written back
+    assert jobs.get("running").status == jobs.INTERRUPTED
+
+
+def test_finished_job_outputs_survive_a_restart(job_dir, monkeypatch):
+    def run(ctx):
+        ctx.add_output(1, b"second", caption="Logo 2")
+        ctx.add_error("Logo 1 failed: filtered")
+        ctx.progress(2)
+
+    job_id = jobs.submit("logo", "Logos", run, total=2)
+    assert _wait(job_id).status == jobs.DONE
+
+    _restart(monkeypatch)
+
+    job = jobs.get(job_id)
+    assert job.status == jobs.DONE and job.done == 2 and job.errors == ["Logo 1 failed: filtered"]
+    assert [o["caption"] for o in job.outputs] == ["Logo 2"]
+    assert jobs.read_output(job_id, 1) == b"second"
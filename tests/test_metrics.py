@@ -0,0 +1,22 @@
+"""The metrics endpoint."""
+import socket
+
+from backend import metrics
+
+
+def test_busy_port_is_not_retried(monkeypatch):
+    monkeypatch.setattr(metrics, "_server", None)
+    monkeypatch.setattr(metrics, "server_error", None)
+    with socket.socket() as busy:
+        busy.bind(("127.0.0.1", 0))
+        busy.listen()
+        port = busy.getsockname()[1]
+
+        assert metrics.serve("127.0.0.1", port) is None
+        error = metrics.server_error
+        assert error and str(port) in error
+
+        binds = []
+        monkeypatch.setattr(metrics, "ThreadingHTTPServer", lambda *args: binds.append(args))
+        assert metrics.serve("127.0.0.1", port) is None
+        assert binds == [] and metrics.server_error == error
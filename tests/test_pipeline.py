@@ -0,0 +1,59 @@
+"""The prompt -> image pipeline behind Explore Directions."""
+import threading
+import time
+
+from backend import pipeline
+
+
+def test_failed_and_rejected_prompts_get_no_images():
+    prompts = {0: "a red shoe on a rock", 1: RuntimeError("gemini down"), 2: "  ", 3: "a shoe, text: SALE"}
+
+    def write_prompt(k):
+        if isinstance(prompts[k], Exception):
+            raise prompts[k]
+        return prompts[k]
+
+    rendered = []
+
+    def render(k, prompt, i):
+        rendered.append((k, i))
+        return f"image {k}/{i}", False
+
+    events = list(pipeline.run(write_prompt, render, directions=4, images_per_prompt=2,
+                               accept=lambda prompt: "text:" not in prompt))
+
+    by_direction = {k: sorted((e.kind, e.index) for e in events if e.direction == k) for k in range(4)}
+    assert by_direction[0] == [(pipeline.IMAGE, 0), (pipeline.IMAGE, 1), (pipeline.PROMPT, None)]
+    assert by_direction[1] == [(pipeline.PROMPT_FAILED, None)]
+    assert by_direction[2] == [(pipeline.REJECTED, None)]
+    assert by_direction[3] == [(pipeline.REJECTED, None)]
+    assert sorted(rendered) == [(0, 0), (0, 1)]
+    failed = next(e for e in events if e.kind == pipeline.PROMPT_FAILED)
+    assert str(failed.error) == "gemini down"
+    rejected = next(e for e in events if e.direction == 3)
+    assert rejected.prompt == "a shoe, text: SALE"
+
+
+def test_image_calls_are_capped_per_run():
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def render(k, prompt, i):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        if (k, i) == (1, 1):
+            raise RuntimeError("503")
+        return f"image {k}/{i}", False
+
+    events = list(pipeline.run(lambda k: f"prompt {k}", render, directions=3, images_per_prompt=3, max_image_calls=2))
+
+    assert peak[0] == 2
+    images = [e for e in events if e.kind == pipeline.IMAGE]
+    assert len(images) == 8 and all(e.result == (f"image {e.direction}/{e.index}", False) for e in images)
+    [failed] = [e for e in events if e.kind == pipeline.IMAGE_FAILED]
+    assert (failed.direction, failed.index, failed.prompt) == (1, 1, "prompt 1")
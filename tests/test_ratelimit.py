@@ -0,0 +1,60 @@
+"""Per-model token buckets."""
+import threading
+import time
+
+import pytest
+
+from backend import ratelimit
+
+
+def _drained(per_minute):
+    model_limiter = ratelimit.ModelLimiter("test-model", per_minute)
+    model_limiter._tokens = 0.0
+    return model_limiter
+
+
+def test_tokens_are_handed_out_in_arrival_order():
+    model_limiter = _drained(per_minute=600)  # a token every 0.1s
+    admitted = []
+    threads = []
+    for i in range(4):
+        thread = threading.Thread(target=lambda i=i: (model_limiter.acquire(), admitted.append(i)))
+        thread.start()
+        threads.append(thread)
+        # Start the next caller only once this one is in line (or already through).
+        deadline = time.monotonic() + 5
+        while model_limiter.stats()["queue_depth"] + len(admitted) < i + 1 and time.monotonic() < deadline:
+            time.sleep(0.005)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert admitted == [0, 1, 2, 3]
+    stats = model_limiter.stats()
+    assert stats["admitted"] == 4 and stats["queued"] >= 3 and stats["queue_depth"] == 0
+
+
+def test_wait_past_the_timeout_raises_queue_timeout():
+    model_limiter = _drained(per_minute=1)
+    positions = []
+
+    # The waiter wakes about once a second, so this is one queue report and then the timeout.
+    with pytest.raises(ratelimit.QueueTimeout):
+        model_limiter.acquire(on_wait=lambda model, position, waited: positions.append(position), timeout=1.2)
+
+    assert positions and set(positions) == {1}
+    stats = model_limiter.stats()
+    assert stats["timeouts"] == 1 and stats["admitted"] == 0 and stats["queue_depth"] == 0
+
+
+def test_quota_errors_are_retried(no_rate_limits, monkeypatch):
+    monkeypatch.setattr(ratelimit, "BACKOFF_BASE_SECONDS", 0)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        return "ok"
+
+    assert ratelimit.call("test-model", flaky) == "ok"
+    assert ratelimit.stats()["test-model"]["retries"] == 2
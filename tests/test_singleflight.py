@@ -0,0 +1,68 @@
+"""Coalescing of identical in-flight calls."""
+import threading
+import time
+
+import pytest
+
+from backend.singleflight import SingleFlight
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+
+def _overlapping_calls(flight, leader_fn, waiters):
+    """Runs ``leader_fn`` as the leader and ``waiters`` more calls for the same key while it is in flight."""
+    outcomes = {}
+
+    def run(name, fn):
+        try:
+            outcomes[name] = flight.do("key", fn)
+        except Exception as e:
+            outcomes[name] = e
+
+    leader = threading.Thread(target=run, args=("leader", leader_fn))
+    leader.start()
+    _wait_for(lambda: flight.stats()["in_flight"] == 1)
+    threads = [threading.Thread(target=run, args=(i, lambda: pytest.fail("a waiter made its own call")))
+               for i in range(waiters)]
+    for thread in threads:
+        thread.start()
+    _wait_for(lambda: flight.stats()["coalesced"] == waiters)
+    return leader, threads, outcomes
+
+
+def test_waiters_share_the_leaders_result():
+    flight = SingleFlight("test_result")
+    release = threading.Event()
+    leader, threads, outcomes = _overlapping_calls(flight, lambda: release.wait() and "image", waiters=3)
+
+    release.set()
+    for thread in [leader, *threads]:
+        thread.join(timeout=5)
+
+    assert outcomes == {"leader": ("image", False), 0: ("image", True), 1: ("image", True), 2: ("image", True)}
+    assert flight.stats() == {"calls": 4, "upstream": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_waiters_share_the_leaders_error():
+    flight = SingleFlight("test_error")
+    release = threading.Event()
+    error = RuntimeError("503 unavailable")
+
+    def failing():
+        release.wait()
+        raise error
+
+    leader, threads, outcomes = _overlapping_calls(flight, failing, waiters=2)
+    release.set()
+    for thread in [leader, *threads]:
+        thread.join(timeout=5)
+
+    assert outcomes == {"leader": error, 0: error, 1: error}
+    # The failed call is not remembered: the next one goes upstream again.
+    assert flight.do("key", lambda: "retried") == ("retried", False)
+    assert flight.stats()["upstream"] == 2
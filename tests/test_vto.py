@@ -0,0 +1,48 @@
+"""Matrix try-on runs against the fake prediction client."""
+from backend import vto
+from backend.fakes import FakePredictionClient, FakePredictResponse
+
+
+class DroppingPredictionClient(FakePredictionClient):
+    """Like a filtered output: packed calls lose their last prediction."""
+
+    def predict(self, endpoint, instances, parameters=None):
+        response = super().predict(endpoint, instances, parameters)
+        if len(instances) > 1:
+            return FakePredictResponse(response.predictions[:-1])
+        return response
+
+
+def _run(client, **options):
+    people, garments = [b"person-a", b"person-b"], [b"garment-a", b"garment-b", b"garment-c"]
+    return list(vto.run_matrix(client, "vto", people, garments, vto.build_parameters(), **options))
+
+
+def test_matrix_packs_pairs_into_calls(no_rate_limits):
+    client = FakePredictionClient()
+
+    results = _run(client, max_instances_per_request=4, max_concurrency=2)
+
+    assert sorted(pair for pair, _, _ in results) == [(p, g) for p in range(2) for g in range(3)]
+    assert all(error is None and len(predictions) == 1 for _, predictions, error in results)
+    assert client.calls == 2 and client.instances == 6
+
+
+def test_short_response_is_resent_per_pair(no_rate_limits, monkeypatch):
+    monkeypatch.setattr(vto, "matrix_counters", dict.fromkeys(vto.matrix_counters, 0))
+    client = DroppingPredictionClient()
+
+    results = _run(client, max_instances_per_request=3, max_concurrency=2)
+
+    assert sorted(pair for pair, _, _ in results) == [(p, g) for p in range(2) for g in range(3)]
+    assert all(error is None and len(predictions) == 1 for _, predictions, error in results)
+    assert client.calls == 2 + 6
+    assert vto.matrix_stats()["short_responses"] == 2 and vto.matrix_stats()["resent_pairs"] == 6
+
+
+def test_cancel_stops_sending(no_rate_limits):
+    client = FakePredictionClient()
+
+    results = _run(client, max_instances_per_request=1, max_concurrency=1, cancelled=lambda: client.calls >= 2)
+
+    assert client.calls == 2 and len(results) <= 2
@@ -0,0 +1,33 @@
+"""The warm-up entrypoint and the report Home shows."""
+import runpy
+import sys
+
+import pytest
+
+from backend import warmup
+
+
+def test_module_entrypoint_keeps_report_for_home(monkeypatch, capsys):
+    monkeypatch.setattr(warmup, "last_report", None)
+    monkeypatch.setattr(sys, "argv", ["warmup"])
+    monkeypatch.delenv("GOOGLE_CLOUD_PROJECT", raising=False)
+
+    with pytest.warns(RuntimeWarning), pytest.raises(SystemExit) as exit_info:  # already imported above
+        runpy.run_module("backend.warmup", run_name="__main__")
+
+    assert exit_info.value.code == 0
+    from backend import warmup as home_warmup  # what Home.py imports
+    assert home_warmup.last_report is not None
+    assert [step["step"] for step in home_warmup.last_report["steps"]] == ["import streamlit", "import SDKs", "import backend"]
+    assert '"steps"' in capsys.readouterr().out
+
+
+def test_prewarm_builds_pooled_clients(monkeypatch):
+    from backend import clients
+    monkeypatch.setattr(clients, "BACKEND", "fake")
+
+    report = warmup.prewarm(["test-project"], "us-central1")
+
+    assert not [step for step in report["steps"] if "error" in step]
+    families = {client["family"] for client in clients.pool_stats()["clients"] if client["project"] == "test-project"}
+    assert families == {"imagen", "gemini", "vto"}